@@ -27,6 +27,17 @@ contract NectarToken is ERC20Mintable, Ownable {
         emit TransfersEnabled();
     }
 
+    // Mint to many accounts in a single transaction, used to fund users during deployment
+    function mintBatch(address[] memory to, uint256[] memory values) public onlyMinter returns (bool) {
+        require(to.length == values.length, "Mismatched array lengths");
+
+        for (uint256 i = 0; i < to.length; i++) {
+            _mint(to[i], values[i]);
+        }
+
+        return true;
+    }
+
     function transfer(address to, uint256 value) public whenTransfersEnabled returns (bool) {
         return super.transfer(to, value);
     }
@@ -41,6 +41,15 @@ contract ArbiterRole is ArbiterManagerRole {
         emit AddedArbiter(account, blockNumber);
     }
 
+    function addArbiters(address[] memory accounts, uint256 blockNumber) public onlyArbiterManager {
+        for (uint256 i = 0; i < accounts.length; i++) {
+            _arbiters.add(accounts[i]);
+            emit AddedArbiter(accounts[i], blockNumber);
+        }
+
+        arbiterCount = arbiterCount.add(accounts.length);
+    }
+
     function removeArbiter(address account, uint256 blockNumber) public onlyArbiterManager {
         _arbiters.remove(account);
         arbiterCount = arbiterCount.sub(1);
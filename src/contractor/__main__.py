@@ -3,18 +3,23 @@ import logging
 import sys
 
 from contractor import db, steps
-from contractor.analyses import slither_analyze_directory, solium_analyze_directory
-from contractor.compiler import configure_compiler, compile_directory, DEFAULT_SOLC_VERSION
-from contractor.config import Config
+from contractor.analyses import analyze_directory, slither_analyze_directory, solium_analyze_directory
+from contractor.analyses.findings import load_baseline
+from contractor.analyses.pipeline import DEFAULT_ANALYSIS_CACHE_DIR, OUTPUT_FORMATS
+from contractor.compiler import configure_compiler, compile_directory, watch_directory, DEFAULT_CACHE_DIR, \
+    DEFAULT_SOLC_VERSION
+from contractor.config import CompilerConfig, Config, DEFAULT_COMPILE_PROFILE
 from contractor.consulclient import ConsulClient
 from contractor.deployer import Deployer
 from contractor.network import Chain
 from contractor.util import wait_for_file
-from contractor.watch import Token, Watch
+from contractor.watch import CATCH_UP_JOBS, CHECKPOINT_INTERVAL, Token, Watch
 
 import colorama
 import requests
 from IPython.terminal.interactiveshell import TerminalInteractiveShell
+from sqlalchemy import create_engine
+from tabulate import tabulate
 
 colorama.init()
 
@@ -44,9 +49,33 @@ def install_solc(ctx, solc_version):
               help='Directory to store the compiled json output for later deployment')
 @click.option('-e', '--external', type=click.Path(exists=True, file_okay=False), multiple=True, default=['external'],
               help='Directory containing any external libraries used')
+@click.option('--cache-dir', type=click.Path(file_okay=False), default=DEFAULT_CACHE_DIR,
+              help='Directory to cache compiler output in, unchanged sources are not recompiled')
+@click.option('--no-cache', is_flag=True,
+              help='Always compile, ignoring any cached compiler output')
+@click.option('-j', '--jobs', type=click.IntRange(min=0), default=1,
+              help='Number of solc processes to run in parallel, 0 for one per CPU')
+@click.option('-w', '--watch', is_flag=True,
+              help='Watch sources for changes and recompile affected contracts until interrupted')
+@click.option('--config', envvar='CONFIG', type=click.File('r'),
+              help='Path to yaml config file defining compile profiles')
+@click.option('-p', '--profile', default=DEFAULT_COMPILE_PROFILE,
+              help='Compile profile selecting compiler settings and outputs, e.g. deploy, verify or gas')
 @click.pass_context
-def compile(ctx, solc_version, srcdir, outdir, external):
-    is_dirty = compile_directory(solc_version, srcdir, outdir, external)
+def compile(ctx, solc_version, srcdir, outdir, external, cache_dir, no_cache, jobs, watch, config, profile):
+    try:
+        profile = CompilerConfig.from_yaml(config).profile(profile)
+    except ValueError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+    if watch:
+        watch_directory(solc_version, srcdir, outdir, external, cache_dir=None if no_cache else cache_dir, jobs=jobs,
+                        profile=profile)
+        return
+
+    is_dirty = compile_directory(solc_version, srcdir, outdir, external, cache_dir=None if no_cache else cache_dir,
+                                 jobs=jobs, profile=profile)
 
     # If there are no contract changes, exit with failure to signal to not attempt a redeploy
     if not is_dirty:
@@ -85,6 +114,37 @@ def solium(ctx, srcdir):
     sys.exit(rc)
 
 
+@analyze.command(name='all')
+@click.option('--solc-version', default=DEFAULT_SOLC_VERSION,
+              help='Version of solc to compile with')
+@click.option('-i', '--srcdir', type=click.Path(exists=True, file_okay=False), default='contracts',
+              help='Directory containing the solidity source to compile')
+@click.option('-e', '--external', type=click.Path(exists=True, file_okay=False), default='external',
+              help='Directory containing any external libraries used')
+@click.option('--excludes', default='',
+              help='Comma-separated list of slither detectors to exclude')
+@click.option('--cache-dir', type=click.Path(file_okay=False), default=DEFAULT_ANALYSIS_CACHE_DIR,
+              help='Directory to cache analysis results in, unchanged sources are not reanalyzed')
+@click.option('--no-cache', is_flag=True,
+              help='Always analyze, ignoring any cached results')
+@click.option('-j', '--jobs', type=click.IntRange(min=0), default=0,
+              help='Number of analyses to run in parallel, 0 for one per CPU')
+@click.option('-f', '--format', 'output_format', type=click.Choice(OUTPUT_FORMATS), default='text',
+              help='Format of the findings report')
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help='File to write the findings report to')
+@click.option('-b', '--baseline', type=click.File('r'),
+              help='JSON report of known findings, only findings not in the baseline fail the analysis')
+@click.pass_context
+def analyze_all(ctx, solc_version, srcdir, external, excludes, cache_dir, no_cache, jobs, output_format, output,
+                baseline):
+    excludes = [e for e in excludes.split(',') if e]
+    rc = analyze_directory(solc_version, srcdir, external, excludes, cache_dir=None if no_cache else cache_dir,
+                           jobs=jobs or None, output_format=output_format, output=output,
+                           baseline=load_baseline(baseline) if baseline is not None else None)
+    sys.exit(rc)
+
+
 def configure_network(config, network_name, keyfile, password, trezor, trezor_path, derivation_path):
     network = config.network_configs[network_name].create()
 
@@ -111,6 +171,38 @@ def configure_network(config, network_name, keyfile, password, trezor, trezor_pa
     return network
 
 
+def load_deployer(community, network, artifactdir, input, timeout, db_uri=None):
+    """Create a deployer for interacting with a previous deployment.
+
+    :param community: Community that was deployed
+    :param network: Network the community was deployed to
+    :param artifactdir: Directory containing the compiled artifacts
+    :param input: Results file to load the deployed addresses from, if not loading from a database
+    :param timeout: Time to wait for the results file to exist
+    :param db_uri: URI for the deployment database to load the latest deployment from, or None to use input
+    :return: Deployer with the deployed contracts loaded
+    """
+    if db_uri is not None:
+        deployer = Deployer(community, network, artifactdir, session=db.connect(db_uri), record_deployment=False)
+        if not deployer.load_from_db():
+            click.echo('No successful deployment of {0} to {1} recorded in database'.format(community, network.name))
+            sys.exit(1)
+
+        return deployer
+
+    deployer = Deployer(community, network, artifactdir)
+
+    click.echo('Waiting for deployment results')
+    if not wait_for_file(input, timeout):
+        click.echo('Timeout waiting for deployment results file')
+        sys.exit(1)
+
+    with open(input, 'r') as f:
+        deployer.load_results(f)
+
+    return deployer
+
+
 @cli.command()
 @click.option('--config', envvar='CONFIG', type=click.File('r'), required=True,
               help='Path to yaml config file defining networks and users')
@@ -190,9 +282,11 @@ def deploy(ctx, config, community, network, keyfile, password, trezor, trezor_pa
               help='Input file containing the deployed addresses of our artifacts')
 @click.option('-t', '--timeout', type=int, default=60,
               help='Time to wait for input file to exist')
+@click.option('--db-uri', envvar='DB_URI',
+              help='URI for the deployment database, load the latest deployment from it instead of the input file')
 @click.pass_context
 def repl(ctx, config, community, network, keyfile, password, trezor, trezor_path, derivation_path, chain, artifactdir,
-         input, timeout):
+         input, timeout, db_uri):
     config = Config.from_yaml(config, Chain.from_str(chain))
 
     if network not in config.network_configs:
@@ -200,19 +294,12 @@ def repl(ctx, config, community, network, keyfile, password, trezor, trezor_path
         sys.exit(1)
 
     network = configure_network(config, network, keyfile, password, trezor, trezor_path, derivation_path)
-    deployer = Deployer(community, network, artifactdir)
 
     # Default to homechain.json/sidechain.json
     if not input:
         input = chain + 'chain.json'
 
-    click.echo('Waiting for deployment results')
-    if not wait_for_file(input, timeout):
-        click.echo('Timeout waiting for deployment results file')
-        sys.exit(1)
-
-    with open(input, 'r') as f:
-        deployer.load_results(f)
+    deployer = load_deployer(community, network, artifactdir, input, timeout, db_uri)
 
     user_ns = {
         'config': config,
@@ -238,17 +325,37 @@ def repl(ctx, config, community, network, keyfile, password, trezor, trezor_path
               help='Verbosity level')
 @click.option('--cumulative', is_flag=True,
               help='Cumulatively track balance change and function call counts')
+@click.option('--bloom-filter/--no-bloom-filter', default=None,
+              help='Skip blocks whose logs bloom shows no events from our contracts, on by default for nectar. '
+                   'Reverted calls and calls which emit no events in skipped blocks are not counted')
+@click.option('--from-block', type=click.IntRange(min=0),
+              help='Process past blocks starting from this block before following new blocks')
+@click.option('--to-block', type=click.IntRange(min=0),
+              help='Stop after processing this block, requires --from-block')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=CATCH_UP_JOBS,
+              help='Number of chunks of past blocks to fetch in parallel')
 @click.option('-a', '--artifactdir', type=click.Path(exists=True, file_okay=False), default='build',
               help='Directory containing the compiled artifacts to deploy')
 @click.option('-i', '--input', type=click.Path(dir_okay=False), required=False,
               help='Input file containing the deployed addresses of our artifacts')
 @click.option('-t', '--timeout', type=int, default=60,
               help='Time to wait for input file to exist')
+@click.option('--db-uri', envvar='DB_URI',
+              help='URI for the deployment database, load the latest deployment from it instead of the input file')
+@click.option('-s', '--state-file', type=click.Path(dir_okay=False), required=False,
+              help='File to checkpoint watcher state to, so a restarted watcher resumes where it left off')
+@click.option('--checkpoint-interval', type=click.IntRange(min=0), default=CHECKPOINT_INTERVAL,
+              help='Minimum number of seconds between checkpoints of watcher state')
 @click.pass_context
-def watch(ctx, config, community, network, chain, token, verbose, cumulative, artifactdir, input, timeout):
+def watch(ctx, config, community, network, chain, token, verbose, cumulative, bloom_filter, from_block, to_block, jobs,
+          artifactdir, input, timeout, db_uri, state_file, checkpoint_interval):
     config = Config.from_yaml(config, Chain.from_str(chain))
     token = Token.from_str(token)
 
+    if to_block is not None and (from_block is None or to_block < from_block):
+        click.echo('--to-block requires a --from-block no later than it')
+        sys.exit(1)
+
     if network not in config.network_configs:
         click.echo('No such network {0} defined, check configuration', network)
         sys.exit(1)
@@ -260,25 +367,18 @@ def watch(ctx, config, community, network, chain, token, verbose, cumulative, ar
         click.echo('Could not connect to Ethereum client, exiting')
         sys.exit(1)
 
-    deployer = Deployer(community, network, artifactdir)
-
     # Default to homechain.json/sidechain.json
     if not input:
         input = chain + 'chain.json'
 
-    click.echo('Waiting for deployment results')
-    if not wait_for_file(input, timeout):
-        click.echo('Timeout waiting for deployment results file')
-        sys.exit(1)
-
-    with open(input, 'r') as f:
-        deployer.load_results(f)
+    deployer = load_deployer(community, network, artifactdir, input, timeout, db_uri)
 
     click.echo('Watching for events on chain {}'.format(chain))
-    watcher = Watch(config, token, cumulative, verbose)
+    watcher = Watch(config, token, cumulative, verbose, bloom_filter=bloom_filter, checkpoint_file=state_file,
+                    checkpoint_interval=checkpoint_interval)
 
     try:
-        watcher.watch(network, deployer)
+        watcher.watch(network, deployer, from_block=from_block, to_block=to_block, jobs=jobs)
     except requests.exceptions.RequestException:
         click.echo('Connection to Ethereum client lost, exiting')
         sys.exit(0)
@@ -307,6 +407,28 @@ def pull(ctx, consul_uri, consul_token, community, wait, outdir):
     c.pull_config(community, outdir, wait=wait)
 
 
+@consul.command()
+@click.option('-u', '--consul-uri', envvar='CONSUL_URI', required=True,
+              help='URI for consul')
+@click.option('-t', '--consul-token', envvar='CONSUL_TOKEN', default='',
+              help='Token for consul access')
+@click.option('-c', '--community', envvar='COMMUNITY', required=True,
+              help='Community to access')
+@click.option('-o', '--outdir', type=click.Path(file_okay=False), default='consul',
+              help='Directory to store the pulled consul keys to')
+@click.option('-f', '--follow', is_flag=True,
+              help='Keep applying changes as they are made until interrupted')
+@click.option('--hook',
+              help='Shell command to run after changes are applied, changed files are in $CONTRACTOR_CHANGED_FILES')
+@click.pass_context
+def sync(ctx, consul_uri, consul_token, community, outdir, follow, hook):
+    c = ConsulClient(consul_uri, consul_token)
+    try:
+        c.sync_config(community, outdir, follow=follow, hook=hook)
+    except KeyboardInterrupt:
+        pass
+
+
 @consul.command()
 @click.option('-u', '--consul-uri', envvar='CONSUL_URI', required=True,
               help='URI for consul')
@@ -319,7 +441,80 @@ def pull(ctx, consul_uri, consul_token, community, wait, outdir):
 @click.pass_context
 def push(ctx, consul_uri, consul_token, community, indir):
     c = ConsulClient(consul_uri, consul_token)
-    c.push_config(community, indir)
+    if not c.push_config(community, indir):
+        click.echo('Consul keys were modified during push, pull the latest configuration and retry')
+        sys.exit(1)
+
+
+@cli.group(name='db')
+@click.pass_context
+def database(ctx):
+    pass
+
+
+@database.command()
+@click.option('--db-uri', envvar='DB_URI', required=True,
+              help='URI for the deployment database')
+@click.pass_context
+def migrate(ctx, db_uri):
+    applied = db.migrate(create_engine(db_uri))
+    click.echo('Applied {0} migrations, database is at schema version {1}'.format(applied, len(db.MIGRATIONS)))
+
+
+@database.command()
+@click.option('--db-uri', envvar='DB_URI', required=True,
+              help='URI for the deployment database')
+@click.option('--community', envvar='COMMUNITY', required=True,
+              help='What community to list deployments for')
+@click.option('--network',
+              help='Only list deployments to this network')
+@click.option('--chain', type=click.Choice(('home', 'side')),
+              help='Only list deployments on the homechain or sidechain')
+@click.option('--succeeded/--failed', default=None,
+              help='Only list deployments which succeeded or failed')
+@click.option('--since', type=click.DateTime(),
+              help='Only list deployments at or after this UTC time')
+@click.option('--until', type=click.DateTime(),
+              help='Only list deployments before this UTC time')
+@click.option('-p', '--page', type=click.IntRange(min=1), default=1,
+              help='Page of results to show, newest first')
+@click.option('-n', '--page-size', type=click.IntRange(min=1), default=20,
+              help='Number of results per page')
+@click.pass_context
+def deployments(ctx, db_uri, community, network, chain, succeeded, since, until, page, page_size):
+    session = db.connect(db_uri)
+    results = db.deployments_between(session, community, start=since, end=until, network=network,
+                                     chain=Chain.from_str(chain) if chain else None, succeeded=succeeded,
+                                     limit=page_size, offset=(page - 1) * page_size)
+
+    rows = [[d.id, d.timestamp, d.network, d.chain.name.lower(), d.commit_hash, 'success' if d.succeeded else 'failed']
+            for d in results]
+    click.echo(tabulate(rows, headers=['ID', 'Timestamp', 'Network', 'Chain', 'Commit', 'Status']))
+
+
+@database.command()
+@click.option('--db-uri', envvar='DB_URI', required=True,
+              help='URI for the deployment database')
+@click.option('--community', envvar='COMMUNITY', required=True,
+              help='What community to list contracts for')
+@click.option('--network', required=True,
+              help='What network the contract was deployed to')
+@click.option('--chain', type=click.Choice(('home', 'side')), required=True,
+              help='Is this contract on the homechain or sidechain?')
+@click.option('-p', '--page', type=click.IntRange(min=1), default=1,
+              help='Page of results to show, newest first')
+@click.option('-n', '--page-size', type=click.IntRange(min=1), default=20,
+              help='Number of results per page')
+@click.argument('name')
+@click.pass_context
+def contracts(ctx, db_uri, community, network, chain, page, page_size, name):
+    session = db.connect(db_uri)
+    results = db.contract_history(session, community, network, Chain.from_str(chain), name, limit=page_size,
+                                  offset=(page - 1) * page_size)
+
+    rows = [[c.deployment_id, c.deployment.timestamp, c.address, (c.bytecode_hash or '')[:16],
+             'deployed' if c.deployed else 'preexisting'] for c in results]
+    click.echo(tabulate(rows, headers=['Deployment', 'Timestamp', 'Address', 'Bytecode', 'Status']))
 
 
 @cli.group()
@@ -353,10 +548,15 @@ def deactivate(ctx):
               help='Input file containing the deployed addresses of our artifacts')
 @click.option('-t', '--timeout', type=int, default=60,
               help='Time to wait for input file to exist')
+@click.option('--db-uri', envvar='DB_URI',
+              help='URI for the deployment database, load the latest deployment from it instead of the input file')
+@click.option('-s', '--state-file', type=click.Path(dir_okay=False), required=False,
+              help='File to persist deactivation deadlines to, so an interrupted deactivation can resume, defaults to '
+                   'homechain_deactivation.json or sidechain_deactivation.json')
 @click.argument('contract')
 @click.pass_context
 def contract(ctx, config, community, network, chain, keyfile, password, trezor, trezor_path, derivation_path,
-              artifactdir, input, timeout, contract):
+             artifactdir, input, timeout, db_uri, state_file, contract):
     config = Config.from_yaml(config, Chain.from_str(chain))
 
     if network not in config.network_configs:
@@ -365,20 +565,17 @@ def contract(ctx, config, community, network, chain, keyfile, password, trezor,
 
     network = configure_network(config, network, keyfile, password, trezor, trezor_path, derivation_path)
 
-    deployer = Deployer(community, network, artifactdir)
-
     # Default to homechain.json/sidechain.json
-    input_file = input or (chain + 'chain.json')
+    if not input:
+        input = chain + 'chain.json'
 
-    click.echo('Waiting for deployment results')
-    if not wait_for_file(input_file, timeout):
-        click.echo('Timeout waiting for deployment results file')
-        sys.exit(1)
+    deployer = load_deployer(community, network, artifactdir, input, timeout, db_uri)
 
-    with open(input, 'r') as f:
-        deployer.load_results(f)
+    # Default to homechain_deactivation.json/sidechain_deactivation.json
+    if not state_file:
+        state_file = chain + 'chain_deactivation.json'
 
-    steps.run(network, deployer, to_deploy=contract, deactivate=True)
+    steps.run(network, deployer, to_deploy=contract, deactivate=True, state_file=state_file)
 
 
 @deactivate.command()
@@ -404,9 +601,14 @@ def contract(ctx, config, community, network, chain, keyfile, password, trezor,
               help='Input file containing the deployed addresses of our artifacts')
 @click.option('-t', '--timeout', type=int, default=60,
               help='Time to wait for input file to exist')
+@click.option('--db-uri', envvar='DB_URI',
+              help='URI for the deployment database, load the latest deployment from it instead of the input file')
+@click.option('-s', '--state-file', type=click.Path(dir_okay=False), required=False,
+              help='File to persist deactivation deadlines to, so an interrupted deactivation can resume, defaults to '
+                   'sidechain_deactivation.json')
 @click.pass_context
 def community(ctx, config, community, network, keyfile, password, trezor, trezor_path, derivation_path,
-              artifactdir, input, timeout):
+              artifactdir, input, timeout, db_uri, state_file):
     config = Config.from_yaml(config, Chain.SIDECHAIN)
 
     if network not in config.network_configs:
@@ -415,21 +617,16 @@ def community(ctx, config, community, network, keyfile, password, trezor, trezor
 
     network = configure_network(config, network, keyfile, password, trezor, trezor_path, derivation_path)
 
-    deployer = Deployer(community, network, artifactdir)
-
     # Default to homechain.json/sidechain.json
     if not input:
         input = 'sidechain.json'
 
-    click.echo('Waiting for deployment results')
-    if not wait_for_file(input, timeout):
-        click.echo('Timeout waiting for deployment results file')
-        sys.exit(1)
+    deployer = load_deployer(community, network, artifactdir, input, timeout, db_uri)
 
-    with open(input, 'r') as f:
-        deployer.load_results(f)
+    if not state_file:
+        state_file = 'sidechain_deactivation.json'
 
-    steps.run(network, deployer, deactivate=True)
+    steps.run(network, deployer, deactivate=True, state_file=state_file)
 
 
 if __name__ == '__main__':
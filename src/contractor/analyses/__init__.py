@@ -1,2 +1,3 @@
 from .slither import slither_analyze_directory
 from .solium import solium_analyze_directory
+from .pipeline import analyze_directory
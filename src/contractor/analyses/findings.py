@@ -0,0 +1,293 @@
+import hashlib
+import json
+import re
+
+# Bump when the findings model changes, so cached results in the old format are not reused
+FINDINGS_FORMAT_VERSION = 2
+
+SEVERITIES = ('high', 'medium', 'low', 'informational')
+SLITHER_SEVERITIES = {
+    'High': 'high',
+    'Medium': 'medium',
+    'Low': 'low',
+    'Informational': 'informational',
+    'Optimization': 'informational',
+}
+SOLIUM_SEVERITIES = {
+    'error': 'medium',
+    'warning': 'low',
+}
+SARIF_LEVELS = {
+    'high': 'error',
+    'medium': 'error',
+    'low': 'warning',
+    'informational': 'note',
+}
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+
+# Line references in messages shift with unrelated edits, so are left out of fingerprints
+LINE_REFERENCE_PATTERN = re.compile(r'#\d+(?:-\d+)?')
+SLITHER_FAILURE_PATTERN = re.compile(r'"success"\s*:\s*false')
+SOLIUM_GCC_PATTERN = re.compile(r'^(?P<path>.+?):(?P<line>\d+):(?P<column>\d+): (?P<type>\w+): (?P<message>.*?)'
+                                r'(?: \[(?P<rule>[\w/-]+)\])?$')
+
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+class Finding(object):
+    """A single issue reported by an analysis tool, normalized across tools.
+    """
+
+    def __init__(self, tool, rule, severity, message, path=None, line=None, column=None, snippet=None, occurrence=0):
+        """Create a new finding.
+
+        :param tool: Name of the tool which reported the finding
+        :param rule: Tool specific name of the check which failed
+        :param severity: Normalized severity, one of SEVERITIES
+        :param message: Description of the finding
+        :param path: Path of the source the finding is in, if known
+        :param line: Line number the finding starts on, if known
+        :param column: Column number the finding starts on, if known
+        :param snippet: Normalized text of the flagged source line, if known
+        :param occurrence: Index of this finding among others with the same snippet, set by assign_occurrences
+        """
+        self.tool = tool
+        self.rule = rule
+        self.severity = severity
+        self.message = message
+        self.path = path
+        self.line = line
+        self.column = column
+        self.snippet = snippet
+        self.occurrence = occurrence
+
+    @property
+    def fingerprint(self):
+        """Stable identifier for this finding, which does not change when unrelated code moves it to another line.
+
+        Repeats of a check in one file are told apart by the source line flagged and their order of occurrence.
+
+        :return: Hex digest identifying the finding
+        """
+        key = [self.tool, self.rule, self.path, LINE_REFERENCE_PATTERN.sub('', ' '.join(self.message.split())),
+               self.snippet, self.occurrence]
+        return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_dict(cls, d):
+        """Create a finding from a dictionary.
+
+        :param d: Dictionary containing the finding
+        :return: New finding from provided dictionary
+        """
+        return cls(d['tool'], d['rule'], d['severity'], d['message'], d.get('path'), d.get('line'), d.get('column'),
+                   d.get('snippet'), d.get('occurrence', 0))
+
+    def to_dict(self):
+        """Convert this finding to a dictionary.
+
+        :return: Dictionary containing the finding
+        """
+        return {
+            'tool': self.tool,
+            'rule': self.rule,
+            'severity': self.severity,
+            'message': self.message,
+            'path': self.path,
+            'line': self.line,
+            'column': self.column,
+            'snippet': self.snippet,
+            'occurrence': self.occurrence,
+            'fingerprint': self.fingerprint,
+        }
+
+    def __repr__(self):
+        return '<Finding {0}/{1}, {2}:{3}>'.format(self.tool, self.rule, self.path, self.line)
+
+
+def assign_occurrences(findings, source_line):
+    """Make the fingerprints of repeated findings distinct, by the source line flagged and their order in the file.
+
+    :param findings: List of findings to update
+    :param source_line: Function taking a path and line number, returning the text of that line or None if unknown
+    :return: None
+    """
+    counts = {}
+    for finding in sorted(findings, key=lambda f: (f.path or '', f.line or 0, f.column or 0)):
+        text = source_line(finding.path, finding.line) if finding.path is not None and finding.line else None
+        finding.snippet = ' '.join(text.split()) if text is not None else None
+        finding.occurrence = 0
+
+        key = finding.fingerprint
+        finding.occurrence = counts.get(key, 0)
+        counts[key] = finding.occurrence + 1
+
+
+def iter_json_array(f, chunk_size=JSON_CHUNK_SIZE):
+    """Decode the elements of the first JSON array in a file one at a time, without reading the whole file at once.
+
+    :param f: File object containing JSON
+    :param chunk_size: Number of characters to read at a time
+    :return: Generator of decoded elements
+    """
+    decoder = json.JSONDecoder()
+
+    buf = ''
+    while '[' not in buf:
+        buf = f.read(chunk_size)
+        if not buf:
+            return
+
+    buf = buf[buf.index('[') + 1:]
+    while True:
+        buf = buf.lstrip().lstrip(',').lstrip()
+        if buf.startswith(']'):
+            return
+
+        # Elements may span chunks, read more until a complete element can be decoded
+        try:
+            element, end = decoder.raw_decode(buf)
+        except ValueError:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError('Truncated JSON array')
+            buf += chunk
+            continue
+
+        yield element
+        buf = buf[end:]
+
+
+def parse_slither_json(f):
+    """Parse findings from slither's JSON output, as a stream.
+
+    Supports both the bare list of detector results written by older versions of slither and the results object
+    written by newer versions.
+
+    :param f: Seekable file object containing slither's JSON output
+    :return: Generator of findings
+    """
+    # Newer versions report success before any results
+    head = f.read(JSON_CHUNK_SIZE)
+    if not head.strip():
+        raise ValueError('slither produced no output')
+    if SLITHER_FAILURE_PATTERN.search(head):
+        raise ValueError('slither reported failure')
+
+    f.seek(0)
+    for result in iter_json_array(f):
+        path = line = None
+        for element in result.get('elements', []):
+            source_mapping = element.get('source_mapping') or {}
+            path = source_mapping.get('filename_relative') or source_mapping.get('filename')
+            line = next(iter(source_mapping.get('lines') or []), None)
+            if path is not None:
+                break
+
+        yield Finding('slither', result.get('check', 'unknown'),
+                      SLITHER_SEVERITIES.get(result.get('impact'), 'informational'),
+                      result.get('description', '').strip(), path, line)
+
+
+def parse_solium_gcc(line):
+    """Parse a finding from a line of solium's gcc reporter output.
+
+    :param line: Line of output
+    :return: Finding, or None if the line is not a finding
+    """
+    match = SOLIUM_GCC_PATTERN.match(line.rstrip('\n'))
+    if match is None:
+        return None
+
+    return Finding('solium', match.group('rule') or 'solium', SOLIUM_SEVERITIES.get(match.group('type'), 'low'),
+                   match.group('message'), match.group('path'), int(match.group('line')), int(match.group('column')))
+
+
+def load_baseline(f):
+    """Load the fingerprints of known findings from a baseline, a JSON report from a previous analysis.
+
+    :param f: File object containing the baseline
+    :return: Set of fingerprints
+    """
+    return {finding['fingerprint'] for finding in json.load(f).get('findings', [])}
+
+
+def write_json_report(f, findings, baseline=None):
+    """Write findings as a JSON report, which can later be used as a baseline.
+
+    :param f: File object to write to
+    :param findings: List of findings
+    :param baseline: Set of fingerprints of known findings, or None
+    :return: None
+    """
+    report = []
+    for finding in findings:
+        d = finding.to_dict()
+        d['new'] = baseline is None or finding.fingerprint not in baseline
+        report.append(d)
+
+    json.dump({'findings': report}, f, indent=2, sort_keys=True)
+    f.write('\n')
+
+
+def write_sarif_report(f, findings, versions, baseline=None):
+    """Write findings as a `SARIF <https://sarifweb.azurewebsites.net/>`_ log, with one run per tool.
+
+    :param f: File object to write to
+    :param findings: List of findings
+    :param versions: Dictionary of tool names to versions
+    :param baseline: Set of fingerprints of known findings, or None
+    :return: None
+    """
+    runs = []
+    for tool in sorted(versions):
+        results = []
+        rules = set()
+        for finding in (finding for finding in findings if finding.tool == tool):
+            rules.add(finding.rule)
+
+            result = {
+                'ruleId': finding.rule,
+                'level': SARIF_LEVELS[finding.severity],
+                'message': {'text': finding.message},
+                'partialFingerprints': {'contractor/v1': finding.fingerprint},
+            }
+            if baseline is not None:
+                result['baselineState'] = 'unchanged' if finding.fingerprint in baseline else 'new'
+            if finding.path is not None:
+                region = {k: v for k, v in (('startLine', finding.line), ('startColumn', finding.column)) if v}
+                location = {'artifactLocation': {'uri': finding.path}}
+                if region:
+                    location['region'] = region
+                result['locations'] = [{'physicalLocation': location}]
+
+            results.append(result)
+
+        runs.append({
+            'tool': {
+                'driver': {
+                    'name': tool,
+                    'version': versions[tool],
+                    'rules': [{'id': rule} for rule in sorted(rules)],
+                }
+            },
+            'results': results,
+        })
+
+    json.dump({'$schema': SARIF_SCHEMA, 'version': '2.1.0', 'runs': runs}, f, indent=2)
+    f.write('\n')
+
+
+def write_text_report(f, findings, baseline=None):
+    """Write findings in a human readable form.
+
+    :param f: File object to write to
+    :param findings: List of findings
+    :param baseline: Set of fingerprints of known findings, or None
+    :return: None
+    """
+    for finding in findings:
+        location = ':'.join(str(part) for part in (finding.path, finding.line, finding.column) if part is not None)
+        suffix = ' (baseline)' if baseline is not None and finding.fingerprint in baseline else ''
+        f.write('{0}: {1}: [{2}/{3}] {4}{5}\n'.format(location or '<unknown>', finding.severity, finding.tool,
+                                                      finding.rule, finding.message, suffix))
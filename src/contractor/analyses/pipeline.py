@@ -0,0 +1,274 @@
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from contractor.analyses.findings import assign_occurrences, FINDINGS_FORMAT_VERSION, Finding, parse_slither_json, \
+    parse_solium_gcc, write_json_report, write_sarif_report, write_text_report
+from contractor.analyses.slither import slither_command
+from contractor.compiler import configure_compiler, DEFAULT_CACHE_DIR, ImportGraph
+from contractor.util import atomic_write
+
+DEFAULT_ANALYSIS_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, 'analyses')
+# Files in the working directory which configure solium, and so affect its results
+SOLIUM_CONFIG_FILES = ('.soliumrc.json', '.soliumignore')
+OUTPUT_FORMATS = ('text', 'json', 'sarif')
+
+logger = logging.getLogger(__name__)
+
+
+def __tool_version(cmd):
+    """Determine the version of an analysis tool.
+
+    :param cmd: Command used to run the tool
+    :return: Version reported by the tool, or None if it is not installed
+    """
+    try:
+        p = subprocess.run([cmd[0], '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except FileNotFoundError:
+        return None
+
+    return p.stdout.decode('utf-8', errors='replace').strip()
+
+
+def __file_digest(path):
+    """Hash the content of a file.
+
+    :param path: Path of the file to hash
+    :return: Hex digest of the file, or None if it does not exist
+    """
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def __cache_key(tool, version, cmd, unit, graph, configs=()):
+    """Compute a cache key for the results of analyzing a source with a tool.
+
+    Keys cover the tool's version and arguments, any configuration files it reads and the content of the source along
+    with everything it transitively imports.
+
+    :param tool: Name of the tool
+    :param version: Version of the tool
+    :param cmd: Command used to run the tool, without the target
+    :param unit: Source unit name to analyze
+    :param graph: ImportGraph of the sources being analyzed
+    :param configs: Paths of configuration files read by the tool
+    :return: Cache key
+    """
+    key = {
+        'format': FINDINGS_FORMAT_VERSION,
+        'tool': tool,
+        'version': version,
+        'cmd': cmd,
+        'configs': {path: __file_digest(path) for path in configs},
+        'sources': {k: graph.digest(k) for k in graph.closure(unit)},
+        'unit': unit,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def __load_cached_result(cache_dir, key):
+    """Load cached results of an analysis.
+
+    :param cache_dir: Directory containing cached results
+    :param key: Cache key of the analysis
+    :return: Dictionary containing the findings and any error reported by the tool, or None if not cached
+    """
+    try:
+        with open(os.path.join(cache_dir, key + '.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def __store_cached_result(cache_dir, key, result):
+    """Store results of an analysis in the cache.
+
+    :param cache_dir: Directory containing cached results
+    :param key: Cache key of the analysis
+    :param result: Dictionary containing the findings and any error reported by the tool
+    :return: None
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    atomic_write(os.path.join(cache_dir, key + '.json'), json.dumps(result))
+
+
+def __run_slither(cmd, target):
+    """Run slither on a source, parsing findings from its JSON output.
+
+    :param cmd: Command used to run slither, without the target
+    :param target: Path of the source to analyze
+    :return: Dictionary containing the findings and any error reported by the tool
+    """
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        json_path = os.path.join(tmp_dir, 'slither.json')
+        p = subprocess.run(cmd + ['--json', json_path, target], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+        try:
+            with open(json_path, 'r') as f:
+                return {'findings': [finding.to_dict() for finding in parse_slither_json(f)], 'error': None}
+        except (OSError, ValueError):
+            return {'findings': [], 'error': p.stdout.decode('utf-8', errors='replace')}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def __run_solium(cmd, target):
+    """Run solium on a source, parsing findings from its gcc reporter output as it is written.
+
+    :param cmd: Command used to run solium, without the target
+    :param target: Path of the source to analyze
+    :return: Dictionary containing the findings and any error reported by the tool
+    """
+    p = subprocess.Popen(cmd + ['--reporter', 'gcc', '-f', target], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                         universal_newlines=True)
+
+    findings = []
+    other = []
+    for line in p.stdout:
+        finding = parse_solium_gcc(line)
+        if finding is not None:
+            findings.append(finding.to_dict())
+        elif line.strip():
+            other.append(line)
+
+    # solium exits with failure when it reports errors, only treat it as failing if it reported nothing else
+    error = ''.join(other) if p.wait() != 0 and not findings else None
+    return {'findings': findings, 'error': error}
+
+
+def __source_line(sources, src_dir, path, line):
+    """Look up a line of an analyzed source.
+
+    :param sources: Dictionary of source paths relative to the source directory to their content
+    :param src_dir: Directory containing contract Solidity source
+    :param path: Path of the source as reported by a tool, relative to the source directory or working directory
+    :param line: Line number to look up
+    :return: Text of the line, or None if unknown
+    """
+    for candidate in (path, os.path.relpath(path, src_dir)):
+        content = sources.get(candidate.replace(os.sep, posixpath.sep))
+        if content is not None:
+            lines = content.splitlines()
+            return lines[line - 1] if 0 < line <= len(lines) else None
+
+    return None
+
+
+def analyze_directory(solc_version, src_dir, ext_dir=None, excludes=None, cache_dir=None, jobs=None,
+                      output_format='text', output=None, baseline=None):
+    """Analyze contract source code with all supported tools concurrently, merging their findings into one report.
+
+    Each source is analyzed separately by each tool, and results are cached by tool version and the content of the
+    source and its imports, so only changed sources are reanalyzed. Findings are normalized across tools and
+    identified by a stable fingerprint, so findings already in a baseline can be ignored.
+
+    :param solc_version: Version of Solidity compiler to use
+    :param src_dir: Directory containing contract Solidity source
+    :param ext_dir: Directory containing external dependencies
+    :param excludes: Exclude these categories of slither reports
+    :param cache_dir: Directory to cache results in, or None to always analyze
+    :param jobs: Maximum number of analyses to run at once, or None for one per CPU
+    :param output_format: Format of the report, one of OUTPUT_FORMATS
+    :param output: File object to write the report to, or None for stdout
+    :param baseline: Set of fingerprints of known findings which do not cause a failure, or None
+    :return: 0 on success, non-zero if any tool failed or there are new findings
+    """
+    if output is None:
+        output = sys.stdout
+
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+
+    sources = {}
+    for root, dirs, files in os.walk(src_dir):
+        for file in files:
+            if os.path.splitext(file)[-1] != '.sol':
+                continue
+
+            path = os.path.join(root, file)
+            with open(path, 'r') as f:
+                sources[os.path.relpath(path, src_dir).replace(os.sep, posixpath.sep)] = f.read()
+
+    remappings = []
+    if ext_dir:
+        for ext in os.listdir(ext_dir):
+            remappings.append(ext + '=' + os.path.join(ext_dir, ext))
+
+    graph = ImportGraph(sources, remappings)
+
+    tools = {
+        'slither': (slither_command(configure_compiler(solc_version), ext_dir, excludes), __run_slither, ()),
+        'solium': (['solium'], __run_solium, SOLIUM_CONFIG_FILES),
+    }
+
+    rc = 0
+    versions = {}
+    results = {}
+    pending = {}
+    for tool, (cmd, runner, configs) in sorted(tools.items()):
+        version = __tool_version(cmd)
+        if version is None:
+            click.echo('{0} executable not found, is it installed and in PATH?'.format(tool), err=True)
+            rc = 1
+            continue
+
+        versions[tool] = version
+        for unit in sorted(sources):
+            key = __cache_key(tool, version, cmd, unit, graph, configs)
+            cached = __load_cached_result(cache_dir, key) if cache_dir is not None else None
+            if cached is not None:
+                results[(unit, tool)] = cached
+            else:
+                pending[(unit, tool)] = (key, runner, cmd, os.path.join(src_dir, unit))
+
+    logger.info('Running %s analyses, %s results cached', len(pending), len(results))
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as executor:
+        futures = {k: executor.submit(runner, cmd, target) for k, (key, runner, cmd, target) in pending.items()}
+        for k, future in futures.items():
+            results[k] = future.result()
+            if cache_dir is not None:
+                __store_cached_result(cache_dir, pending[k][0], results[k])
+
+    # Sources are analyzed along with their imports, so the same finding may be reported more than once
+    findings = {}
+    for unit, tool in sorted(results):
+        result = results[(unit, tool)]
+        if result['error'] is not None:
+            click.echo('{0} failed to analyze {1}:\n{2}'.format(tool, unit, result['error'].rstrip()), err=True)
+            rc = 1
+
+        for d in result['findings']:
+            finding = Finding.from_dict(d)
+            findings.setdefault((finding.fingerprint, finding.line, finding.column), finding)
+
+    findings = list(findings.values())
+    assign_occurrences(findings, lambda path, line: __source_line(sources, src_dir, path, line))
+    findings.sort(key=lambda f: (f.path or '', f.line or 0, f.tool, f.rule, f.message))
+    new = [finding for finding in findings if baseline is None or finding.fingerprint not in baseline]
+    logger.info('%s findings, %s new', len(findings), len(new))
+
+    if output_format == 'json':
+        write_json_report(output, findings, baseline)
+    elif output_format == 'sarif':
+        write_sarif_report(output, findings, versions, baseline)
+    else:
+        write_text_report(output, findings, baseline)
+
+    if new:
+        rc = 1
+
+    return rc
@@ -6,19 +6,17 @@ from contractor.compiler import configure_compiler
 from contractor.util import call_with_output
 
 
-def slither_analyze_directory(solc_version, src_dir, ext_dir=None, excludes=None):
-    """Analyze contract source code using `Slither <https://github.com/crytic/slither>`_.
+def slither_command(solc_path, ext_dir=None, excludes=None):
+    """Build the command to run `Slither <https://github.com/crytic/slither>`_, without the target to analyze.
 
-    :param solc_version: Version of Solidity compiler to use
-    :param src_dir: Directory containing contract Solidity source
+    :param solc_path: Path to the Solidity compiler to use
     :param ext_dir: Directory containing external dependencies
     :param excludes: Exclude these categories of reports
-    :return: 0 on success non-zero on failure
+    :return: Command to run, as a list of arguments
     """
     if excludes is None:
         excludes = []
 
-    solc_path = configure_compiler(solc_version)
     cmd = ['slither', '--solc', solc_path]
     for exclude in excludes:
         if exclude in ('informational', 'low', 'medium', 'high'):
@@ -35,6 +33,21 @@ def slither_analyze_directory(solc_version, src_dir, ext_dir=None, excludes=None
         # Need to hack slither a bit to pass in remappings to solc, use a dummy argument
         cmd.extend(('--solc-args', '--ignore-missing ' + ' '.join(remappings)))
 
+    return cmd
+
+
+def slither_analyze_directory(solc_version, src_dir, ext_dir=None, excludes=None):
+    """Analyze contract source code using `Slither <https://github.com/crytic/slither>`_.
+
+    :param solc_version: Version of Solidity compiler to use
+    :param src_dir: Directory containing contract Solidity source
+    :param ext_dir: Directory containing external dependencies
+    :param excludes: Exclude these categories of reports
+    :return: 0 on success non-zero on failure
+    """
+    solc_path = configure_compiler(solc_version)
+    cmd = slither_command(solc_path, ext_dir, excludes)
+
     cmd.append(src_dir)
     try:
         return call_with_output(cmd)
@@ -1,19 +1,490 @@
+import copy
+import hashlib
 import json
 import logging
 import os
+import posixpath
+import queue
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from solc import install_solc, compile_standard
+from solc.exceptions import SolcError
+
+from contractor.constants import DEFAULT_OPTIMIZER_RUNS, DEPLOY_OUTPUTS
+from contractor.util import atomic_write
 
 DEFAULT_SOLC_VERSION = 'v0.5.3'
+DEFAULT_CACHE_DIR = os.path.join('~', '.contractor', 'cache')
+WATCH_DEBOUNCE_INTERVAL = 0.25
+MANIFEST_FILENAME = '.manifest.json'
+
+COMMENT_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+IMPORT_PATTERN = re.compile(r'^\s*import\s+(?:[^;]*?\s+from\s+)?["\']([^"\']+)["\']', re.MULTILINE)
+# CBOR encoded metadata solc appends to bytecode, a map of the swarm/IPFS hash of the contract metadata and optionally
+# the compiler version and experimental flag, followed by the two byte length of the map
+METADATA_PATTERN = re.compile(r'(?P<cbor>a[1-9](?:'
+                              r'65627a7a72(?:30|31)5820[0-9a-f]{64}|'
+                              r'64697066735822[0-9a-f]{68}|'
+                              r'64736f6c6343[0-9a-f]{6}|'
+                              r'6c6578706572696d656e74616c(?:f4|f5))+)'
+                              r'(?P<length>[0-9a-f]{4})')
+METADATA_HASH_KEYS = ('bzzr0', 'bzzr1', 'ipfs')
 
 logger = logging.getLogger(__name__)
 
 
-def __compiler_input_from_directory(src_dir, ext_dirs=None):
+def parse_imports(source):
+    """Find the paths imported by a Solidity source file.
+
+    :param source: Solidity source code
+    :return: List of imported paths, as written in the source
+    """
+    return IMPORT_PATTERN.findall(COMMENT_PATTERN.sub('', source))
+
+
+def resolve_import(importer, path, remappings):
+    """Resolve an import path to the source unit name solc will use for it.
+
+    :param importer: Source unit name of the importing file
+    :param path: Imported path, as written in the source
+    :param remappings: List of solc remappings in prefix=target form
+    :return: Source unit name of the imported file
+    """
+    if path.startswith('./') or path.startswith('../'):
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(importer), path))
+
+    # Like solc, the longest matching prefix wins
+    best = None
+    for remapping in remappings:
+        prefix, target = remapping.split('=', 1)
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, target)
+
+    if best is not None:
+        path = best[1] + path[len(best[0]):]
+
+    return path
+
+
+def __decode_cbor_item(data, pos):
+    """Decode a single CBOR item.
+
+    Only the subset of CBOR used by solc's bytecode metadata is supported.
+
+    :param data: CBOR encoded bytes
+    :param pos: Offset of the item in data
+    :return: Tuple of decoded item and offset of the next item
+    """
+    if pos >= len(data):
+        raise ValueError('Truncated CBOR data')
+
+    major, info = data[pos] >> 5, data[pos] & 0x1f
+    pos += 1
+
+    if major == 7:
+        simple = {20: False, 21: True, 22: None}
+        if info not in simple:
+            raise ValueError('Unsupported CBOR simple value {0}'.format(info))
+        return simple[info], pos
+
+    if info < 24:
+        arg = info
+    elif info < 28:
+        size = 1 << (info - 24)
+        if pos + size > len(data):
+            raise ValueError('Truncated CBOR data')
+        arg = int.from_bytes(data[pos:pos + size], 'big')
+        pos += size
+    else:
+        raise ValueError('Unsupported CBOR length encoding {0}'.format(info))
+
+    if major == 0:
+        return arg, pos
+    if major == 1:
+        return -1 - arg, pos
+    if major in (2, 3):
+        if pos + arg > len(data):
+            raise ValueError('Truncated CBOR data')
+        value = data[pos:pos + arg]
+        return value.decode('utf-8') if major == 3 else value, pos + arg
+    if major == 4:
+        items = []
+        for _ in range(arg):
+            item, pos = __decode_cbor_item(data, pos)
+            items.append(item)
+        return items, pos
+    if major == 5:
+        items = {}
+        for _ in range(arg):
+            key, pos = __decode_cbor_item(data, pos)
+            items[key], pos = __decode_cbor_item(data, pos)
+        return items, pos
+
+    raise ValueError('Unsupported CBOR major type {0}'.format(major))
+
+
+def split_metadata(bytecode):
+    """Split the metadata trailer solc appends to bytecode from the executable code.
+
+    :param bytecode: Hex encoded bytecode, optionally 0x prefixed
+    :return: Tuple of bytecode without the trailer and the decoded metadata, or the bytecode and None if there is no
+        valid trailer
+    """
+    prefix = '0x' if bytecode.startswith('0x') else ''
+    code = bytecode[len(prefix):]
+
+    try:
+        start = len(code) - 4 - int(code[-4:], 16) * 2
+        if start < 0:
+            return bytecode, None
+
+        data = bytes.fromhex(code[start:-4])
+        metadata, pos = __decode_cbor_item(data, 0)
+    except ValueError:
+        return bytecode, None
+
+    if pos != len(data) or not isinstance(metadata, dict):
+        return bytecode, None
+
+    return prefix + code[:start], metadata
+
+
+def __strip_metadata_match(match):
+    """Remove a metadata section matched by METADATA_PATTERN, if it is well formed.
+
+    :param match: Match of METADATA_PATTERN
+    :return: Replacement text
+    """
+    if match.start() % 2 != 0 or int(match.group('length'), 16) * 2 != len(match.group('cbor')):
+        return match.group(0)
+
+    return ''
+
+
+def normalize_bytecode(bytecode):
+    """Strip all metadata from bytecode, leaving only the executable code.
+
+    As well as the trailer, this removes the metadata of any contracts embedded in the bytecode to be created with new.
+
+    :param bytecode: Hex encoded bytecode, optionally 0x prefixed
+    :return: Bytecode without metadata
+    """
+    code, _ = split_metadata(bytecode)
+    return METADATA_PATTERN.sub(__strip_metadata_match, code)
+
+
+class ImportGraph(object):
+    """Graph of the imports between Solidity sources, used to determine what needs to be recompiled.
+    """
+
+    def __init__(self, sources, remappings):
+        """Create a new ImportGraph, resolving the transitive imports of a set of sources.
+
+        Imported files which are not in the provided sources are read from the filesystem, as solc would.
+
+        :param sources: Dictionary of source unit names to source code
+        :param remappings: List of solc remappings in prefix=target form
+        """
+        self.remappings = remappings
+        self.sources = set(sources.keys())
+        self.contents = dict(sources)
+        self.imports = {}
+
+        self.__resolve(list(sources.keys()))
+
+    def __resolve(self, pending):
+        """Parse and resolve the imports of source units not yet in the graph.
+
+        :param pending: Source unit names to resolve
+        :return: None
+        """
+        while pending:
+            unit = pending.pop()
+            if unit in self.imports:
+                continue
+
+            if unit not in self.contents:
+                try:
+                    with open(unit, 'r') as f:
+                        self.contents[unit] = f.read()
+                except OSError:
+                    logger.warning('Could not read imported file %s', unit)
+                    self.contents[unit] = None
+
+            source = self.contents[unit]
+            self.imports[unit] = {resolve_import(unit, path, self.remappings)
+                                  for path in parse_imports(source)} if source else set()
+            pending.extend(self.imports[unit])
+
+    def update(self, sources, changed_paths=()):
+        """Refresh the graph after files have changed, re-parsing only what changed.
+
+        :param sources: Dictionary of source unit names to current source code
+        :param changed_paths: Filesystem paths of changed files which are not part of the provided sources
+        :return: Set of source unit names whose content changed
+        """
+        changed_paths = {os.path.abspath(path) for path in changed_paths}
+        changed = {unit for unit in self.contents if unit not in sources and os.path.abspath(unit) in changed_paths}
+        for unit in changed:
+            del self.contents[unit]
+
+        for unit, source in sources.items():
+            if self.contents.get(unit) != source:
+                self.contents[unit] = source
+                changed.add(unit)
+
+        for unit in changed:
+            self.imports.pop(unit, None)
+
+        self.__resolve(list(changed))
+        return changed
+
+    def dependents(self, units):
+        """Find a set of source units and everything which transitively imports them.
+
+        :param units: Source unit names to start from
+        :return: Set of source unit names
+        """
+        importers = {}
+        for unit, imported in self.imports.items():
+            for i in imported:
+                importers.setdefault(i, set()).add(unit)
+
+        dependents = set()
+        pending = list(units)
+        while pending:
+            cur = pending.pop()
+            if cur not in dependents:
+                dependents.add(cur)
+                pending.extend(importers.get(cur, ()))
+
+        return dependents
+
+    def closure(self, unit):
+        """Find a source unit and everything it transitively imports.
+
+        :param unit: Source unit name to start from
+        :return: Set of source unit names
+        """
+        closure = set()
+        pending = [unit]
+        while pending:
+            cur = pending.pop()
+            if cur not in closure:
+                closure.add(cur)
+                pending.extend(self.imports.get(cur, ()))
+
+        return closure
+
+    def digest(self, unit):
+        """Hash the content of a source unit.
+
+        :param unit: Source unit name to hash
+        :return: Hex digest of the source, or None if it could not be read
+        """
+        source = self.contents.get(unit)
+        return hashlib.sha256(source.encode('utf-8')).hexdigest() if source is not None else None
+
+
+def __solc_settings(options):
+    """Generate solc settings from compile options.
+
+    :param options: Dictionary of compile options, as returned by CompileProfile.options
+    :return: Dictionary containing solc settings
+    """
+    return {
+        'optimizer': {
+            'enabled': options.get('optimize', True),
+            'runs': options.get('optimizer_runs', DEFAULT_OPTIMIZER_RUNS),
+        },
+        'outputSelection': {
+            '*': {
+                '*': list(options.get('outputs', DEPLOY_OUTPUTS)),
+            }
+        }
+    }
+
+
+def __unit_settings(input, profile=None):
+    """Determine the solc settings to compile each source in a compiler input with.
+
+    :param input: Dictionary containing solc input
+    :param profile: CompileProfile with per-contract settings, or None to use the settings in the input for all sources
+    :return: Dictionary of source unit names to solc settings
+    """
+    ret = {}
+    for unit in input['sources']:
+        settings = dict(input['settings'])
+        if profile is not None:
+            settings.update(__solc_settings(profile.options(posixpath.splitext(posixpath.basename(unit))[0])))
+
+        ret[unit] = settings
+
+    return ret
+
+
+def __group_by_settings(units, unit_settings):
+    """Group sources which are compiled with the same solc settings.
+
+    :param units: Source unit names to group
+    :param unit_settings: Dictionary of source unit names to solc settings
+    :return: List of tuples of solc settings and the source unit names compiled with them
+    """
+    groups = {}
+    for unit in units:
+        key = json.dumps(unit_settings[unit], sort_keys=True)
+        groups.setdefault(key, (unit_settings[unit], []))[1].append(unit)
+
+    return list(groups.values())
+
+
+def __cache_keys(solc_version, input, graph, unit_settings):
+    """Compute a cache key for each source in a compiler input.
+
+    Keys cover the solc version, compiler settings (including remappings) and the content of each source along with
+    everything it transitively imports, so any change which could affect a source's output changes its key.
+
+    :param solc_version: Version of solc to use
+    :param input: Dictionary containing solc input
+    :param graph: ImportGraph of the sources in the input
+    :param unit_settings: Dictionary of source unit names to the solc settings they are compiled with
+    :return: Dictionary of source unit names to cache keys
+    """
+    ret = {}
+    for unit in input['sources']:
+        key = {
+            'solc_version': solc_version,
+            'settings': unit_settings[unit],
+            'sources': {k: graph.digest(k) for k in graph.closure(unit)},
+            'unit': unit,
+        }
+        ret[unit] = hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    return ret
+
+
+def __partial_compiler_input(input, units, graph):
+    """Restrict a compiler input to a subset of its sources.
+
+    Only the requested sources and the sources they import are submitted to solc, and output is only requested for
+    the requested sources.
+
+    :param input: Dictionary containing solc input
+    :param units: Source unit names to compile
+    :param graph: ImportGraph of the sources in the input
+    :return: Dictionary containing solc input
+    """
+    required = set()
+    for unit in units:
+        required |= graph.closure(unit)
+
+    ret = dict(input)
+    ret['sources'] = {k: v for k, v in input['sources'].items() if k in required}
+
+    ret['settings'] = dict(input['settings'])
+    selection = input['settings']['outputSelection']['*']
+    ret['settings']['outputSelection'] = {unit: selection for unit in units}
+
+    return ret
+
+
+def __compilation_units(units, graph):
+    """Split sources into independent compilation units which can be compiled in parallel.
+
+    Sources are grouped with any other requested source they transitively import, so mutually dependent sources and
+    sources shared by larger ones are not compiled more than once.
+
+    :param units: Source unit names to compile
+    :param graph: ImportGraph of the sources
+    :return: List of lists of source unit names, one per compilation unit
+    """
+    # Start from the sources with the largest closures, so they absorb the sources they import
+    ordered = sorted(units, key=lambda unit: (-len(graph.closure(unit)), unit))
+
+    ret = []
+    assigned = set()
+    for unit in ordered:
+        if unit in assigned:
+            continue
+
+        closure = graph.closure(unit)
+        group = [u for u in ordered if u not in assigned and u in closure]
+        assigned.update(group)
+        ret.append(group)
+
+    return ret
+
+
+def __compile_input(input, kwargs):
+    """Run solc on a compiler input, in a worker process.
+
+    :param input: Dictionary containing solc input
+    :param kwargs: Keyword arguments for compile_standard
+    :return: Contracts section of the compiler output
+    """
+    return compile_standard(input, **kwargs)['contracts']
+
+
+def __compile_parallel(input, units, graph, kwargs, jobs):
+    """Compile sources as independent compilation units across a pool of processes.
+
+    :param input: Dictionary containing solc input
+    :param units: Source unit names to compile
+    :param graph: ImportGraph of the sources in the input
+    :param kwargs: Keyword arguments for compile_standard
+    :param jobs: Maximum number of solc processes to run at once
+    :return: Dictionary of source unit names to the compiler output for the contracts in them
+    """
+    groups = __compilation_units(units, graph)
+    logger.info('Compiling %s units in parallel: %s', len(groups), '; '.join(', '.join(g) for g in groups))
+
+    ret = {}
+    with ProcessPoolExecutor(max_workers=min(jobs, len(groups))) as executor:
+        futures = [(group, executor.submit(__compile_input, __partial_compiler_input(input, group, graph), kwargs))
+                   for group in groups]
+        for group, future in futures:
+            contracts = future.result()
+            ret.update({unit: contracts[unit] for unit in group})
+
+    return ret
+
+
+def __load_cached_output(cache_dir, key):
+    """Load cached compiler output for a source.
+
+    :param cache_dir: Directory containing cached compiler output
+    :param key: Cache key of the source
+    :return: Compiler output for the contracts in the source, or None if not cached
+    """
+    try:
+        with open(os.path.join(cache_dir, key + '.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def __store_cached_output(cache_dir, key, contracts):
+    """Store compiler output for a source in the cache.
+
+    :param cache_dir: Directory containing cached compiler output
+    :param key: Cache key of the source
+    :param contracts: Compiler output for the contracts in the source
+    :return: None
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Write atomically so concurrent compiles never see a partial entry
+    atomic_write(os.path.join(cache_dir, key + '.json'), json.dumps(contracts))
+
+
+def __compiler_input_from_directory(src_dir, ext_dirs=None, profile=None):
     """Generate input JSON for solc given directories of contracts to compile.
 
     :param src_dir: Directory containing contract Solidity source
     :param ext_dir: Directory containing external dependencies
+    :param profile: CompileProfile to take default settings from, or None for the deploy profile's settings
     :return: Dictionary containing solc input
     """
     sources = {}
@@ -25,8 +496,6 @@ def __compiler_input_from_directory(src_dir, ext_dirs=None):
             with open(os.path.join(root, file), 'r') as f:
                 sources[file] = f.read()
 
-    logger.info('Compiling %s', ', '.join(sources.keys()))
-
     remappings = []
     if ext_dirs:
         for ext_dir in ext_dirs:
@@ -36,21 +505,7 @@ def __compiler_input_from_directory(src_dir, ext_dirs=None):
     ret = {
         'language': 'Solidity',
         'sources': {k: {'content': v} for k, v in sources.items()},
-        'settings': {
-            'optimizer': {
-                'enabled': True,
-                'runs': 200,
-            },
-            'outputSelection': {
-                '*': {
-                    '*': [
-                        'abi',
-                        'evm.bytecode.object',
-                        'evm.bytecode.linkReferences',
-                    ]
-                }
-            }
-        }
+        'settings': __solc_settings(profile.options() if profile is not None else {}),
     }
 
     if remappings:
@@ -59,40 +514,164 @@ def __compiler_input_from_directory(src_dir, ext_dirs=None):
     return ret
 
 
+def __serialize_artifact(contract):
+    """Serialize a contract artifact in canonical form.
+
+    :param contract: Contract artifact to serialize
+    :return: Serialized artifact
+    """
+    return json.dumps(contract, indent=2, sort_keys=True)
+
+
+def __load_manifest(out_dir):
+    """Load the manifest of artifact content hashes from an output directory.
+
+    :param out_dir: Directory containing output JSON
+    :return: Dictionary of artifact filenames to manifest entries
+    """
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILENAME), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def __manifest_entry(out_file, digest):
+    """Create a manifest entry for an artifact.
+
+    The file's size and modification time are recorded so we can tell if it has since been modified by something else.
+
+    :param out_file: Path of the artifact
+    :param digest: Hex digest of the artifact's canonical form
+    :return: Manifest entry for the artifact
+    """
+    st = os.stat(out_file)
+    return {'sha256': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def __load_artifact(out_file):
+    """Load an existing artifact.
+
+    :param out_file: Path of the artifact
+    :return: Contract artifact, or None if there is no valid artifact
+    """
+    try:
+        with open(out_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def __artifact_digest(out_file, entry):
+    """Determine the digest of an existing artifact's canonical form.
+
+    The manifest is trusted if the file has not been modified since it was recorded, otherwise the artifact is re-read,
+    such as when it was pulled from Consul.
+
+    :param out_file: Path of the artifact
+    :param entry: Manifest entry for the artifact, or None if there is none
+    :return: Hex digest of the artifact's canonical form, or None if there is no valid artifact
+    """
+    try:
+        st = os.stat(out_file)
+    except OSError:
+        return None
+
+    if entry is not None and entry.get('size') == st.st_size and entry.get('mtime_ns') == st.st_mtime_ns:
+        return entry.get('sha256')
+
+    contract = __load_artifact(out_file)
+    if contract is None:
+        return None
+
+    return hashlib.sha256(__serialize_artifact(contract).encode('utf-8')).hexdigest()
+
+
+def __semantic_artifact(contract):
+    """Strip the parts of an artifact which do not affect the deployed contract.
+
+    :param contract: Contract artifact
+    :return: Copy of the artifact without metadata or source maps
+    """
+    ret = copy.deepcopy(contract)
+    ret.pop('metadata', None)
+
+    for output in ('bytecode', 'deployedBytecode'):
+        bytecode = ret.get('evm', {}).get(output, {})
+        bytecode.pop('sourceMap', None)
+        if 'object' in bytecode:
+            bytecode['object'] = normalize_bytecode(bytecode['object'])
+
+    return ret
+
+
+def __metadata_hash(contract):
+    """Get the hash of the contract metadata from the trailer of an artifact's bytecode.
+
+    :param contract: Contract artifact
+    :return: Hex encoded metadata hash, or None if there is none
+    """
+    _, metadata = split_metadata(contract.get('evm', {}).get('bytecode', {}).get('object', ''))
+    for key in METADATA_HASH_KEYS:
+        if isinstance((metadata or {}).get(key), bytes):
+            return metadata[key].hex()
+
+    return None
+
+
 def __write_compiler_output(output, source_files, out_dir):
     """Write output JSON from solc to a directory.
 
+    Artifacts are compared by the hash of their canonical form, tracked in a manifest alongside the artifacts.
+    Unchanged artifacts are never rewritten, and changed artifacts are replaced atomically. Changes which only affect
+    the metadata solc appends to bytecode, such as edits to comments or whitespace, are written but do not require a
+    redeploy.
+
     :param output: Output from solc
     :param source_files: Source files compiled to generate provided output
     :param out_dir: Directory to write output JSON to
-    :return: True if contracts have changed, else False
+    :return: True if contracts have changed semantically, else False
     """
     is_dirty = False
 
     if not os.path.isdir(out_dir):
         os.makedirs(out_dir, exist_ok=True)
 
+    manifest = __load_manifest(out_dir)
+    orig_manifest = dict(manifest)
+
     contracts = output['contracts']
     for source_file in source_files:
-        out_file = os.path.join(out_dir, os.path.splitext(source_file)[0] + '.json')
+        filename = os.path.splitext(source_file)[0] + '.json'
+        out_file = os.path.join(out_dir, filename)
 
         # Restructure this for compatibility with polyswarmd et al
         name = next(iter(contracts[source_file]))
         contract = contracts[source_file][name]
         contract['contractName'] = name
 
+        serialized = __serialize_artifact(contract)
+        digest = hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
         # Attempt to match bytecode to see if we need to redeploy
-        if not os.path.exists(out_file):
-            is_dirty = True
+        if __artifact_digest(out_file, manifest.get(filename)) == digest:
+            logger.info('%s: unchanged', name)
         else:
-            with open(out_file, 'r') as f:
-                orig_contract = json.load(f)
-                if orig_contract != contract:
-                    is_dirty = True
+            previous = __load_artifact(out_file)
+            if previous is not None and __semantic_artifact(previous) == __semantic_artifact(contract):
+                logger.info('%s: metadata-only change (%s -> %s)', name, __metadata_hash(previous),
+                            __metadata_hash(contract))
+            else:
+                is_dirty = True
+                logger.info('%s: semantic change', name)
 
-        logger.info('Writing %s', out_file)
-        with open(out_file, 'w') as f:
-            json.dump(contract, f, indent=2, sort_keys=True)
+            logger.debug('Writing %s', out_file)
+            atomic_write(out_file, serialized)
+
+        manifest[filename] = __manifest_entry(out_file, digest)
+
+    if manifest != orig_manifest:
+        atomic_write(os.path.join(out_dir, MANIFEST_FILENAME), json.dumps(manifest, indent=2, sort_keys=True))
 
     return is_dirty
 
@@ -112,24 +691,215 @@ def configure_compiler(solc_version):
     return solc_path
 
 
-def compile_directory(solc_version, src_dir, out_dir, ext_dirs=None):
+def __compile_sources(solc_version, input, graph, ext_dirs=None, cache_dir=None, jobs=1, memory_cache=None,
+                      profile=None):
+    """Compile the sources in a compiler input, reusing cached output where possible.
+
+    When caching, only sources whose own content or imports have changed are recompiled, cached output is used for
+    everything else. Sources with per-contract settings in the profile are compiled separately with those settings.
+
+    :param solc_version: Version of solc to use
+    :param input: Dictionary containing solc input
+    :param graph: ImportGraph of the sources in the input, required when caching or compiling in parallel
+    :param ext_dirs: List of directories containing external dependencies
+    :param cache_dir: Directory to cache compiler output in, or None to not cache on disk
+    :param jobs: Number of solc processes to run in parallel
+    :param memory_cache: Dictionary to cache compiler output in memory, or None to not cache in memory, only output
+        for the current version of each source is kept
+    :param profile: CompileProfile with per-contract settings, or None to compile all sources with the input's settings
+    :return: Dictionary of source unit names to the compiler output for the contracts in them
+    """
+    source_files = list(input['sources'].keys())
+    unit_settings = __unit_settings(input, profile)
+
+    contracts = {}
+    stale = source_files
+    if cache_dir is not None or memory_cache is not None:
+        keys = __cache_keys(solc_version, input, graph, unit_settings)
+
+        for source_file in source_files:
+            cached = memory_cache.get(keys[source_file]) if memory_cache is not None else None
+            if cached is None and cache_dir is not None:
+                cached = __load_cached_output(cache_dir, keys[source_file])
+
+            if cached is not None:
+                contracts[source_file] = cached
+
+        stale = [source_file for source_file in source_files if source_file not in contracts]
+        if contracts:
+            logger.info('Using cached compiler output for %s', ', '.join(contracts.keys()))
+
+    if stale:
+        logger.info('Compiling %s', ', '.join(stale))
+        configure_compiler(solc_version)
+
+        kwargs = {}
+        if ext_dirs:
+            kwargs['allow_paths'] = ','.join((os.path.abspath(ext_dir) for ext_dir in ext_dirs))
+
+        # TODO: Compilation errors will be reported via a SolcError, should report these in a friendlier manner
+        for settings, units in __group_by_settings(stale, unit_settings):
+            settings_input = dict(input, settings=settings)
+            if jobs > 1:
+                contracts.update(__compile_parallel(settings_input, units, graph, kwargs, jobs))
+            else:
+                if len(units) < len(source_files):
+                    settings_input = __partial_compiler_input(settings_input, units, graph)
+
+                output = compile_standard(settings_input, **kwargs)
+                contracts.update({source_file: output['contracts'][source_file] for source_file in units})
+
+        for source_file in stale:
+            if cache_dir is not None:
+                __store_cached_output(cache_dir, keys[source_file], contracts[source_file])
+            if memory_cache is not None:
+                memory_cache[keys[source_file]] = contracts[source_file]
+    else:
+        logger.info('No source changes detected, using cached compiler output')
+
+    # Output for old versions of sources is never used again, so drop it rather than grow without bound
+    if memory_cache is not None:
+        for key in set(memory_cache) - set(keys.values()):
+            del memory_cache[key]
+
+    return contracts
+
+
+def compile_directory(solc_version, src_dir, out_dir, ext_dirs=None, cache_dir=None, jobs=1, profile=None):
     """Compile a directory of contracts into output JSON.
 
     :param solc_version: Version of solc to use
     :param src_dir: Directory containing contract Solidity source
     :param out_dir: Directory to output compiled JSON into
     :param ext_dirs: List of directories containing external dependencies
-    :return: True if contracts have changed, else False
+    :param cache_dir: Directory to cache compiler output in, or None to always compile
+    :param jobs: Number of solc processes to run in parallel, 0 for one per CPU
+    :param profile: CompileProfile selecting compiler settings and outputs, or None for the deploy profile's settings
+    :return: True if contracts have changed semantically, else False
     """
-    configure_compiler(solc_version)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
 
-    kwargs = {}
-    if ext_dirs:
-        kwargs['allow_paths'] = ','.join((os.path.abspath(ext_dir) for ext_dir in ext_dirs))
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+
+    input = __compiler_input_from_directory(src_dir, ext_dirs, profile)
+    source_files = list(input['sources'].keys())
+
+    graph = None
+    if cache_dir is not None or jobs > 1 or profile is not None:
+        graph = ImportGraph({k: v['content'] for k, v in input['sources'].items()},
+                            input['settings'].get('remappings', []))
+
+    contracts = __compile_sources(solc_version, input, graph, ext_dirs, cache_dir=cache_dir, jobs=jobs,
+                                  profile=profile)
+    return __write_compiler_output({'contracts': contracts}, source_files, out_dir)
+
+
+class SourceEventHandler(object):
+    """Collect changes to Solidity sources reported by the filesystem, as a watchdog event handler.
+    """
+
+    def __init__(self, events):
+        """Create a new SourceEventHandler.
+
+        :param events: Queue to put paths of changed Solidity sources on
+        """
+        self.events = events
+
+    def dispatch(self, event):
+        """Handle a filesystem event.
+
+        :param event: Event to handle
+        :return: None
+        """
+        if event.is_directory:
+            return
+
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            if path is not None and os.path.splitext(path)[-1] == '.sol':
+                self.events.put(path)
+
+
+def watch_directory(solc_version, src_dir, out_dir, ext_dirs=None, cache_dir=None, jobs=1, profile=None,
+                    debounce=WATCH_DEBOUNCE_INTERVAL, stop_event=None):
+    """Watch a directory of contracts, recompiling affected sources whenever they change (blocking).
+
+    The import graph and compiler output are kept in memory between builds, and only artifacts whose content changed
+    are rewritten.
+
+    :param solc_version: Version of solc to use
+    :param src_dir: Directory containing contract Solidity source
+    :param out_dir: Directory to output compiled JSON into
+    :param ext_dirs: List of directories containing external dependencies
+    :param cache_dir: Directory to cache compiler output in, or None to only cache in memory
+    :param jobs: Number of solc processes to run in parallel, 0 for one per CPU
+    :param profile: CompileProfile selecting compiler settings and outputs, or None for the deploy profile's settings
+    :param debounce: Time in seconds to wait for a burst of changes to settle before rebuilding
+    :param stop_event: Event which stops watching once set, or None to watch until interrupted
+    :return: None
+    """
+    # Only watch mode needs watchdog, so importing this module does not require it
+    from watchdog.observers import Observer
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    if cache_dir is not None:
+        cache_dir = os.path.expanduser(cache_dir)
+
+    events = queue.Queue()
+    observer = Observer()
+    for path in [src_dir] + list(ext_dirs or []):
+        observer.schedule(SourceEventHandler(events), path, recursive=True)
+    observer.start()
+
+    graph = None
+    memory_cache = {}
+    changed_paths = set()
+    try:
+        while True:
+            start = time.time()
+            input = __compiler_input_from_directory(src_dir, ext_dirs, profile)
+            sources = {k: v['content'] for k, v in input['sources'].items()}
+
+            if graph is None or set(sources) != set(graph.sources):
+                graph = ImportGraph(sources, input['settings'].get('remappings', []))
+            else:
+                changed = graph.update(sources, changed_paths)
+                affected = graph.dependents(changed) & set(sources)
+                logger.info('Changed: %s, rebuilding %s', ', '.join(sorted(changed)) or 'nothing',
+                            ', '.join(sorted(affected)) or 'nothing')
+
+            try:
+                contracts = __compile_sources(solc_version, input, graph, ext_dirs, cache_dir=cache_dir, jobs=jobs,
+                                              memory_cache=memory_cache, profile=profile)
+                is_dirty = __write_compiler_output({'contracts': contracts}, list(sources.keys()), out_dir)
+                logger.info('Build finished in %.2fs, %s', time.time() - start,
+                            'artifacts updated' if is_dirty else 'no artifact changes')
+            except SolcError as e:
+                logger.error('Build failed in %.2fs: %s', time.time() - start, e)
+
+            logger.info('Watching %s for changes', ', '.join([src_dir] + list(ext_dirs or [])))
+
+            # Block until something changes, then wait for the burst of changes to settle
+            changed_paths = set()
+            while not changed_paths and not (stop_event is not None and stop_event.is_set()):
+                try:
+                    changed_paths.add(events.get(timeout=debounce))
+                except queue.Empty:
+                    continue
 
-    input = __compiler_input_from_directory(src_dir, ext_dirs)
-    source_files = input['sources'].keys()
-    output = compile_standard(input, **kwargs)
-    # TODO: Compilation errors will be reported via a SolcError, should report these in a friendlier manner
+            if not changed_paths:
+                break
 
-    return __write_compiler_output(output, source_files, out_dir)
+            while True:
+                try:
+                    changed_paths.add(events.get(timeout=debounce))
+                except queue.Empty:
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
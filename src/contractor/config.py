@@ -1,17 +1,28 @@
 import logging
 import yaml
 
+from contractor.constants import DEFAULT_OPTIMIZER_RUNS, DEPLOY_OUTPUTS, GAS_OUTPUTS, VERIFY_OUTPUTS
 from contractor.network import Network
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_COMPILE_PROFILE = 'deploy'
+DEFAULT_COMPILE_PROFILES = {
+    'deploy': {'outputs': DEPLOY_OUTPUTS},
+    'verify': {'outputs': VERIFY_OUTPUTS},
+    'gas': {'outputs': GAS_OUTPUTS},
+}
+COMPILE_OPTIONS = ('optimize', 'optimizer_runs', 'outputs')
+# Artifacts are deployed from regardless of the profile they were compiled with
+REQUIRED_OUTPUTS = ('abi', 'evm.bytecode.object')
+
 
 class NetworkConfig(object):
     """Configuration for an Ethereum network.
     """
 
     def __init__(self, name, eth_uri, network_id, gas_limit, gas_price, gas_estimate_multiplier, timeout,
-                 contract_config, chain):
+                 contract_config, chain, dev_mode=False):
         """Create a new network configuration from parts.
 
         :param name: Name of the network
@@ -23,6 +34,7 @@ class NetworkConfig(object):
         :param timeout: Timeout for RPC calls on this network
         :param contract_config: Configuration for contracts on this network
         :param chain: Is this network the homechain or sidechain for this deployment
+        :param dev_mode: Is this a development chain where we can mine blocks on demand instead of waiting
         """
         self.name = name
         self.eth_uri = eth_uri
@@ -33,6 +45,7 @@ class NetworkConfig(object):
         self.timeout = timeout
         self.contract_config = contract_config
         self.chain = chain
+        self.dev_mode = dev_mode
 
         self.validate()
 
@@ -52,13 +65,14 @@ class NetworkConfig(object):
         gas_price = d.get('gas_price')
         gas_estimate_multiplier = d.get('gas_estimate_multiplier', 3)
         timeout = d.get('timeout', 240)
+        dev_mode = d.get('dev_mode', False)
 
         # Copy default contract config and apply any overrides if applicable
         contract_config = dict(default_contract_config)
         contract_config.update(d.get('contracts', {}))
 
         return cls(name, eth_uri, network_id, gas_limit, gas_price, gas_estimate_multiplier, timeout, contract_config,
-                   chain)
+                   chain, dev_mode=dev_mode)
 
     def validate(self):
         """Validate network parameters for sanity.
@@ -77,7 +91,8 @@ class NetworkConfig(object):
         :return: Network object based on this configuration
         """
         return Network(self.name, self.eth_uri, self.network_id, self.gas_limit, self.gas_price,
-                       self.gas_estimate_multiplier, self.timeout, self.contract_config, self.chain)
+                       self.gas_estimate_multiplier, self.timeout, self.contract_config, self.chain,
+                       dev_mode=self.dev_mode)
 
 
 class Config(object):
@@ -126,3 +141,114 @@ class Config(object):
         """
         if not self.network_configs:
             raise ValueError('No networks configured')
+
+
+class CompileProfile(object):
+    """Named set of compiler settings, optionally overridden per contract.
+    """
+
+    def __init__(self, name, default_options, contract_options):
+        """Create a new compile profile from parts.
+
+        :param name: Name of the profile
+        :param default_options: Compile options for all contracts (optimize, optimizer_runs and outputs)
+        :param contract_options: Dictionary of contract names to compile options overriding the defaults
+        """
+        self.name = name
+        self.default_options = default_options
+        self.contract_options = contract_options
+
+        self.validate()
+
+    @classmethod
+    def from_dict(cls, d, name):
+        """Create a new compile profile from a dictionary.
+
+        :param d: Dictionary containing profile configuration
+        :param name: Name of the profile
+        :return: New compile profile from provided dictionary
+        """
+        default_options = {k: v for k, v in d.items() if k in COMPILE_OPTIONS}
+        # Contracts listed without options in YAML, e.g. `NectarToken:`, use the profile's defaults
+        contract_options = {k: dict(v or {}) for k, v in (d.get('contracts') or {}).items()}
+
+        return cls(name, default_options, contract_options)
+
+    def options(self, contract=None):
+        """Get the compile options for a contract.
+
+        :param contract: Name of the contract, or None for the profile's defaults
+        :return: Dictionary of compile options
+        """
+        ret = {'optimize': True, 'optimizer_runs': DEFAULT_OPTIMIZER_RUNS, 'outputs': DEPLOY_OUTPUTS}
+        ret.update(self.default_options)
+        ret.update(self.contract_options.get(contract, {}))
+        return ret
+
+    def validate(self):
+        """Validate profile parameters for sanity.
+
+        :return: None
+        """
+        for contract, options in [(None, self.default_options)] + list(self.contract_options.items()):
+            unknown = ', '.join(sorted(set(options) - set(COMPILE_OPTIONS)))
+            if unknown:
+                raise ValueError('Unknown compile options {0} in profile {1}'.format(unknown, self.name))
+
+            options = self.options(contract)
+            if not isinstance(options['optimizer_runs'], int) or options['optimizer_runs'] <= 0:
+                raise ValueError('Invalid optimizer runs in profile {0}'.format(self.name))
+            if any(output not in options['outputs'] for output in REQUIRED_OUTPUTS):
+                raise ValueError('Profile {0} must output {1}'.format(self.name, ', '.join(REQUIRED_OUTPUTS)))
+
+
+class CompilerConfig(object):
+    """Configuration of the compile profiles available for compiling contracts.
+    """
+
+    def __init__(self, profiles):
+        """Create a new CompilerConfig from the provided compile profiles.
+
+        :param profiles: Dictionary of profile names to compile profiles
+        """
+        self.profiles = profiles
+
+    @classmethod
+    def from_dict(cls, d):
+        """Create a new CompilerConfig from a dictionary.
+
+        Profiles defined in the dictionary are merged over the built-in deploy, verify and gas profiles.
+
+        :param d: Dictionary containing compiler configuration
+        :return: New configuration from provided dictionary
+        """
+        profiles = {}
+        configured = d.get('profiles', {})
+        for name in set(DEFAULT_COMPILE_PROFILES) | set(configured):
+            profile = dict(DEFAULT_COMPILE_PROFILES.get(name, {}))
+            profile.update(configured.get(name) or {})
+            profiles[name] = CompileProfile.from_dict(profile, name)
+
+        return cls(profiles)
+
+    @classmethod
+    def from_yaml(cls, f):
+        """Create a new CompilerConfig from the compiler section of a YAML file
+
+        :param f: File object containing YAML configuration, or None for the built-in profiles only
+        :return: New configuration from provided YAML file
+        """
+        d = yaml.safe_load(f) if f is not None else None
+        return CompilerConfig.from_dict((d or {}).get('compiler', {}))
+
+    def profile(self, name):
+        """Get a compile profile by name.
+
+        :param name: Name of the profile
+        :return: The compile profile
+        """
+        if name not in self.profiles:
+            raise ValueError('No such compile profile {0}, expected one of {1}'.format(
+                name, ', '.join(sorted(self.profiles))))
+
+        return self.profiles[name]
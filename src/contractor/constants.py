@@ -0,0 +1,9 @@
+# Compiler settings shared by the compiler and compile profiles in configuration, kept here so loading configuration
+# does not require the compiler's dependencies
+DEFAULT_OPTIMIZER_RUNS = 200
+
+# Outputs requested from solc by the built-in compile profiles, deploying only needs the ABI and bytecode
+DEPLOY_OUTPUTS = ['abi', 'evm.bytecode.object', 'evm.bytecode.linkReferences']
+VERIFY_OUTPUTS = DEPLOY_OUTPUTS + ['metadata', 'evm.bytecode.sourceMap', 'evm.deployedBytecode.object',
+                                   'evm.deployedBytecode.linkReferences', 'evm.deployedBytecode.sourceMap']
+GAS_OUTPUTS = DEPLOY_OUTPUTS + ['evm.gasEstimates']
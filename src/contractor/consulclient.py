@@ -1,16 +1,35 @@
+import base64
+import hashlib
 import json
 import logging
 import os
+import subprocess
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 
 from consul import Consul
-from consul.base import Timeout
+from consul.base import ClientError, Timeout
 from urllib.parse import urlparse
 
+from contractor.util import atomic_write
+
 logger = logging.getLogger(__name__)
 
 INITIAL_WAIT = '5s'
 LONG_WAIT = '2m'
 
+# Consul limits transactions to 64 operations and 512KB, leave headroom for the JSON encoding of each operation
+TXN_MAX_OPERATIONS = 64
+TXN_MAX_SIZE = 384 * 1024
+PUSH_CONCURRENCY = 4
+
+# Consul limits values to 512KB, only values larger than that are compressed and split into chunks with a manifest
+# stored under the original key. Other values are stored as is so other consumers can read them directly
+ENCODE_THRESHOLD = 512 * 1024
+CHUNK_SIZE = 256 * 1024
+MANIFEST_FLAG = 0x63746d01
+CHUNK_FLAG = 0x63746d02
+
 
 class ConsulClient(object):
     """Client for interacting with Consul.
@@ -25,6 +44,16 @@ class ConsulClient(object):
         u = urlparse(uri)
         self.client = Consul(host=u.hostname, port=u.port, scheme=u.scheme, token=token)
 
+    @staticmethod
+    def __base_key(community):
+        """Get the key prefix a community's configuration is stored under.
+
+        :param community: Community to access
+        :return: Key prefix
+        """
+        # TODO: Should `chain/foo` really be `community/foo`?
+        return 'chain/{}/'.format(community)
+
     def __fetch_from_consul_or_wait(self, key, recurse=False, index=0):
         """Fetch a key from Consul once it becomes available (blocking).
 
@@ -51,8 +80,7 @@ class ConsulClient(object):
         :param wait: Should we wait if key is not yet available
         :return: None
         """
-        # TODO: Should `chain/foo` really be `community/foo`?
-        key = 'chain/{}/'.format(community)
+        key = self.__base_key(community)
         index, values = self.client.kv.get(key, recurse=True, index=0, wait=INITIAL_WAIT)
         if values is None and wait:
             logger.info('Waiting for consul key %s to become available', key)
@@ -62,30 +90,181 @@ class ConsulClient(object):
             logger.info('Consul key %s is not available, continuing', key)
             return
 
+        self.__apply_values(self.__decode_values(values), out_dir, {})
+
+    def __apply_values(self, values, out_dir, known):
+        """Write values fetched from Consul into a directory, only writing files whose content changed.
+
+        :param values: Values returned by a recursive get
+        :param out_dir: Directory to place pulled configuration
+        :param known: Dictionary of keys previously applied to their modify index, updated in place
+        :return: List of filenames written or removed
+        """
         if not os.path.isdir(out_dir):
             os.makedirs(out_dir, exist_ok=True)
 
+        changed = []
+        current = {}
         for value in values:
-            filename = os.path.join(out_dir, value['Key'].split('/')[-1] + '.json')
+            key = value['Key']
+            current[key] = value['ModifyIndex']
+            if known.get(key) == value['ModifyIndex']:
+                continue
+
+            filename = os.path.join(out_dir, key.split('/')[-1] + '.json')
+            content = (value['Value'] or b'').decode('utf-8')
+            try:
+                with open(filename, 'r') as f:
+                    if f.read() == content:
+                        continue
+            except OSError:
+                pass
 
             logger.info('Writing %s', filename)
-            with open(filename, 'w') as f:
-                f.write(value['Value'].decode('utf-8'))
+            atomic_write(filename, content)
+            changed.append(filename)
 
-    def push_config(self, community, in_dir):
-        """Push a set of configuration files from a directory into Consul.
+        # Only remove files for keys we have previously seen, the directory may contain other files
+        for key in set(known) - set(current):
+            filename = os.path.join(out_dir, key.split('/')[-1] + '.json')
+            if os.path.isfile(filename):
+                logger.info('Consul key %s was deleted, removing %s', key, filename)
+                os.remove(filename)
+                changed.append(filename)
+
+        known.clear()
+        known.update(current)
+        return changed
+
+    def sync_config(self, community, out_dir, follow=False, hook=None, stop_event=None):
+        """Sync a set of configuration files from Consul into a directory, optionally following changes (blocking).
+
+        When following, a blocking query is held on the community's keys so changes are applied as soon as they are
+        made, without polling.
 
         :param community: Community to access
-        :param in_dir: Directory containing new configuration
+        :param out_dir: Directory to place pulled configuration
+        :param follow: Keep applying changes until interrupted
+        :param hook: Shell command to run after changes are applied, with CONTRACTOR_CHANGED_FILES in its environment
+        :param stop_event: Event which stops following once set, checked whenever a blocking query returns, or None
+            to follow until interrupted
         :return: None
         """
-        # TODO: Should `chain/foo` really be `community/foo`?
-        base_key = 'chain/{}/'.format(community)
+        key = self.__base_key(community)
+
+        index = None
+        known = {}
+        while True:
+            try:
+                new_index, values = self.client.kv.get(key, recurse=True, index=index, wait=LONG_WAIT)
+            except Timeout:
+                if stop_event is not None and stop_event.is_set():
+                    return
+                logger.info('Consul query for %s timed out, retrying...', key)
+                continue
+
+            # Consul's index can go backwards, e.g. after a restore, start again from a full fetch if it does
+            if index is not None and int(new_index) < int(index):
+                logger.warning('Consul index for %s went backwards, resetting', key)
+                new_index = None
+
+            if new_index is None or new_index != index:
+                changed = self.__apply_values(self.__decode_values(values or []), out_dir, known)
+                if changed and hook:
+                    self.__run_hook(hook, changed)
+
+            index = new_index
+            if not follow or (stop_event is not None and stop_event.is_set()):
+                return
+
+    @staticmethod
+    def __run_hook(hook, changed):
+        """Run a hook after applying changes from Consul.
+
+        :param hook: Shell command to run
+        :param changed: List of filenames written or removed
+        :return: None
+        """
+        env = dict(os.environ)
+        env['CONTRACTOR_CHANGED_FILES'] = ' '.join(changed)
+
+        logger.info('Running hook: %s', hook)
+        rc = subprocess.call(hook, shell=True, env=env)
+        if rc != 0:
+            logger.error('Hook %s exited with %s', hook, rc)
+
+    @staticmethod
+    def __encode_value(key, value):
+        """Encode a value for storage in Consul, compressing and chunking it if it is too large to store as is.
+
+        Chunks are named by the hash of the value so they can be written before the manifest referencing them, readers
+        never see a manifest referencing chunks which do not exist yet.
+
+        :param key: Key to store the value under
+        :param value: Value as bytes
+        :return: Tuple of a list of tuples of chunk keys and values, and the value to store under key with its flags
+        """
+        if len(value) <= ENCODE_THRESHOLD:
+            return [], (value, 0)
+
+        digest = hashlib.sha256(value).hexdigest()
+        compressed = zlib.compress(value, 9)
+        chunks = [('{0}.chunks/{1}/{2}'.format(key, digest[:16], i // CHUNK_SIZE), compressed[i:i + CHUNK_SIZE])
+                  for i in range(0, len(compressed), CHUNK_SIZE)]
+
+        manifest = {
+            'encoding': 'zlib',
+            'size': len(value),
+            'sha256': digest,
+            'chunks': [k for k, _ in chunks],
+        }
+        return chunks, (json.dumps(manifest).encode('utf-8'), MANIFEST_FLAG)
+
+    @staticmethod
+    def __decode_values(values):
+        """Reassemble chunked values returned by a recursive get.
+
+        :param values: Values returned by a recursive get
+        :return: Values with manifests replaced by the values they describe, and chunks removed
+        """
+        by_key = {v['Key']: v for v in values}
+
+        ret = []
+        for value in values:
+            flags = value.get('Flags', 0)
+            if flags == CHUNK_FLAG:
+                continue
+
+            if flags == MANIFEST_FLAG:
+                try:
+                    manifest = json.loads(value['Value'].decode('utf-8'))
+                    decoded = zlib.decompress(b''.join(by_key[k]['Value'] for k in manifest['chunks']))
+                    if hashlib.sha256(decoded).hexdigest() != manifest['sha256']:
+                        raise ValueError('hash mismatch')
+                except (KeyError, TypeError, ValueError, zlib.error) as e:
+                    logger.error('Could not reassemble chunked consul key %s, skipping: %s', value['Key'], e)
+                    continue
 
-        # Write the contract keys first outside of transaction to avoid consul size limits
-        written = set()
+                value = dict(value, Value=decoded)
+
+            ret.append(value)
+
+        return ret
+
+    def __local_values(self, base_key, in_dir):
+        """Read the values to push from a directory of configuration files.
+
+        :param base_key: Key prefix to push under
+        :param in_dir: Directory containing configuration
+        :return: Dictionary of keys to encoded values
+        """
+        ret = {}
         for root, dirs, files in os.walk(in_dir):
             for file in files:
+                # Skip hidden files such as the compiler's artifact manifest
+                if file.startswith('.'):
+                    continue
+
                 key = base_key + os.path.splitext(file)[0]
                 filename = os.path.join(root, file)
 
@@ -96,7 +275,166 @@ class ConsulClient(object):
                     logger.error('Error parsing %s as json, skipping: %s', filename, e)
                     continue
 
-                # TODO: Restore transactional update, causing breakage in infrastructure
-                logger.info('Pushing contents of %s to consul', filename)
-                self.client.kv.put(key, json.dumps(value))
-                written.add(filename)
+                ret[key] = json.dumps(value).encode('utf-8')
+
+        return ret
+
+    def __remote_values(self, base_key):
+        """Fetch the current values under a key prefix in a single recursive query.
+
+        :param base_key: Key prefix to fetch
+        :return: Tuple of a dictionary of keys to tuples of their modify index and hash of their decoded value, and a
+            dictionary of chunked keys to the chunk keys their manifest references
+        """
+        index, values = self.client.kv.get(base_key, recurse=True)
+        values = values or []
+
+        chunks = {}
+        for v in values:
+            if v.get('Flags', 0) == MANIFEST_FLAG:
+                try:
+                    chunks[v['Key']] = json.loads(v['Value'].decode('utf-8'))['chunks']
+                except (KeyError, TypeError, ValueError):
+                    pass
+
+        decoded = {v['Key']: (v['ModifyIndex'], hashlib.sha256(v['Value'] or b'').hexdigest())
+                   for v in self.__decode_values(values)}
+        return decoded, chunks
+
+    @staticmethod
+    def __kv_operation(verb, key, value=None, index=None, flags=None):
+        """Build a KV operation for a transaction.
+
+        :param verb: Operation to perform, e.g. set, cas or delete
+        :param key: Key to operate on
+        :param value: Value as bytes, if setting
+        :param index: Modify index to check against, if using check-and-set
+        :param flags: Flags to store with the value, if setting
+        :return: Operation for the transaction payload
+        """
+        op = {'Verb': verb, 'Key': key}
+        if value is not None:
+            op['Value'] = base64.b64encode(value).decode('ascii')
+        if index is not None:
+            op['Index'] = index
+        if flags is not None:
+            op['Flags'] = flags
+
+        return {'KV': op}
+
+    @staticmethod
+    def __txn_batches(operations):
+        """Group KV operations into transactions within Consul's limits.
+
+        :param operations: List of KV operations
+        :return: List of lists of operations, one per transaction
+        """
+        ret = []
+        batch = []
+        size = 0
+        for op in operations:
+            op_size = len(json.dumps(op))
+            if batch and (len(batch) >= TXN_MAX_OPERATIONS or size + op_size > TXN_MAX_SIZE):
+                ret.append(batch)
+                batch = []
+                size = 0
+
+            batch.append(op)
+            size += op_size
+
+        if batch:
+            ret.append(batch)
+
+        return ret
+
+    def __apply_batch(self, batch):
+        """Apply a batch of KV operations in a transaction.
+
+        A single operation too large for a transaction, such as a value close to Consul's value size limit, is applied
+        with a plain KV put instead.
+
+        :param batch: List of KV operations
+        :return: True if all operations were applied, False if a check-and-set failed and none were applied
+        """
+        if len(batch) == 1 and len(json.dumps(batch[0])) > TXN_MAX_SIZE:
+            op = batch[0]['KV']
+            return self.client.kv.put(op['Key'], base64.b64decode(op['Value']), cas=op.get('Index'),
+                                      flags=op.get('Flags'))
+
+        try:
+            self.client.txn.put(batch)
+        except ClientError as e:
+            # A failed check-and-set rolls back the transaction with a 409
+            if not str(e).startswith('409'):
+                raise
+            return False
+
+        return True
+
+    def __apply_batches(self, operations):
+        """Apply KV operations in concurrent transactions.
+
+        :param operations: List of KV operations
+        :return: List of tuples of each batch of operations and whether it was applied
+        """
+        batches = self.__txn_batches(operations)
+        if not batches:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(PUSH_CONCURRENCY, len(batches))) as executor:
+            return list(zip(batches, executor.map(self.__apply_batch, batches)))
+
+    def push_config(self, community, in_dir):
+        """Push a set of configuration files from a directory into Consul.
+
+        Only values which differ from those in Consul are written, in transactions using check-and-set so concurrent
+        modifications are not lost. Large values are compressed and chunked.
+
+        :param community: Community to access
+        :param in_dir: Directory containing new configuration
+        :return: True if all changed values were written, False if some were modified concurrently
+        """
+        base_key = self.__base_key(community)
+
+        local = self.__local_values(base_key, in_dir)
+        remote, remote_chunks = self.__remote_values(base_key)
+
+        chunk_ops = []
+        value_ops = []
+        new_chunks = set()
+        for key, value in sorted(local.items()):
+            index, digest = remote.get(key, (0, None))
+            if hashlib.sha256(value).hexdigest() == digest:
+                logger.debug('Consul key %s is unchanged, skipping', key)
+                continue
+
+            chunks, (encoded, flags) = self.__encode_value(key, value)
+            logger.info('Pushing %s to consul%s', key, ' in {0} chunks'.format(len(chunks)) if chunks else '')
+
+            new_chunks.update(k for k, _ in chunks)
+            chunk_ops.extend(self.__kv_operation('set', k, v, flags=CHUNK_FLAG) for k, v in chunks)
+            value_ops.append(self.__kv_operation('cas', key, encoded, index=index, flags=flags))
+
+        logger.info('Pushing %s changed keys of %s', len(value_ops), len(local))
+
+        # Chunks are named by content, write them before the values referencing them
+        if not all(result for _, result in self.__apply_batches(chunk_ops)):
+            return False
+
+        ret = True
+        stale = set()
+        for batch, result in self.__apply_batches(value_ops):
+            keys = [op['KV']['Key'] for op in batch]
+            if result:
+                # Chunks of values we replaced are no longer referenced
+                for key in keys:
+                    stale.update(k for k in remote_chunks.get(key, []) if k not in new_chunks)
+            else:
+                logger.error('Consul keys %s were modified concurrently, not overwriting', ', '.join(keys))
+                ret = False
+
+        if stale:
+            logger.info('Removing %s unreferenced chunks', len(stale))
+            self.__apply_batches([self.__kv_operation('delete', k) for k in sorted(stale)])
+
+        return ret
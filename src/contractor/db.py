@@ -1,14 +1,21 @@
 import hashlib
+import json
 import logging
 
 from contractor.network import Chain
 from datetime import datetime
-from sqlalchemy import create_engine, Boolean, Column, DateTime, Enum, ForeignKey, JSON, LargeBinary, Integer, String
-from sqlalchemy.orm import relationship, scoped_session, sessionmaker
+from sqlalchemy import and_, create_engine, inspect, or_, Boolean, Column, DateTime, Enum, ForeignKey, func, Index, \
+    JSON, LargeBinary, Integer, MetaData, String, select, Table, true
+from sqlalchemy.orm import deferred, relationship, scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.exc import IntegrityError
 
 logger = logging.getLogger(__name__)
 
+BACKFILL_BATCH_SIZE = 500
+
+__latest_contracts_cache = {}
+
 Base = declarative_base()
 
 
@@ -17,6 +24,10 @@ class Deployment(Base):
     """
 
     __tablename__ = 'deployments'
+    __table_args__ = (
+        Index('ix_deployments_lookup', 'community', 'network', 'chain', 'succeeded', 'timestamp'),
+    )
+
     id = Column(Integer, primary_key=True)
     community = Column(String)
     network = Column(String)
@@ -30,7 +41,7 @@ class Deployment(Base):
     contracts = relationship('Contract', backref='deployment', cascade='all, delete-orphan')
 
     def __init__(self, community, network, network_id, chain, commit_hash=None, tree_dirty=None, succeeded=False,
-                 timestamp=datetime.utcnow()):
+                 timestamp=None):
         """Create a new deployment.
 
         :param community: Community that was deployed
@@ -40,7 +51,7 @@ class Deployment(Base):
         :param commit_hash: Commit hash of the contractor version used in this deploy
         :param tree_dirty: Was the contractor source tree dirty (does source match commit hash)
         :param succeeded: Did the deployment succeed
-        :param timestamp: Timestamp of deployment completion
+        :param timestamp: Timestamp of deployment completion, defaults to now
         """
         self.community = community
         self.network = network
@@ -49,67 +60,304 @@ class Deployment(Base):
         self.commit_hash = commit_hash
         self.tree_dirty = tree_dirty
         self.succeeded = succeeded
-        self.timestamp = timestamp
+        self.timestamp = timestamp if timestamp is not None else datetime.utcnow()
 
     def __repr__(self):
         """Return a human-readable representation of this deployment.
 
         :return: Human-readable representation of this deployment
         """
-        return '<Deployment {0}, {1}, {2}, {3}, {4]>'.format(self.community, self.network, self.chain, self.timestamp,
+        return '<Deployment {0}, {1}, {2}, {3}, {4}>'.format(self.community, self.network, self.chain, self.timestamp,
                                                              'success' if self.succeeded else 'failed')
 
 
+class Blob(Base):
+    """Database model for content shared between contracts, such as ABIs and bytecode, stored once by SHA-256 hash.
+    """
+
+    __tablename__ = 'blobs'
+    hash = Column(String(64), primary_key=True)
+    size = Column(Integer)
+    # Deferred so comparing and referencing blobs does not load their contents
+    data = deferred(Column(LargeBinary))
+
+    def __init__(self, data):
+        """Create a new blob.
+
+        :param data: Contents of the blob as bytes
+        """
+        self.hash = hashlib.sha256(data).hexdigest()
+        self.size = len(data)
+        self.data = data
+
+    def __repr__(self):
+        """Return a human-readable representation of this blob.
+
+        :return: Human-readable representation of this blob
+        """
+        return '<Blob {0}, {1} bytes>'.format(self.hash, self.size)
+
+
 class Contract(Base):
     """Database model for a contract.
     """
 
     __tablename__ = 'contracts'
+    __table_args__ = (
+        Index('ix_contracts_deployment_name', 'deployment_id', 'name'),
+    )
+
     id = Column(Integer, primary_key=True)
     name = Column(String)
     deployed = Column(Boolean)
     address = Column(String)
-    abi = Column(JSON(none_as_null=True))
-    bytecode = Column(LargeBinary)
+    abi_hash = Column(String(64), ForeignKey('blobs.hash'))
+    bytecode_hash = Column(String(64), ForeignKey('blobs.hash'))
     config = Column(JSON(none_as_null=True))
 
     deployment_id = Column(Integer, ForeignKey('deployments.id'))
 
-    def __init__(self, deployment, name, deployed, address, abi, bytecode, config):
+    abi_blob = relationship('Blob', foreign_keys=[abi_hash])
+    bytecode_blob = relationship('Blob', foreign_keys=[bytecode_hash])
+
+    def __init__(self, deployment, name, deployed, address, abi_blob, bytecode_blob, config):
         """Create a new contract.
 
         :param deployment: Deployment this contract is associated with
         :param name: Name of the contract
         :param deployed: Was this contract deployed
         :param address: Address of the deployed contract
-        :param abi: JSON ABI of the deployed contract
-        :param bytecode: Bytecode of the deployed contract
+        :param abi_blob: Blob containing the JSON ABI of the deployed contract, from store_json_blob
+        :param bytecode_blob: Blob containing the bytecode of the deployed contract, from store_blob
         :param config: Configuration used to deploy this contract
         """
         self.deployment_id = deployment.id
         self.name = name
         self.deployed = deployed
         self.address = address
-        self.abi = abi
-        self.bytecode = bytecode
+        self.abi_blob = abi_blob
+        self.bytecode_blob = bytecode_blob
         self.config = config
 
-    def bytecode_hash(self):
-        """Return a SHA-256 hash of the bytecode.
+    @property
+    def abi(self):
+        """JSON ABI of the contract, loaded from its blob.
 
-        :return: SHA-256 hash of the bytecode
+        :return: ABI of the contract, or None if not recorded
         """
-        return hashlib.sha256(self.bytecode)
+        if self.abi_blob is None:
+            return None
+
+        return json.loads(self.abi_blob.data.decode('utf-8'))
+
+    @property
+    def bytecode(self):
+        """Bytecode of the contract, loaded from its blob.
+
+        :return: Bytecode of the contract, or None if not recorded
+        """
+        if self.bytecode_blob is None:
+            return None
+
+        return self.bytecode_blob.data
 
     def __repr__(self):
         """Return a human-readable representation of this contract.
 
         :return: Human-readable representation of this contract
         """
-        return '<Contract {0}, {1}, {2}, {3}>'.format(self.name, self.bytecode_hash(), self.address,
+        return '<Contract {0}, {1}, {2}, {3}>'.format(self.name, self.bytecode_hash, self.address,
                                                       'deployed' if self.deployed else 'preexisting')
 
 
+def store_blob(session, data):
+    """Get the blob with the given contents, adding it to the database if it is not already stored.
+
+    :param session: Session to interact with the database
+    :param data: Contents of the blob as bytes
+    :return: Blob with the given contents
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    blob = session.query(Blob).get(digest)
+    if blob is not None:
+        return blob
+
+    # Another deployer may store the same blob at once, so insert in a savepoint which can be rolled back alone. The
+    # savepoint is flushed, so later lookups in this transaction find the blob rather than adding a duplicate.
+    try:
+        with session.begin_nested():
+            blob = Blob(data)
+            session.add(blob)
+    except IntegrityError:
+        logger.debug('Blob %s was stored concurrently', digest)
+        blob = session.query(Blob).get(digest)
+
+    return blob
+
+
+def store_json_blob(session, obj):
+    """Get the blob with the canonical JSON encoding of an object, adding it to the database if needed.
+
+    :param session: Session to interact with the database
+    :param obj: Object to encode
+    :return: Blob with the encoded object
+    """
+    return store_blob(session, json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+
+class SchemaVersion(Base):
+    """Database model for a schema migration which has been applied.
+    """
+
+    __tablename__ = 'schema_versions'
+    version = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime)
+
+
+def __create_indexes(connection, table, names):
+    """Create indexes declared on a model which do not yet exist in the database.
+
+    :param connection: Connection to the database
+    :param table: Table the indexes are declared on
+    :param names: Names of the indexes to create
+    :return: None
+    """
+    existing = {index['name'] for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name in names and index.name not in existing:
+            logger.info('Creating index %s on %s', index.name, table.name)
+            index.create(bind=connection)
+
+
+def __add_lookup_indexes(connection):
+    """Migration adding indexes for finding deployments and the contracts within them.
+
+    :param connection: Connection to the database
+    :return: None
+    """
+    __create_indexes(connection, Deployment.__table__, {'ix_deployments_lookup'})
+    __create_indexes(connection, Contract.__table__, {'ix_contracts_deployment_name'})
+
+
+def __add_columns(connection, table, names):
+    """Add columns declared on a model which do not yet exist in the database.
+
+    :param connection: Connection to the database
+    :param table: Table the columns are declared on
+    :param names: Names of the columns to add
+    :return: None
+    """
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in names and column.name not in existing:
+            logger.info('Adding column %s to %s', column.name, table.name)
+            connection.execute('ALTER TABLE {0} ADD COLUMN {1} {2}'.format(
+                table.name, column.name, column.type.compile(dialect=connection.dialect)))
+
+
+def __move_contents_to_blobs(connection):
+    """Migration moving contract ABIs and bytecode into content-addressed blobs.
+
+    The old columns are cleared rather than dropped, as not all databases support dropping columns.
+
+    :param connection: Connection to the database
+    :return: None
+    """
+    __add_columns(connection, Contract.__table__, {'abi_hash', 'bytecode_hash'})
+    if not {'abi', 'bytecode'} <= {column['name'] for column in inspect(connection).get_columns('contracts')}:
+        return
+
+    # The old columns are no longer part of the model
+    contracts = Table('contracts', MetaData(), Column('id', Integer), Column('abi', JSON(none_as_null=True)),
+                      Column('bytecode', LargeBinary), Column('abi_hash', String(64)),
+                      Column('bytecode_hash', String(64)))
+    blobs = Blob.__table__
+    pending = and_(contracts.c.abi_hash.is_(None), contracts.c.bytecode_hash.is_(None),
+                   or_(contracts.c.abi.isnot(None), contracts.c.bytecode.isnot(None)))
+
+    moved = 0
+    while True:
+        rows = connection.execute(select([contracts.c.id, contracts.c.abi, contracts.c.bytecode]).where(
+            pending).order_by(contracts.c.id).limit(BACKFILL_BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+
+        for contract_id, abi, bytecode in rows:
+            hashes = {}
+            for key, data in (('abi_hash', abi), ('bytecode_hash', bytecode)):
+                if data is None:
+                    continue
+                if key == 'abi_hash':
+                    data = json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+                digest = hashlib.sha256(data).hexdigest()
+                if connection.execute(select([blobs.c.hash]).where(blobs.c.hash == digest)).scalar() is None:
+                    connection.execute(blobs.insert(), {'hash': digest, 'size': len(data), 'data': data})
+                hashes[key] = digest
+
+            values = dict(hashes, abi=None, bytecode=None)
+            connection.execute(contracts.update().where(contracts.c.id == contract_id).values(**values))
+
+        moved += len(rows)
+        logger.info('Moved contents of %s contracts to blobs', moved)
+
+
+# Migrations for databases created by previous versions, in order, the schema version is the number applied
+MIGRATIONS = (
+    __add_lookup_indexes,
+    __move_contents_to_blobs,
+)
+
+
+def schema_version(connection):
+    """Get the schema version of a database.
+
+    :param connection: Connection to the database
+    :return: Number of migrations which have been applied
+    """
+    if not connection.dialect.has_table(connection, SchemaVersion.__tablename__):
+        return 0
+
+    return connection.execute(select([func.max(SchemaVersion.version)])).scalar() or 0
+
+
+def __record_schema_version(connection, version):
+    """Record that the database has been migrated to a schema version.
+
+    :param connection: Connection to the database
+    :param version: Schema version
+    :return: None
+    """
+    connection.execute(SchemaVersion.__table__.insert(), {'version': version, 'timestamp': datetime.utcnow()})
+
+
+def migrate(engine):
+    """Create any missing tables and bring an existing database up to the current schema.
+
+    :param engine: SQLAlchemy engine for the database
+    :return: Number of migrations applied
+    """
+    with engine.begin() as connection:
+        fresh = not connection.dialect.has_table(connection, Deployment.__tablename__)
+        version = schema_version(connection)
+        Base.metadata.create_all(bind=connection)
+
+        # New databases are created with the current schema
+        if fresh:
+            __record_schema_version(connection, len(MIGRATIONS))
+            return 0
+
+    applied = 0
+    for i, migration in enumerate(MIGRATIONS[version:], version + 1):
+        logger.info('Migrating database to schema version %s', i)
+        with engine.begin() as connection:
+            migration(connection)
+            __record_schema_version(connection, i)
+        applied += 1
+
+    return applied
+
+
 def connect(db_uri):
     """Connect to a database to record deployments.
 
@@ -119,6 +367,128 @@ def connect(db_uri):
     engine = create_engine(db_uri, convert_unicode=True)
     session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
     Base.query = session.query_property()
-    Base.metadata.create_all(bind=engine)
+
+    applied = migrate(engine)
+    if applied:
+        logger.info('Applied %s database migrations', applied)
 
     return session
+
+
+def __latest_deployment_query(session, community, network, chain, *entities):
+    """Build a query for the most recent successful deployment of a community.
+
+    :param session: Session to query
+    :param community: Community that was deployed
+    :param network: Name of the network deployed to
+    :param chain: Chain deployed to
+    :param entities: Entities to query for, defaults to the Deployment
+    :return: Query limited to the latest successful deployment
+    """
+    return session.query(*(entities or (Deployment,))).filter(
+        Deployment.community == community,
+        Deployment.network == network,
+        Deployment.chain == chain,
+        Deployment.succeeded == true(),
+    ).order_by(Deployment.timestamp.desc()).limit(1)
+
+
+def latest_deployment(session, community, network, chain):
+    """Find the most recent successful deployment of a community.
+
+    :param session: Session to query
+    :param community: Community that was deployed
+    :param network: Name of the network deployed to
+    :param chain: Chain deployed to
+    :return: Latest successful Deployment, or None if there is none
+    """
+    return __latest_deployment_query(session, community, network, chain).first()
+
+
+def latest_contracts(session, community, network, chain):
+    """Find the addresses and ABIs of the contracts in the most recent successful deployment of a community.
+
+    Results are cached by deployment, as deployments are not modified once they have succeeded. Only the id of the
+    latest deployment is queried on a cache hit, so newer deployments are picked up.
+
+    :param session: Session to query
+    :param community: Community that was deployed
+    :param network: Name of the network deployed to
+    :param chain: Chain deployed to
+    :return: Dictionary of contract names to tuples of address and ABI, or None if there is no such deployment
+    """
+    latest = __latest_deployment_query(session, community, network, chain, Deployment.id).scalar()
+    if latest is None:
+        return None
+
+    key = (str(session.bind.url), latest)
+    contracts = __latest_contracts_cache.get(key)
+    if contracts is None:
+        rows = session.query(Contract.name, Contract.address, Blob.data).join(
+            Blob, Contract.abi_hash == Blob.hash
+        ).filter(
+            Contract.deployment_id == latest,
+            Contract.address.isnot(None),
+        ).all()
+
+        # Deployments without contracts are not cached, so callers can wait for them to be recorded
+        contracts = {name: (address, json.loads(abi.decode('utf-8'))) for name, address, abi in rows}
+        if not contracts:
+            return None
+
+        __latest_contracts_cache[key] = contracts
+
+    return contracts
+
+
+def contract_history(session, community, network, chain, name, limit=None, offset=0):
+    """Find the versions of a contract recorded in successful deployments of a community, newest first.
+
+    :param session: Session to query
+    :param community: Community that was deployed
+    :param network: Name of the network deployed to
+    :param chain: Chain deployed to
+    :param name: Name of the contract
+    :param limit: Maximum number of contracts to return, or None for all
+    :param offset: Number of contracts to skip, for pagination
+    :return: List of Contracts, the deployment of each is available as its deployment attribute
+    """
+    query = session.query(Contract).join(Contract.deployment).filter(
+        Deployment.community == community,
+        Deployment.network == network,
+        Deployment.chain == chain,
+        Deployment.succeeded == true(),
+        Contract.name == name,
+    ).order_by(Deployment.timestamp.desc(), Contract.id.desc())
+
+    return query.offset(offset).limit(limit).all()
+
+
+def deployments_between(session, community, start=None, end=None, network=None, chain=None, succeeded=None,
+                        limit=None, offset=0):
+    """Find deployments of a community made in a time range, newest first.
+
+    :param session: Session to query
+    :param community: Community that was deployed
+    :param start: Earliest timestamp to include, or None for no lower bound
+    :param end: Timestamp to include deployments before, or None for no upper bound
+    :param network: Name of the network deployed to, or None for any network
+    :param chain: Chain deployed to, or None for any chain
+    :param succeeded: Only include deployments which did or did not succeed, or None for both
+    :param limit: Maximum number of deployments to return, or None for all
+    :param offset: Number of deployments to skip, for pagination
+    :return: List of Deployments
+    """
+    query = session.query(Deployment).filter(Deployment.community == community)
+    if network is not None:
+        query = query.filter(Deployment.network == network)
+    if chain is not None:
+        query = query.filter(Deployment.chain == chain)
+    if succeeded is not None:
+        query = query.filter(Deployment.succeeded == succeeded)
+    if start is not None:
+        query = query.filter(Deployment.timestamp >= start)
+    if end is not None:
+        query = query.filter(Deployment.timestamp < end)
+
+    return query.order_by(Deployment.timestamp.desc(), Deployment.id.desc()).offset(offset).limit(limit).all()
@@ -3,7 +3,7 @@ import logging
 import os
 import re
 
-from contractor.db import Deployment, Contract
+from contractor.db import Deployment, Contract, latest_contracts, store_blob, store_json_blob
 from contractor.git import get_git_status
 from hexbytes import HexBytes
 
@@ -43,7 +43,8 @@ class Deployer(object):
     """Class for recording contract deployments and interacting with deployed contracts.
     """
 
-    def __init__(self, community, network, artifactsdir, record_git_status=False, session=None):
+    def __init__(self, community, network, artifactsdir, record_git_status=False, session=None,
+                 record_deployment=True):
         """Create a new Deployer.
 
         :param community: Community this deployment is for
@@ -51,6 +52,7 @@ class Deployer(object):
         :param artifactsdir: Directory containing compiled contracts to deploy
         :param record_git_status: Should we record the Git status of the source tree in our deployment
         :param session: Session to interact with a database to record deployments to
+        :param record_deployment: Should we record a new deployment, False to only read previous deployments
         """
         self.__community = community
         self.__network = network
@@ -60,7 +62,8 @@ class Deployer(object):
         self.deployment = None
 
         self.__scan_artifacts(artifactsdir)
-        self.__record_deployment(record_git_status, artifactsdir)
+        if record_deployment:
+            self.__record_deployment(record_git_status, artifactsdir)
 
     def __scan_artifacts(self, artifact_dir):
         """Find all valid contract JSON artifacts in a directory.
@@ -70,6 +73,10 @@ class Deployer(object):
         """
         self.artifacts = {}
         for filename in os.listdir(artifact_dir):
+            # Skip hidden files such as the compiler's artifact manifest
+            if filename.startswith('.'):
+                continue
+
             with open(os.path.join(artifact_dir, filename), 'r') as f:
                 j = json.load(f)
 
@@ -115,8 +122,10 @@ class Deployer(object):
             contract_obj = self.contracts[name]
             logger.info('Recording contract %s:%s in database', name, contract_obj.address)
 
-            contract = Contract(self.deployment, name, deployed, contract_obj.address, contract_obj.abi,
-                                contract_obj.bytecode, self.__network.contract_config.get(name, {}))
+            abi = store_json_blob(self.__session, contract_obj.abi)
+            bytecode = store_blob(self.__session, bytes(contract_obj.bytecode))
+            contract = Contract(self.deployment, name, deployed, contract_obj.address, abi, bytecode,
+                                self.__network.contract_config.get(name, {}))
             self.__session.add(contract)
             self.__session.commit()
 
@@ -131,8 +140,9 @@ class Deployer(object):
             for name in nondeployed:
                 logger.info('Recording non-deployed contract %s in database', name)
 
-                abi = self.artifacts[name]['abi']
-                bytecode = HexBytes(self.artifacts[name]['evm']['bytecode']['object'])
+                artifact = self.artifacts[name]
+                abi = store_json_blob(self.__session, artifact['abi'])
+                bytecode = store_blob(self.__session, bytes(HexBytes(artifact['evm']['bytecode']['object'])))
                 contract = Contract(self.deployment, name, False, None, abi, bytecode,
                                     self.__network.contract_config.get(name, {}))
                 self.__session.add(contract)
@@ -249,3 +259,26 @@ class Deployer(object):
         for key, address in deployment_results.items():
             if key.endswith('_address'):
                 self.at(snake_case_to_camel_case('_'.join(key.split('_')[:-1])), address)
+
+    def load_from_db(self, community=None, network=None):
+        """Load the addresses and ABIs of the latest successful deployment from the database.
+
+        :param community: Community to load, defaults to the community of this deployer
+        :param network: Name of the network to load, defaults to the network of this deployer
+        :return: True if a successful deployment was found, else False
+        """
+        if self.__session is None:
+            raise ValueError('No database session to load deployments from')
+
+        community = community or self.__community
+        network = network or self.__network.name
+        logger.info('Loading latest deployment of %s on %s from database', community, network)
+
+        contracts = latest_contracts(self.__session, community, network, self.__network.chain)
+        if contracts is None:
+            return False
+
+        for name, (address, abi) in contracts.items():
+            self.contracts[name] = self.__network.w3.eth.contract(address=address, abi=abi)
+
+        return True
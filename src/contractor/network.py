@@ -1,3 +1,4 @@
+import json
 import logging
 import string
 import time
@@ -14,13 +15,26 @@ from trezorlib.tools import parse_path
 from trezorlib.transport import enumerate_devices, get_transport
 from trezorlib.ui import ClickUI
 from web3 import Web3, HTTPProvider
-from web3.middleware import geth_poa_middleware
+from web3.middleware import combine_middlewares, geth_poa_middleware
+from web3.utils.request import make_post_request
 
 from contractor.exceptions import TransactionFailedError
 
 logger = logging.getLogger(__name__)
 
 BLOCKS_TO_WAIT = 5
+DEV_MODE_BLOCK_TIME = 1
+# Clients which can mine many blocks in a single call, by client version prefix
+DEV_MODE_MINE_METHODS = {
+    'EthereumTester': 'eth_tester_mine',
+    'HardhatNetwork': 'hardhat_mine',
+    'anvil': 'anvil_mine',
+}
+# Clients which can mine a single block per call with evm_mine, by client version prefix
+DEV_MODE_EVM_MINE_CLIENTS = ('EthereumJS TestRPC', 'Ganache')
+BATCH_BASE_GAS = 100000
+# Maximum number of JSON-RPC requests sent in a single batch
+RPC_BATCH_SIZE = 100
 ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
 
 
@@ -51,7 +65,7 @@ class Network(object):
     """
 
     def __init__(self, name, eth_uri, network_id, gas_limit, gas_price, gas_estimate_multiplier, timeout,
-                 contract_config, chain):
+                 contract_config, chain, dev_mode=False):
         """Create a new network.
 
         :param name: Name of the network
@@ -63,6 +77,7 @@ class Network(object):
         :param timeout: Timeout for RPC calls on this network
         :param contract_config: Configuration for contracts on this network
         :param chain: Is this network the homechain or sidechain for this deployment
+        :param dev_mode: Is this a development chain where we can mine blocks on demand instead of waiting
         """
         self.name = name
         self.eth_uri = eth_uri
@@ -73,6 +88,7 @@ class Network(object):
         self.timeout = timeout
         self.contract_config = contract_config
         self.chain = chain
+        self.dev_mode = dev_mode
 
         self.nonce = 0
         self.w3 = None
@@ -80,10 +96,12 @@ class Network(object):
         self.priv_key = None
         self.trezor = None
         self.address_n = None
+        self.__mine_method = None
+        self.__mine_method_detected = False
 
     @classmethod
     def from_web3(cls, name, w3, priv_key, gas_limit, gas_price, gas_estimate_multiplier, timeout, contract_config,
-                  chain):
+                  chain, dev_mode=False):
         """Construct a network based on an already-configured Web3 instance.
 
         :param name: Name of the network
@@ -95,9 +113,11 @@ class Network(object):
         :param timeout: Timeout for RPC calls on this network
         :param contract_config: Configuration for contracts on this network
         :param chain: Is this network the homechain or sidechain for this deployment
+        :param dev_mode: Is this a development chain where we can mine blocks on demand instead of waiting
         :return: New network based on provided Web3 instance
         """
-        ret = cls(name, None, None, gas_limit, gas_price, gas_estimate_multiplier, timeout, contract_config, chain)
+        ret = cls(name, None, None, gas_limit, gas_price, gas_estimate_multiplier, timeout, contract_config, chain,
+                  dev_mode=dev_mode)
         ret.w3 = w3
         ret.priv_key = priv_key
         ret.address = w3.eth.account.privateKeyToAccount(priv_key).address
@@ -165,12 +185,9 @@ class Network(object):
         if self.network_id != int(self.w3.version.network):
             raise Exception('Connected to network with incorrect network id')
 
-        cur_block = start_block = self.w3.eth.blockNumber
-        while cur_block < BLOCKS_TO_WAIT or cur_block - start_block < BLOCKS_TO_WAIT:
-            logger.info('Waiting for blocks to advance')
-            time.sleep(1)
-
-            cur_block = self.w3.eth.blockNumber
+        start_block = self.w3.eth.blockNumber
+        logger.info('Waiting for blocks to advance')
+        self.wait_for_block(max(BLOCKS_TO_WAIT, start_block + BLOCKS_TO_WAIT))
 
         while self.w3.eth.getBlock('latest').gasLimit < self.gas_limit:
             logger.info('Waiting for block gas limit to increase to minimum')
@@ -231,6 +248,15 @@ class Network(object):
         """
         return self.w3.eth.getCode(addr) != '0x'
 
+    def max_batch_size(self, gas_per_item, base_gas=BATCH_BASE_GAS):
+        """Determine how many items of a batched call fit in a single transaction on this network.
+
+        :param gas_per_item: Approximate gas cost of processing a single item in the batch
+        :param base_gas: Fixed gas cost of the transaction regardless of the number of items
+        :return: Maximum number of items to include in a single transaction
+        """
+        return max(1, (self.gas_limit - base_gas) // gas_per_item)
+
     def txopts(self, increment_nonce=True):
         """Default transaction options for this network.
 
@@ -314,6 +340,47 @@ class Network(object):
         """
         return self.w3.eth.blockNumber
 
+    def batch_request(self, method, params_list):
+        """Make many calls to one JSON-RPC method, sent as batches of requests when connected over HTTP.
+
+        Results are formatted as web3 would format the result of a single call.
+
+        :param method: JSON-RPC method to call
+        :param params_list: List of parameter lists, one per call, in their JSON-RPC form
+        :return: List of results, in the same order as params_list
+        """
+        params_list = list(params_list)
+        provider = next(iter(self.w3.providers), None)
+        if not isinstance(provider, HTTPProvider):
+            return [self.w3.manager.request_blocking(method, params) for params in params_list]
+
+        results = []
+        for i in range(0, len(params_list), RPC_BATCH_SIZE):
+            chunk = params_list[i:i + RPC_BATCH_SIZE]
+            batch = [{'jsonrpc': '2.0', 'method': method, 'params': params, 'id': request_id}
+                     for request_id, params in enumerate(chunk)]
+            raw_response = make_post_request(provider.endpoint_uri, json.dumps(batch).encode('utf-8'),
+                                             **provider.get_request_kwargs())
+
+            # Responses may arrive in any order, and a node without batch support responds with a single error
+            responses = json.loads(raw_response.decode('utf-8'))
+            if not isinstance(responses, list):
+                raise ValueError(responses.get('error', responses))
+            responses = {response.get('id'): response for response in responses}
+
+            for request_id, params in enumerate(chunk):
+                response = responses.get(request_id, {'error': 'No response to batched request'})
+                # Pass each response through web3's middlewares for formatting
+                request_fn = combine_middlewares(tuple(self.w3.manager.middleware_stack), self.w3,
+                                                 lambda method, params, response=response: response)
+                response = request_fn(method, params)
+                if 'error' in response:
+                    raise ValueError(response['error'])
+
+                results.append(response['result'])
+
+        return results
+
     def wait_for_transaction(self, txhash):
         """Wait for a transaction to be mined (blocking).
 
@@ -388,14 +455,78 @@ class Network(object):
         receipt = self.wait_and_check_transaction(txhash)
         return event.processReceipt(receipt)
 
+    def __detect_mine_method(self):
+        """Determine how to mine blocks on demand on a development chain.
+
+        :return: Name of the RPC method used to mine blocks, or None if blocks cannot be mined on demand
+        """
+        client = self.w3.version.node
+        logger.info('Detecting dev mode support for client %s', client)
+
+        for prefix, method in DEV_MODE_MINE_METHODS.items():
+            if client.startswith(prefix):
+                return method
+
+        if client.startswith(DEV_MODE_EVM_MINE_CLIENTS):
+            return 'evm_mine'
+
+        # Other clients may mine a single block per call like Ganache, check that they support the evm_* methods by
+        # advancing time by nothing, as probing evm_mine would mine a block
+        try:
+            self.w3.manager.request_blocking('evm_increaseTime', [0])
+            return 'evm_mine'
+        except ValueError:
+            logger.warning('Client %s does not support evm_mine, disabling dev mode', client)
+            return None
+
+    def __mine_blocks(self, count):
+        """Mine blocks on a development chain, advancing time to match.
+
+        :param count: Number of blocks to mine
+        :return: True if blocks were mined, else False
+        """
+        if not self.__mine_method_detected:
+            self.__mine_method = self.__detect_mine_method()
+            self.__mine_method_detected = True
+
+        if self.__mine_method is None:
+            return False
+
+        logger.info('Dev mode, mining %s blocks', count)
+        if self.__mine_method == 'evm_mine':
+            self.w3.manager.request_blocking('evm_increaseTime', [count * DEV_MODE_BLOCK_TIME])
+            for _ in range(count):
+                self.w3.manager.request_blocking('evm_mine', [])
+        elif self.__mine_method == 'eth_tester_mine':
+            # eth_tester exposes mine_blocks(num_blocks) as evm_mine
+            self.w3.manager.request_blocking('evm_mine', [count])
+        else:
+            self.w3.manager.request_blocking(self.__mine_method, [hex(count), hex(DEV_MODE_BLOCK_TIME)])
+
+        return True
+
+    def wait_for_block(self, block_number):
+        """Wait for the network to reach a given block number (blocking).
+
+        In dev mode blocks are mined on demand instead of waiting for them to be produced.
+
+        :param block_number: Block number to wait for
+        :return: None
+        """
+        current = self.block_number()
+        if current < block_number:
+            logger.info('Waiting for block %s, %s blocks remaining', block_number, block_number - current)
+
+            if self.dev_mode and self.__mine_blocks(block_number - current):
+                current = self.block_number()
+
+        while current < block_number:
+            time.sleep(1)
+            current = self.block_number()
+
     def wait_for_blocks(self, duration):
         """Wait for a certain number of blocks to pass (blocking
 
         :param duration: Number of blocks to wait
         """
-        start = current = self.block_number()
-        end = start + duration
-        logger.info('Waiting %s blocks', duration)
-        while current < end:
-            time.sleep(1)
-            current = self.block_number()
+        self.wait_for_block(self.block_number() + duration)
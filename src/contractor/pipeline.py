@@ -0,0 +1,212 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Items each stage may have waiting before upstream stages block
+QUEUE_SIZE = 8
+# Number of recent items stage latency is averaged over
+LATENCY_WINDOW = 100
+# Seconds between checks for an aborted pipeline while blocked on a queue
+POLL_TIMEOUT = 0.1
+
+
+class StageMetrics(object):
+    """Latency and backpressure of a pipeline stage, safe to read while another thread records.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        """Create new metrics.
+
+        :param window: Number of recent items to average latency over
+        """
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+        self.blocked = 0.0
+        self.__lock = threading.Lock()
+
+    def record(self, latency):
+        """Record the time taken to handle an item.
+
+        :param latency: Seconds taken
+        :return: None
+        """
+        with self.__lock:
+            self.latencies.append(latency)
+            self.count += 1
+
+    @property
+    def latency(self):
+        """Mean time taken to handle recent items.
+
+        :return: Latency in seconds
+        """
+        with self.__lock:
+            return sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+
+
+class Stage(object):
+    """A stage of a pipeline, handling items from a bounded queue on its own thread.
+    """
+
+    def __init__(self, name, fn, queue_size=QUEUE_SIZE):
+        """Create a new stage.
+
+        :param name: Name of the stage, for metrics
+        :param fn: Function called with each item, returning the item to pass to the next stage
+        :param queue_size: Number of items which may wait for this stage before upstream stages block
+        """
+        self.name = name
+        self.fn = fn
+        self.queue = queue.Queue(queue_size)
+        self.metrics = StageMetrics()
+
+    @property
+    def depth(self):
+        """Number of items waiting for this stage.
+
+        :return: Queue depth
+        """
+        return self.queue.qsize()
+
+
+class Pipeline(object):
+    """Pass items from a source through stages running concurrently, in order.
+
+    The source is consumed on the calling thread as the ingest stage. Queues between stages are bounded, so a slow stage
+    blocks the stages before it instead of letting work pile up. If any stage fails, the pipeline is aborted and the
+    error is raised from run.
+    """
+
+    __STOP = object()
+
+    def __init__(self, stages):
+        """Create a new pipeline.
+
+        :param stages: List of stages, in the order items pass through them
+        """
+        self.stages = stages
+        self.ingest = StageMetrics()
+        self.error = None
+        self.__aborted = threading.Event()
+
+    def run(self, source):
+        """Pass every item of a source through the pipeline (blocking).
+
+        :param source: Iterable of items to pass to the first stage, None items are not passed on
+        :return: None
+        """
+        self.__aborted.clear()
+        threads = [threading.Thread(target=self.__work, args=(i,), name='pipeline-' + stage.name, daemon=True)
+                   for i, stage in enumerate(self.stages)]
+        for thread in threads:
+            thread.start()
+
+        items = iter(source)
+        try:
+            while not self.__aborted.is_set():
+                start = time.time()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+
+                # Sources yield None while waiting for items, so a failed stage is noticed promptly
+                if item is None:
+                    continue
+
+                self.ingest.record(time.time() - start)
+                self.__put(self.stages[0], item, self.ingest)
+        except BaseException:
+            self.__aborted.set()
+            raise
+        finally:
+            self.__put(self.stages[0], self.__STOP)
+            for thread in threads:
+                thread.join()
+            if hasattr(items, 'close'):
+                items.close()
+
+        if self.error is not None:
+            raise self.error
+
+    def summary(self):
+        """Describe the latency, queue depth and backpressure of each stage.
+
+        :return: String containing stage metrics
+        """
+        parts = ['ingest {:.1f}ms (blocked {:.1f}s)'.format(self.ingest.latency * 1000, self.ingest.blocked)]
+        for stage in self.stages:
+            parts.append('{} {}/{} {:.1f}ms (blocked {:.1f}s)'.format(
+                stage.name, stage.depth, stage.queue.maxsize, stage.metrics.latency * 1000, stage.metrics.blocked))
+
+        return ', '.join(parts)
+
+    def __put(self, stage, item, metrics=None):
+        """Put an item on a stage's queue, blocking while it is full unless the pipeline is aborted.
+
+        :param stage: Stage to pass the item to
+        :param item: Item to pass
+        :param metrics: Metrics of the stage passing the item, to record time spent blocked
+        :return: True if the item was passed, False if the pipeline was aborted
+        """
+        start = time.time()
+        try:
+            while True:
+                try:
+                    stage.queue.put(item, timeout=POLL_TIMEOUT)
+                    return True
+                except queue.Full:
+                    if self.__aborted.is_set():
+                        return False
+        finally:
+            if metrics is not None:
+                metrics.blocked += time.time() - start
+
+    def __get(self, stage):
+        """Get the next item from a stage's queue, blocking while it is empty unless the pipeline is aborted.
+
+        :param stage: Stage to get an item for
+        :return: The next item, or the stop sentinel if the pipeline is finished or aborted
+        """
+        while not self.__aborted.is_set():
+            try:
+                return stage.queue.get(timeout=POLL_TIMEOUT)
+            except queue.Empty:
+                continue
+
+        return self.__STOP
+
+    def __work(self, index):
+        """Handle items for a stage until the pipeline is finished or aborted, run on the stage's thread.
+
+        :param index: Index of the stage
+        :return: None
+        """
+        stage = self.stages[index]
+        downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            item = self.__get(stage)
+            if item is self.__STOP:
+                break
+
+            start = time.time()
+            try:
+                result = stage.fn(item)
+            except Exception as e:
+                logger.exception('Pipeline stage %s failed', stage.name)
+                if self.error is None:
+                    self.error = e
+                self.__aborted.set()
+                break
+
+            stage.metrics.record(time.time() - start)
+            if downstream is not None and not self.__put(downstream, result, stage.metrics):
+                break
+
+        if downstream is not None:
+            self.__put(downstream, self.__STOP)
@@ -1,10 +1,12 @@
 import logging
 
 from contractor.steps import Step
+from contractor.util import chunks
 
 logger = logging.getLogger(__name__)
 
 CONTRACT_NAME = 'BountyRegistry'
+ADD_ARBITER_GAS_PER_ARBITER = 30000
 
 
 class BountyRegistry(Step):
@@ -39,11 +41,12 @@ class BountyRegistry(Step):
         txhash = deployer.transact(deployer.contracts['ArbiterStaking'].functions.setBountyRegistry(contract.address))
         network.wait_and_check_transaction(txhash)
 
+        block_number = network.block_number()
         txhashes = []
-        for arbiter in arbiters:
-            logger.info('Adding %s as an arbiter', arbiter)
+        for group in chunks(arbiters, network.max_batch_size(ADD_ARBITER_GAS_PER_ARBITER)):
+            logger.info('Adding %s as arbiters', ', '.join(group))
             txhashes.append(deployer.transact(
-                deployer.contracts['BountyRegistry'].functions.addArbiter(arbiter, network.block_number())))
+                deployer.contracts['BountyRegistry'].functions.addArbiters(group, block_number)))
 
         network.wait_and_check_transactions(txhashes)
 
@@ -52,15 +55,21 @@ class BountyRegistry(Step):
 
         :param network: Network being deployed to
         :param deployer: Deployer for tearing down this contract and transacting resolving in progress tasks
-        :return: None
+        :return: Block number after which all bounties posted before deprecation have resolved
         """
+        bounty_registry = deployer.contracts['BountyRegistry']
         contract_config = network.contract_config.get(CONTRACT_NAME, {})
         # This is True when we don't want to trigger arbiter withdrawals
         rollover = contract_config.get('rollover', False)
-        txhash = deployer.transact(deployer.contracts['BountyRegistry'].functions.deprecate(rollover))
-
-        network.wait_and_check_transaction(txhash)
 
-        revealWindow = deployer.contracts['BountyRegistry'].functions.assertionRevealWindow().call()
-        max_duration = deployer.contracts['BountyRegistry'].functions.MAX_DURATION().call()
-        network.wait_for_blocks((revealWindow + max_duration) * 2)
+        deprecated_block = bounty_registry.functions.deprecatedBlock().call()
+        if deprecated_block > 0:
+            logger.warning('BountyRegistry already deprecated at block %s', deprecated_block)
+        else:
+            txhash = deployer.transact(bounty_registry.functions.deprecate(rollover))
+            receipt = network.wait_and_check_transaction(txhash)
+            deprecated_block = receipt.blockNumber
+
+        revealWindow = bounty_registry.functions.assertionRevealWindow().call()
+        max_duration = bounty_registry.functions.MAX_DURATION().call()
+        return deprecated_block + (revealWindow + max_duration) * 2
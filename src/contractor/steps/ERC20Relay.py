@@ -77,12 +77,28 @@ class ERC20Relay(Step):
 
         :param network: Network being deployed to
         :param deployer: deployer for deprecating and transacting resolving in progress tasks
-        :return: None
+        :return: Block number after which the vote window of the last bounty posted before deprecation has closed
         """
-        # Wait until the vote window closed (BountyRegistry already waited on others)
-        voteWindow = deployer.contracts['BountyRegistry'].functions.arbiterVoteWindow().call()
-        network.wait_for_blocks(int(voteWindow * 1.2))
+        bounty_registry = deployer.contracts['BountyRegistry']
+        voteWindow = bounty_registry.functions.arbiterVoteWindow().call()
+
+        deprecated_block = bounty_registry.functions.deprecatedBlock().call()
+        if deprecated_block == 0:
+            logger.warning('BountyRegistry is not deprecated, waiting a full vote window from now')
+            return network.block_number() + int(voteWindow * 1.2)
+
+        # A bounty posted just before deprecation is voted on until its duration, reveal and vote windows have passed
+        revealWindow = bounty_registry.functions.assertionRevealWindow().call()
+        max_duration = bounty_registry.functions.MAX_DURATION().call()
+        return deprecated_block + revealWindow + max_duration + int(voteWindow * 1.2)
+
+    def finalize_deactivate(self, network, deployer):
+        """Finish this deactivate step once all deactivation deadlines have passed
 
+        :param network: Network being deployed to
+        :param deployer: deployer for deprecating and transacting resolving in progress tasks
+        :return: None
+        """
         # Trigger flush
         txhash = deployer.transact(deployer.contracts['ERC20Relay'].functions.flush())
         network.wait_and_check_transaction(txhash)
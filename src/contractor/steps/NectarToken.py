@@ -2,12 +2,12 @@ import logging
 
 from contractor.steps import Step
 from contractor.network import Chain
-from itertools import zip_longest
+from contractor.util import chunks
 
 logger = logging.getLogger(__name__)
 
 CONTRACT_NAME = 'NectarToken'
-MINT_STRIDE = 10
+MINT_GAS_PER_USER = 40000
 
 
 def mint_for_users(network, deployer, users, mint_amount):
@@ -19,15 +19,16 @@ def mint_for_users(network, deployer, users, mint_amount):
     :param mint_amount: Amount of tokens to mint
     :return: None
     """
-    # Take mint requests MINT_STRIDE users at a time
-    for i, group in enumerate(zip_longest(*(iter(users),) * MINT_STRIDE)):
-        group = filter(None, group)
-        txhashes = []
-        for j, user in enumerate(group):
-            logger.info('Minting %s tokens for user %s: %s', mint_amount, i * MINT_STRIDE + j, user)
-            txhashes.append(deployer.transact(deployer.contracts['NectarToken'].functions.mint(user, mint_amount)))
-
-        network.wait_and_check_transactions(txhashes)
+    # Mint for as many users per transaction as will fit under the gas limit
+    batch_size = network.max_batch_size(MINT_GAS_PER_USER)
+
+    txhashes = []
+    for i, group in enumerate(chunks(users, batch_size)):
+        logger.info('Minting %s tokens for users %s-%s', mint_amount, i * batch_size, i * batch_size + len(group) - 1)
+        txhashes.append(deployer.transact(
+            deployer.contracts['NectarToken'].functions.mintBatch(group, [mint_amount] * len(group))))
+
+    network.wait_and_check_transactions(txhashes)
 
 
 class NectarToken(Step):
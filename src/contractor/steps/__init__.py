@@ -1,4 +1,6 @@
+import json
 import logging
+import os
 import pkgutil
 import sys
 
@@ -56,6 +58,19 @@ class Step(object, metaclass=__MetaRegistry):
     def deactivate(self, network, deployer):
         """Run this deactivate setep
 
+        Steps which must wait for in progress tasks to resolve should not sleep here, instead they return the block
+        number which must be reached before `finalize_deactivate` is run. The runner waits once for the latest
+        deadline of all steps.
+
+        :param network: Network being deactivated
+        :param deployer: Deployer for deprecating and transacting resolving in progress tasks
+        :return: Block number to wait for before finalizing deactivation, or None if no wait is required
+        """
+        return None
+
+    def finalize_deactivate(self, network, deployer):
+        """Finish this deactivate step once all deactivation deadlines have passed
+
         :param network: Network being deactivated
         :param deployer: Deployer for deprecating and transacting resolving in progress tasks
         :return: None
@@ -72,13 +87,100 @@ class Step(object, metaclass=__MetaRegistry):
         return True
 
 
-def run(network, deployer, to_deploy=None, deactivate=False):
+def __load_deactivation_state(path, deployer):
+    """Load persisted deactivation progress, so a restarted deactivation does not start its waits over.
+
+    :param path: Path of the file persisting deactivation progress
+    :param deployer: Deployer for the contracts being deactivated
+    :return: Dictionary of step deadlines and list of finalized steps
+    """
+    state = {'deadlines': {}, 'finalized': []}
+    if path is None or not os.path.isfile(path):
+        return state
+
+    with open(path, 'r') as f:
+        persisted = json.load(f)
+
+    addresses = {name: contract.address for name, contract in deployer.contracts.items()}
+    if persisted.get('contracts') != addresses:
+        logger.warning('Deactivation state in %s is for different contracts, ignoring', path)
+        return state
+
+    logger.info('Resuming deactivation from %s', path)
+    state['deadlines'] = persisted.get('deadlines', {})
+    state['finalized'] = persisted.get('finalized', [])
+    return state
+
+
+def __save_deactivation_state(path, deployer, state):
+    """Persist deactivation progress.
+
+    :param path: Path of the file persisting deactivation progress
+    :param deployer: Deployer for the contracts being deactivated
+    :param state: Dictionary of step deadlines and list of finalized steps
+    :return: None
+    """
+    if path is None:
+        return
+
+    persisted = dict(state)
+    persisted['contracts'] = {name: contract.address for name, contract in deployer.contracts.items()}
+    with open(path, 'w') as f:
+        json.dump(persisted, f)
+
+
+def __deactivate(network, deployer, ordered_steps, state_file):
+    """Run all deactivation steps in order, waiting once for the latest deadline before finalizing.
+
+    :param network: Network being deactivated
+    :param deployer: Deployer for deprecating and transacting resolving in progress tasks
+    :param ordered_steps: Steps to run, in dependency order
+    :param state_file: Path of a file to persist deactivation progress to, or None to not persist
+    :return: None
+    """
+    state = __load_deactivation_state(state_file, deployer)
+    deadlines = state['deadlines']
+
+    for name, step in ordered_steps:
+        if name in deadlines:
+            logger.info('Deactivation for %s already started, skipping', name)
+            continue
+
+        logger.info('Running deactivation for %s', name)
+        deadlines[name] = step.deactivate(network, deployer)
+        if deadlines[name] is not None:
+            logger.info('Deactivation for %s cannot be finalized before block %s', name, deadlines[name])
+
+        __save_deactivation_state(state_file, deployer, state)
+
+    deadline = max((d for d in deadlines.values() if d is not None), default=None)
+    if deadline is not None:
+        network.wait_for_block(deadline)
+
+    for name, step in ordered_steps:
+        if name in state['finalized']:
+            logger.info('Deactivation for %s already finalized, skipping', name)
+            continue
+
+        logger.info('Finalizing deactivation for %s', name)
+        step.finalize_deactivate(network, deployer)
+
+        state['finalized'].append(name)
+        __save_deactivation_state(state_file, deployer, state)
+
+    if state_file is not None and os.path.isfile(state_file):
+        os.remove(state_file)
+
+
+def run(network, deployer, to_deploy=None, deactivate=False, state_file=None):
     """Run all deployment steps in order.
 
     :param network: Network being deployed to
     :param deployer: Deployer for deploying and transacting with contracts
     :param to_deploy: List of what steps to perform, by default all steps will be run
     :param deactivate: Is this deactivating, or running
+    :param state_file: Path of a file to persist deactivation progress to, allowing an interrupted deactivation to
+        resume without restarting its waits
     :return: None
     """
     # Load all our submodules so they get registered
@@ -102,9 +204,10 @@ def run(network, deployer, to_deploy=None, deactivate=False):
         if not step.validate(network, deactivate):
             raise ValueError('Preconditions not met for contract {}, check config'.format(name))
 
+    if deactivate:
+        __deactivate(network, deployer, ordered_steps, state_file)
+        return
+
     for name, step in ordered_steps:
         logger.info('Running deployment for %s', name)
-        if deactivate:
-            step.deactivate(network, deployer)
-        else:
-            step.run(network, deployer)
+        step.run(network, deployer)
@@ -1,7 +1,9 @@
 import os
+import stat
 import subprocess
 import sys
 import time
+import uuid
 
 
 def call_with_output(cmd, file=sys.stdout.buffer):
@@ -25,6 +27,45 @@ def call_with_output(cmd, file=sys.stdout.buffer):
     return p.wait(timeout=1)
 
 
+def atomic_write(path, content):
+    """Write a file atomically, readers will see either the old or new content but never a partial write.
+
+    :param path: Path to write to
+    :param content: String to write
+    :return: None
+    """
+    dirname, basename = os.path.split(path)
+    tmp = os.path.join(dirname, '.{0}.{1}.tmp'.format(basename, uuid.uuid4().hex))
+
+    # Let the kernel apply the umask, so new files get the same permissions as files written normally
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+
+        # Replacing a file keeps its permissions
+        try:
+            os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            pass
+
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def chunks(items, size):
+    """Split a list into consecutive chunks of at most a given size.
+
+    :param items: List to split
+    :param size: Maximum size of each chunk
+    :return: Generator of chunks of the provided list
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 def wait_for_file(path, timeout=60):
     """Wait for a file to exist in the filesystem (blocking).
 
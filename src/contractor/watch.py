@@ -1,13 +1,43 @@
 import click
+import functools
+import json
+import logging
+import os
 import pprint
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 from colorama import Fore, Style
+from eth_utils import event_abi_to_log_topic, keccak, to_checksum_address
+from hexbytes import HexBytes
 from tabulate import tabulate
+from web3 import Web3
+
+from contractor.pipeline import Pipeline, Stage
+from contractor.util import atomic_write
 
 pp = pprint.PrettyPrinter(indent=2)
 
+logger = logging.getLogger(__name__)
+
+# Seconds over which throughput is measured
+RATE_WINDOW = 60
+# Blocks between checks of incrementally tracked balances against on-chain state
+RECONCILE_INTERVAL = 100
+# Blocks fetched together when catching up, and how many chunks are fetched at once
+CATCH_UP_CHUNK_SIZE = 50
+CATCH_UP_JOBS = 4
+# Seconds between persisting watcher state, and the format version of persisted state
+CHECKPOINT_INTERVAL = 30
+CHECKPOINT_VERSION = 1
+TRANSFER_TOPIC = Web3.sha3(text='Transfer(address,address,uint256)').hex()
+LOGS_BLOOM_BITS = 2048
+# Error reported by nodes when polling a filter they have dropped
+FILTER_NOT_FOUND = 'filter not found'
+
 
 class Token(Enum):
     """Types of cryptocurrency we interact with.
@@ -64,7 +94,7 @@ def get_address_labels(network, deployer):
         user = network.normalize_address(user)
         address_to_label[user] = 'Arbiter {}'.format(user[:7])
 
-    verifiers = erc20_relay_config.get('verifiers')
+    verifiers = erc20_relay_config.get('verifiers', [])
     for user in verifiers:
         user = network.normalize_address(user)
         address_to_label[user] = 'Verifiers {}'.format(user[:7])
@@ -80,6 +110,82 @@ def get_address_labels(network, deployer):
     return address_to_label
 
 
+def bloom_mask(value):
+    """Compute the bits a value sets in a logs bloom when it is the address or a topic of a log.
+
+    :param value: Address or topic
+    :return: Bloom bits as an integer
+    """
+    digest = keccak(HexBytes(value))
+    mask = 0
+    for i in range(0, 6, 2):
+        mask |= 1 << (int.from_bytes(digest[i:i + 2], 'big') & (LOGS_BLOOM_BITS - 1))
+    return mask
+
+
+def bloom_contains(bloom, mask):
+    """Check if a logs bloom may contain a value.
+
+    :param bloom: Logs bloom
+    :param mask: Bloom bits of the value, from bloom_mask
+    :return: True if the bloom may contain the value, False if it certainly does not
+    """
+    return int.from_bytes(HexBytes(bloom), 'big') & mask == mask
+
+
+def get_bloom_masks(deployer):
+    """Compute the logs bloom bits of our contracts' addresses and event topics.
+
+    :param deployer: Deployer for interacting with contracts
+    :return: Tuple of lists of bloom bits for contract addresses and for event topics
+    """
+    address_masks = [bloom_mask(contract.address) for contract in deployer.contracts.values()]
+    topics = {event_abi_to_log_topic(abi) for contract in deployer.contracts.values() for abi in contract.abi
+              if abi.get('type') == 'event' and not abi.get('anonymous')}
+
+    return address_masks, [bloom_mask(topic) for topic in topics]
+
+
+class RateMeter(object):
+    """Measures how often something happens over a sliding window of time, safe to use from several threads.
+    """
+
+    def __init__(self, window=RATE_WINDOW):
+        """Construct a new RateMeter
+
+        :param window: Number of seconds to measure the rate over
+        """
+        self.window = window
+        self.started = time.time()
+        self.total = 0
+        self.__events = deque()
+        self.__lock = threading.Lock()
+
+    def record(self, count=1):
+        """Record events happening now.
+
+        :param count: Number of events
+        :return: None
+        """
+        with self.__lock:
+            self.__events.append((time.time(), count))
+            self.total += count
+
+    @property
+    def rate(self):
+        """Rate of events over the window.
+
+        :return: Events per second
+        """
+        with self.__lock:
+            now = time.time()
+            while self.__events and self.__events[0][0] < now - self.window:
+                self.__events.popleft()
+
+            elapsed = min(self.window, now - self.started)
+            return sum(count for _, count in self.__events) / elapsed if elapsed > 0 else 0.0
+
+
 class User(object):
     """Tracks balances and function calls for an address (representing a user's activity).
     """
@@ -96,6 +202,32 @@ class User(object):
         self.eth_balance = 0
         self.nct_balance = 0
 
+    @classmethod
+    def from_dict(cls, d):
+        """Create a user from a dictionary.
+
+        :param d: Dictionary containing the user
+        :return: New user from provided dictionary
+        """
+        user = cls(d['address'], d['name'])
+        user.function_calls = d['function_calls']
+        user.eth_balance = d['eth_balance']
+        user.nct_balance = d['nct_balance']
+        return user
+
+    def to_dict(self):
+        """Convert this user to a dictionary.
+
+        :return: Dictionary containing the user
+        """
+        return {
+            'address': self.address,
+            'name': self.name,
+            'function_calls': self.function_calls,
+            'eth_balance': self.eth_balance,
+            'nct_balance': self.nct_balance,
+        }
+
     def record_function_call(self, fn_name):
         """Record a function call for this user.
 
@@ -118,17 +250,222 @@ class User(object):
             block_identifier=block_identifier)
 
 
+class BalanceTracker(object):
+    """Tracks Ether and Nectar balances of addresses incrementally, from the transactions and Transfer events in each
+    block, rather than querying every balance every block.
+    """
+
+    def __init__(self, network, nectar_token, addresses, reconcile_interval=RECONCILE_INTERVAL):
+        """Construct a new BalanceTracker
+
+        :param network: Network to interact with
+        :param nectar_token: NectarToken contract, or None to not track Nectar balances
+        :param addresses: Addresses to track
+        :param reconcile_interval: Number of blocks between checks of tracked balances against on-chain state
+        """
+        self.network = network
+        self.nectar_token = nectar_token
+        self.addresses = [network.normalize_address(address) for address in addresses]
+        self.reconcile_interval = reconcile_interval
+
+        self.eth_balances = {}
+        self.nct_balances = {}
+        self.last_block = None
+        self.last_reconciled = None
+
+    def to_dict(self):
+        """Convert the tracked balances to a dictionary.
+
+        :return: Dictionary containing the tracked balances
+        """
+        return {
+            'eth_balances': self.eth_balances,
+            'nct_balances': self.nct_balances,
+            'last_block': self.last_block,
+            'last_reconciled': self.last_reconciled,
+        }
+
+    def restore(self, d):
+        """Restore tracked balances from a dictionary.
+
+        :param d: Dictionary containing the tracked balances, from to_dict
+        :return: True if restored, False if the dictionary is for different addresses
+        """
+        if set(d['eth_balances']) != set(self.addresses) or set(d['nct_balances']) != set(self.addresses):
+            return False
+
+        self.eth_balances = d['eth_balances']
+        self.nct_balances = d['nct_balances']
+        self.last_block = d['last_block']
+        self.last_reconciled = d['last_reconciled']
+        return True
+
+    def fetch_balances(self, block_number):
+        """Fetch balances of all tracked addresses from on-chain state, in batches.
+
+        :param block_number: Block to fetch balances as of
+        :return: Tuple of dictionaries of addresses to Ether and Nectar balances
+        """
+        block = hex(block_number)
+        eth_balances = self.network.batch_request('eth_getBalance', [[a, block] for a in self.addresses])
+
+        nct_balances = [0] * len(self.addresses)
+        if self.nectar_token is not None:
+            calls = [{'to': self.nectar_token.address, 'data': self.nectar_token.encodeABI('balanceOf', args=[a])}
+                     for a in self.addresses]
+            results = self.network.batch_request('eth_call', [[call, block] for call in calls])
+            nct_balances = [int.from_bytes(HexBytes(result), 'big') for result in results]
+
+        return dict(zip(self.addresses, eth_balances)), dict(zip(self.addresses, nct_balances))
+
+    def seed(self, block_number):
+        """Set tracked balances from on-chain state.
+
+        :param block_number: Block to set balances as of
+        :return: None
+        """
+        self.eth_balances, self.nct_balances = self.fetch_balances(block_number)
+        self.last_block = self.last_reconciled = block_number
+
+    def reconcile(self, block_number):
+        """Check tracked balances against on-chain state, correcting any drift.
+
+        Drift is expected when Ether moves in ways not visible in transactions, such as transfers from contracts or
+        block rewards.
+
+        :param block_number: Block to check balances as of
+        :return: Number of balances which had drifted
+        """
+        eth_balances, nct_balances = self.fetch_balances(block_number)
+
+        drifted = 0
+        for tracked, actual, token in ((self.eth_balances, eth_balances, Token.ETHER),
+                                       (self.nct_balances, nct_balances, Token.NECTAR)):
+            for address, balance in actual.items():
+                if tracked.get(address) != balance:
+                    logger.warning('Tracked %s balance of %s drifted by %s', token.name.lower(), address,
+                                   balance - tracked.get(address, 0))
+                    drifted += 1
+
+        self.eth_balances, self.nct_balances = eth_balances, nct_balances
+        self.last_block = self.last_reconciled = block_number
+        return drifted
+
+    def fetch_activity(self, blocks):
+        """Fetch what is needed to apply blocks to tracked balances: receipts of transactions involving tracked
+        addresses, and Nectar Transfer logs.
+
+        :param blocks: Blocks to fetch activity for, with full transactions, in order of block number
+        :return: Dictionary of block numbers to tuples of a dictionary of transaction hashes to receipts, and a list of
+            Transfer logs
+        """
+        tracked = set(self.addresses)
+        activity = {block['number']: ({}, []) for block in blocks}
+
+        txs = [(block['number'], HexBytes(tx.hash)) for block in blocks for tx in block['transactions']
+               if tx['from'] in tracked or tx['to'] in tracked]
+        if txs:
+            receipts = self.network.batch_request('eth_getTransactionReceipt', [[h.hex()] for _, h in txs])
+            for (block_number, h), receipt in zip(txs, receipts):
+                activity[block_number][0][h] = receipt
+
+        # Token transfers can only come from transactions, the logs of empty blocks need not be fetched
+        if self.nectar_token is not None and any(block['transactions'] for block in blocks):
+            logs = self.network.w3.eth.getLogs({
+                'fromBlock': blocks[0]['number'],
+                'toBlock': blocks[-1]['number'],
+                'address': self.nectar_token.address,
+                'topics': [TRANSFER_TOPIC],
+            })
+            for log in logs:
+                if log['blockNumber'] in activity:
+                    activity[log['blockNumber']][1].append(log)
+
+        return activity
+
+    def apply_block(self, block, activity=None):
+        """Update tracked balances with the effects of a block.
+
+        Balances are seeded from on-chain state the first time, and again if a block is skipped.
+
+        :param block: Block to apply, with full transactions
+        :param activity: Activity in the block from fetch_activity, fetched if not provided
+        :return: None
+        """
+        block_number = block['number']
+        if self.last_block is None or block_number != self.last_block + 1:
+            self.seed(block_number)
+            return
+
+        if activity is None:
+            activity = self.fetch_activity([block])[block_number]
+
+        tracked = set(self.addresses)
+        receipts, logs = activity
+        for tx in block['transactions']:
+            receipt = receipts.get(HexBytes(tx.hash))
+            if receipt is None:
+                continue
+
+            succeeded = receipt['status'] == 1
+            if tx['from'] in tracked:
+                self.eth_balances[tx['from']] -= receipt['gasUsed'] * tx['gasPrice']
+                if succeeded:
+                    self.eth_balances[tx['from']] -= tx['value']
+            if tx['to'] in tracked and succeeded:
+                self.eth_balances[tx['to']] += tx['value']
+
+        for log in logs:
+            sender, receiver = (to_checksum_address(topic[-20:]) for topic in log['topics'][1:3])
+            value = int.from_bytes(HexBytes(log['data']), 'big')
+            if sender in tracked:
+                self.nct_balances[sender] -= value
+            if receiver in tracked:
+                self.nct_balances[receiver] += value
+
+        self.__advance(block_number)
+
+    def skip_block(self, block_number):
+        """Advance past a block without inspecting it, as it cannot contain Nectar transfers.
+
+        Ether transfers in skipped blocks are corrected at the next reconciliation.
+
+        :param block_number: Number of the skipped block
+        :return: None
+        """
+        if self.last_block is None or block_number != self.last_block + 1:
+            self.seed(block_number)
+            return
+
+        self.__advance(block_number)
+
+    def __advance(self, block_number):
+        """Record a block as applied, reconciling if due.
+
+        :param block_number: Number of the applied block
+        :return: None
+        """
+        self.last_block = block_number
+        if block_number - self.last_reconciled >= self.reconcile_interval:
+            self.reconcile(block_number)
+
+
 class Watch(object):
     """Watch transactions and user account balance in Nectar or Ether.
     """
 
-    def __init__(self, config, token, cumulative=True, verbosity=1):
+    def __init__(self, config, token, cumulative=True, verbosity=1, bloom_filter=None, checkpoint_file=None,
+                 checkpoint_interval=CHECKPOINT_INTERVAL):
         """Construct a Watch object for monitoring activity in the network.
 
         :param config: Configuration to use
         :param token: Token to track (Nectar or Ether)
         :param cumulative: Track balances cumulatively or per block
         :param verbosity: How verbose should we log events
+        :param bloom_filter: Skip blocks whose logs bloom shows no events from our contracts, or None to only skip them
+            when tracking Nectar, as Ether balances also change with gas and plain transfers which emit no events
+        :param checkpoint_file: Path of a file to persist watcher state to, or None to not persist
+        :param checkpoint_interval: Minimum number of seconds between saving checkpoints
         """
         self.config = config
         self.token = token
@@ -136,6 +473,21 @@ class Watch(object):
         self.verbosity = verbosity
         self.poll_interval = 1
 
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.__checkpointed = time.time()
+
+        self.prev_user_data = {}
+        self.last_block = None
+        self.last_block_hash = None
+        self.contract_addresses = None
+        self.balances = None
+        self.bloom_filter = bloom_filter if bloom_filter is not None else token == Token.NECTAR
+        self.bloom_masks = None
+        self.throughput = RateMeter()
+        self.skipped = 0
+        self.pipeline = None
+
     def tabulate_balances(self, prev_user_data, cur_user_data):
         """Construct a table of updated balances per block.
 
@@ -165,76 +517,497 @@ class Watch(object):
 
         return tabulate(tabulate_list, headers=headers)
 
-    def watch(self, network, deployer):
-        """Start watching events on a network (blocking).
+    def fetch_headers(self, network, block_hashes, last_block=None):
+        """Fetch blocks without their transactions, in batches.
+
+        Blocks skipped between the last block and those requested are fetched as well, so that no block is missed when
+        several arrive between polls.
+
+        :param network: Network to interact with
+        :param block_hashes: Hashes of new blocks, as reported by a block filter
+        :param last_block: Number of the last block already fetched, defaults to the last block processed
+        :return: List of blocks in order of block number
+        """
+        if last_block is None:
+            last_block = self.last_block
+
+        headers = network.batch_request('eth_getBlockByHash', [[HexBytes(h).hex(), False] for h in block_hashes])
+        headers = [header for header in headers if header is not None]
+        if not headers or last_block is None:
+            return sorted(headers, key=lambda h: h['number'])
+
+        numbers = {header['number'] for header in headers}
+        missing = [n for n in range(last_block + 1, max(numbers)) if n not in numbers]
+        if missing:
+            if self.verbosity > 1:
+                click.echo('Fetching {} blocks missed between polls'.format(len(missing)))
+            headers.extend(header for header in network.batch_request('eth_getBlockByNumber',
+                                                                      [[hex(n), False] for n in missing])
+                           if header is not None)
+
+        return sorted(headers, key=lambda h: h['number'])
+
+    def fetch_blocks(self, network, block_hashes):
+        """Fetch blocks with their full transactions, in batches.
+
+        :param network: Network to interact with
+        :param block_hashes: Hashes of blocks to fetch
+        :return: List of blocks, in the order requested
+        """
+        blocks = network.batch_request('eth_getBlockByHash', [[HexBytes(h).hex(), True] for h in block_hashes])
+        return [block for block in blocks if block is not None]
+
+    def is_relevant(self, header):
+        """Check if a block may contain activity involving our contracts, using only its header.
+
+        A block is relevant if its logs bloom may contain an event emitted by one of our contracts. Bloom filters have
+        false positives but no false negatives, so relevant blocks are then inspected in full.
+
+        :param header: Block to check, transactions are not required
+        :return: True if the block needs to be inspected, else False
+        """
+        if not self.bloom_filter:
+            return True
+        # Empty blocks have no logs, skip them without checking the bloom
+        if not header['transactions']:
+            return False
+        if self.bloom_masks is None:
+            return True
+
+        address_masks, topic_masks = self.bloom_masks
+        bloom = header['logsBloom']
+        return any(bloom_contains(bloom, mask) for mask in address_masks) and \
+            any(bloom_contains(bloom, mask) for mask in topic_masks)
+
+    def skip_block(self, header):
+        """Advance past a block which contains no activity involving our contracts.
+
+        :param header: Block to skip, transactions are not required
+        :return: None
+        """
+        block_number = header['number']
+        if self.last_block is not None and block_number <= self.last_block:
+            return
+
+        if self.verbosity > 1:
+            click.echo('Skipping block {} with {} transactions'.format(block_number, len(header['transactions'])))
+
+        if self.balances is not None:
+            self.balances.skip_block(block_number)
+
+        self.last_block = block_number
+        self.last_block_hash = HexBytes(header['hash']).hex()
+        self.skipped += 1
+
+    def process_block(self, network, deployer, block, address_to_label, contract_map, activity=None):
+        """Record the function calls and resulting balances of a block, and display them.
 
         :param network: Network to interact with
         :param deployer: Deployer for interacting with contracts
+        :param block: Block to process, with full transactions
+        :param address_to_label: Dictionary of addresses to friendly labels
+        :param contract_map: Dictionary of addresses to our contracts
+        :param activity: Balance activity in the block from BalanceTracker.fetch_activity, fetched if not provided
         :return: None
         """
+        report = self.aggregate_block(network, deployer, block, self.decode_block(block, contract_map),
+                                      address_to_label, activity)
+        if report is not None:
+            self.render_block(*report)
+
+    def decode_block(self, block, contract_map):
+        """Decode the inputs of transactions calling our contracts.
+
+        Safe to call from worker threads, as it does not modify any state.
+
+        :param block: Block to decode, with full transactions
+        :param contract_map: Dictionary of addresses to our contracts
+        :return: List of tuples of transaction and its decoded input, or None if it does not call our contracts
+        """
+        decoded = []
+        for tx in block['transactions']:
+            if tx.input and tx.to in contract_map:
+                decoded.append((tx, contract_map[tx.to].decode_function_input(tx.input)))
+            else:
+                decoded.append((tx, None))
+
+        return decoded
+
+    def aggregate_block(self, network, deployer, block, decoded, address_to_label, activity=None):
+        """Record the function calls and resulting balances of a block.
+
+        :param network: Network to interact with
+        :param deployer: Deployer for interacting with contracts
+        :param block: Block to process, with full transactions
+        :param decoded: Decoded transactions of the block, from decode_block
+        :param address_to_label: Dictionary of addresses to friendly labels
+        :param activity: Balance activity in the block from BalanceTracker.fetch_activity, fetched if not provided
+        :return: Tuple of arguments to render_block, or None if the block was already processed
+        """
+        block_number = block['number']
+        if self.last_block is not None and block_number <= self.last_block:
+            if self.verbosity > 1:
+                click.echo('Duplicate block, continuing')
+            return None
+
+        if self.balances is None:
+            self.balances = BalanceTracker(network, deployer.contracts.get('NectarToken'), address_to_label.keys())
+        self.balances.apply_block(block, activity)
+
+        self.last_block = block_number
+        self.last_block_hash = HexBytes(block['hash']).hex()
+
+        if len(block['transactions']) == 0:
+            return block, decoded, None, None
+
+        # Track function calls for each transaction in this block
+        cur_user_data = {}
+        for tx, fn_input in decoded:
+            if fn_input is None:
+                continue
+
+            address = tx['from']
+            name = address_to_label.get(address, address)
+            user = cur_user_data.get(name, User(address, name))
+            user.record_function_call(fn_input[0].fn_name)
+            cur_user_data[name] = user
+
+        # Get account balances for all participants
+        for address, name in address_to_label.items():
+            user = cur_user_data.get(name, User(address, name))
+            user.eth_balance = self.balances.eth_balances[network.normalize_address(address)]
+            user.nct_balance = self.balances.nct_balances[network.normalize_address(address)]
+            cur_user_data[name] = user
+
+        # Users are not modified once recorded, so a shallow copy is enough to render this block later
+        prev_user_data = dict(self.prev_user_data)
+        if not self.cumulative or not self.prev_user_data:
+            self.prev_user_data.update(cur_user_data)
+
+        return block, decoded, prev_user_data, cur_user_data
+
+    def render_block(self, block, decoded, prev_user_data, cur_user_data):
+        """Display the function calls and resulting balances of a block.
+
+        :param block: Block to display, with full transactions
+        :param decoded: Decoded transactions of the block, from decode_block
+        :param prev_user_data: Previous data for all users, or None if the block is empty
+        :param cur_user_data: Current data for all users, or None if the block is empty
+        :return: None
+        """
+        click.echo('-' * 80)
+
+        click.echo('Block Number: {}'.format(block['number']))
+        click.echo('Number of transactions: {}'.format(len(block['transactions'])))
+
+        if len(block['transactions']) == 0:
+            if self.verbosity > 1:
+                click.echo('Empty block, continuing')
+            return
+
+        if self.verbosity > 0:
+            click.echo('New block: {}'.format(pp.pformat(dict(block))))
+
+        for tx, fn_input in decoded:
+            if self.verbosity > 1:
+                click.echo('Transaction: {}'.format(pp.pformat(dict(tx))))
+
+            if fn_input is not None:
+                if self.verbosity > 0:
+                    click.echo('Decoded Input: {}'.format(fn_input))
+            else:
+                click.echo('Transaction {} outside PolySwarm network, ignoring...'.format(tx.hash))
+
+        click.echo(self.tabulate_balances(prev_user_data, cur_user_data))
+
+    def fetch_header_range(self, network, start, end):
+        """Fetch a range of blocks without their transactions, in batches.
+
+        :param network: Network to interact with
+        :param start: First block number to fetch
+        :param end: Last block number to fetch
+        :return: List of blocks in order of block number
+        """
+        headers = network.batch_request('eth_getBlockByNumber', [[hex(n), False] for n in range(start, end + 1)])
+        return [header for header in headers if header is not None]
+
+    def fetch_batch(self, network, headers):
+        """Fetch everything needed to process a run of blocks: the full relevant blocks, and their balance activity.
+
+        Safe to call from worker threads, as it does not modify any state.
+
+        :param network: Network to interact with
+        :param headers: Blocks to fetch for, in order of block number
+        :return: List of tuples of header, full block or None if the block can be skipped, and balance activity
+        """
+        relevant = [header['hash'] for header in headers if self.is_relevant(header)]
+        blocks = {block['hash']: block for block in self.fetch_blocks(network, relevant)}
+
+        activity = {}
+        if self.balances is not None and blocks:
+            activity = self.balances.fetch_activity(sorted(blocks.values(), key=lambda b: b['number']))
+
+        return [(header, blocks.get(header['hash']), activity.get(header['number'])) for header in headers]
+
+    def decode_batch(self, batch, contract_map):
+        """Decode the transactions of a run of blocks fetched by fetch_batch, the decode stage of the pipeline.
+
+        :param batch: List of tuples of header, full block or None, and balance activity
+        :param contract_map: Dictionary of addresses to our contracts
+        :return: List of tuples of header, full block or None, balance activity, and decoded transactions or None
+        """
+        return [(header, block, activity, self.decode_block(block, contract_map) if block is not None else None)
+                for header, block, activity in batch]
+
+    def aggregate_batch(self, batch, network, deployer, address_to_label):
+        """Record the function calls and balances of a run of decoded blocks, the aggregate stage of the pipeline.
+
+        Also checkpoints state, as this is the only stage which modifies it.
+
+        :param batch: List of tuples from decode_batch
+        :param network: Network to interact with
+        :param deployer: Deployer for interacting with contracts
+        :param address_to_label: Dictionary of addresses to friendly labels
+        :return: List of tuples of arguments to render_block
+        """
+        reports = []
+        for header, block, activity, decoded in batch:
+            if block is not None:
+                report = self.aggregate_block(network, deployer, block, decoded, address_to_label, activity)
+                if report is not None:
+                    reports.append(report)
+            else:
+                self.skip_block(header)
+            self.throughput.record()
+
+        if self.checkpoint_file is not None and time.time() - self.__checkpointed >= self.checkpoint_interval:
+            self.save_checkpoint(self.checkpoint_file)
+
+        return reports
+
+    def render_batch(self, reports):
+        """Display a run of processed blocks and current throughput, the sink stage of the pipeline.
+
+        :param reports: List of tuples of arguments to render_block
+        :return: None
+        """
+        for report in reports:
+            self.render_block(*report)
+        self.report_throughput()
+
+    def run_pipeline(self, network, deployer, batches):
+        """Process batches of blocks, decoding, aggregating and displaying them concurrently (blocking).
+
+        :param network: Network to interact with
+        :param deployer: Deployer for interacting with contracts
+        :param batches: Iterable of batches from fetch_batch, consumed as the ingest stage
+        :return: None
+        """
+        address_to_label, contract_map = self.prepare(network, deployer)
+
+        self.pipeline = Pipeline([
+            Stage('decode', functools.partial(self.decode_batch, contract_map=contract_map)),
+            Stage('aggregate', functools.partial(self.aggregate_batch, network=network, deployer=deployer,
+                                                 address_to_label=address_to_label)),
+            Stage('sink', self.render_batch),
+        ])
+        self.pipeline.run(batches)
+
+    def report_throughput(self):
+        """Display throughput and how many blocks were skipped.
+
+        :return: None
+        """
+        if self.throughput.total:
+            click.echo('Throughput: {:.2f} blocks/sec, skipped {:.1%} of blocks'.format(
+                self.throughput.rate, self.skipped / self.throughput.total))
+        if self.pipeline is not None and self.verbosity > 0:
+            click.echo('Pipeline: {}'.format(self.pipeline.summary()))
+
+    def prepare(self, network, deployer):
+        """Set up state needed to process blocks.
+
+        :param network: Network to interact with
+        :param deployer: Deployer for interacting with contracts
+        :return: Tuple of dictionaries of addresses to friendly labels, and of addresses to our contracts
+        """
         address_to_label = get_address_labels(network, deployer)
         contract_map = {contract.address: contract for contract in deployer.contracts.values()}
+        self.contract_addresses = {name: contract.address for name, contract in deployer.contracts.items()}
+        if self.bloom_filter:
+            self.bloom_masks = get_bloom_masks(deployer)
+        if self.balances is None:
+            self.balances = BalanceTracker(network, deployer.contracts.get('NectarToken'), address_to_label.keys())
 
-        prev_user_data = {}
-        last_block = None
+        return address_to_label, contract_map
+
+    def catch_up(self, network, deployer, from_block, to_block=None, jobs=CATCH_UP_JOBS):
+        """Process a range of past blocks, fetching chunks of the range in parallel (blocking).
+
+        Blocks are processed in order, as each chunk completes. Without an end block, catches up to the latest block,
+        including any produced while catching up.
+
+        :param network: Network to interact with
+        :param deployer: Deployer for interacting with contracts
+        :param from_block: First block number to process
+        :param to_block: Last block number to process, or None to process up to the latest block
+        :param jobs: Maximum number of chunks to fetch at once
+        :return: Number of the last block processed
+        """
+        start = from_block
 
+        def batches():
+            nonlocal start
+            while True:
+                end = to_block if to_block is not None else network.block_number()
+                if start > end:
+                    return
+
+                click.echo('Catching up from block {} to {}'.format(start, end))
+                chunks = [(n, min(n + CATCH_UP_CHUNK_SIZE - 1, end))
+                          for n in range(start, end + 1, CATCH_UP_CHUNK_SIZE)]
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    pending = deque()
+                    for chunk in chunks:
+                        pending.append(executor.submit(self.__fetch_chunk, network, *chunk))
+
+                        # Bound how far fetching runs ahead of processing
+                        if len(pending) >= 2 * jobs:
+                            yield pending.popleft().result()
+
+                    while pending:
+                        yield pending.popleft().result()
+
+                start = end + 1
+                if to_block is not None:
+                    return
+
+        self.run_pipeline(network, deployer, batches())
+        return start - 1
+
+    def __fetch_chunk(self, network, start, end):
+        """Fetch a chunk of a range of blocks for processing.
+
+        :param network: Network to interact with
+        :param start: First block number of the chunk
+        :param end: Last block number of the chunk
+        :return: Batch of blocks, from fetch_batch
+        """
+        return self.fetch_batch(network, self.fetch_header_range(network, start, end))
+
+    def save_checkpoint(self, path):
+        """Persist watcher state, so a restarted watcher can resume where it left off.
+
+        :param path: Path of the file to persist state to
+        :return: None
+        """
+        if self.last_block is None:
+            return
+
+        state = {
+            'version': CHECKPOINT_VERSION,
+            'contracts': self.contract_addresses,
+            'last_block': self.last_block,
+            'last_block_hash': self.last_block_hash,
+            'users': [user.to_dict() for user in self.prev_user_data.values()],
+            'balances': self.balances.to_dict() if self.balances is not None else None,
+        }
+
+        atomic_write(path, json.dumps(state, separators=(',', ':')))
+        self.__checkpointed = time.time()
+
+    def load_checkpoint(self, path, network):
+        """Resume from persisted watcher state, must be called after prepare.
+
+        Balances are only restored if the checkpointed block is still part of the chain, otherwise they are seeded again
+        from on-chain state.
+
+        :param path: Path of the file state was persisted to
+        :param network: Network to interact with
+        :return: True if state was resumed, else False
+        """
+        if path is None or not os.path.isfile(path):
+            return False
+
+        with open(path, 'r') as f:
+            state = json.load(f)
+
+        if state.get('version') != CHECKPOINT_VERSION or state.get('contracts') != self.contract_addresses:
+            logger.warning('Watch checkpoint in %s is for different contracts, ignoring', path)
+            return False
+
+        self.last_block = state['last_block']
+        self.last_block_hash = state['last_block_hash']
+        self.prev_user_data = {d['name']: User.from_dict(d) for d in state['users']}
+
+        block = network.w3.eth.getBlock(self.last_block)
+        if block is None or HexBytes(block['hash']).hex() != self.last_block_hash:
+            logger.warning('Block %s has been replaced since the checkpoint, reseeding balances', self.last_block)
+        elif state['balances'] is not None and self.balances is not None and not self.balances.restore(
+                state['balances']):
+            logger.warning('Watch checkpoint in %s is for different users, reseeding balances', path)
+
+        logger.info('Resuming watch from block %s', self.last_block)
+        return True
+
+    def __poll_batches(self, network):
+        """Fetch new blocks as they are reported by a block filter, the ingest stage of the pipeline.
+
+        Blocks since the last one processed are fetched along with the first new block, so blocks produced before the
+        filter was created are not missed. Nodes drop filters which are not polled for a while, so the filter is
+        created again if the node no longer knows it.
+
+        :param network: Network to interact with
+        :return: Generator of batches from fetch_batch, or None while waiting for new blocks
+        """
+        # Blocks are processed on another thread, so track the last block fetched separately
+        last_fetched = self.last_block
         block_event_filter = network.w3.eth.filter('latest')
         while True:
-            for _ in block_event_filter.get_new_entries():
-                latest = network.w3.eth.getBlock('latest')
+            try:
+                block_hashes = block_event_filter.get_new_entries()
+            except ValueError as e:
+                if FILTER_NOT_FOUND not in str(e).lower():
+                    raise
+
+                logger.warning('Block filter expired, creating a new one')
+                block_event_filter = network.w3.eth.filter('latest')
+                continue
+
+            headers = self.fetch_headers(network, block_hashes, last_fetched) if block_hashes else []
+            if headers:
+                last_fetched = max(last_fetched or 0, headers[-1]['number'])
+                yield self.fetch_batch(network, headers)
+            else:
+                yield None
+                time.sleep(self.poll_interval)
+
+    def watch(self, network, deployer, from_block=None, to_block=None, jobs=CATCH_UP_JOBS):
+        """Start watching events on a network (blocking).
 
-                block_number = latest['number']
-                if last_block is not None and block_number <= last_block:
-                    if self.verbosity > 1:
-                        click.echo('Duplicate block, continuing')
-                    continue
+        :param network: Network to interact with
+        :param deployer: Deployer for interacting with contracts
+        :param from_block: Block number to catch up from before following new blocks, or None to only follow new blocks
+        :param to_block: Last block number to process when catching up, or None to follow new blocks after catching up
+        :param jobs: Maximum number of chunks of past blocks to fetch at once when catching up
+        :return: None
+        """
+        self.prepare(network, deployer)
 
-                cur_user_data = {}
-                last_block = block_number
-                click.echo('-' * 80)
+        # An explicit starting block takes precedence over resuming from a checkpoint
+        if from_block is None and self.load_checkpoint(self.checkpoint_file, network):
+            from_block = self.last_block + 1
 
-                click.echo('Block Number: {}'.format(block_number))
-                click.echo('Number of transactions: {}'.format(len(latest['transactions'])))
+        try:
+            if from_block is not None and to_block is not None:
+                self.catch_up(network, deployer, from_block, to_block, jobs)
+                return
 
-                if len(latest['transactions']) == 0:
-                    if self.verbosity > 1:
-                        click.echo('Empty block, continuing')
-                    continue
+            if from_block is not None:
+                self.catch_up(network, deployer, from_block, jobs=jobs)
+                click.echo('Caught up, following new blocks')
 
-                if self.verbosity > 0:
-                    click.echo('New block: {}'.format(pp.pformat(dict(latest))))
-
-                # Track function calls for each transaction in this block
-                txs = [network.w3.eth.getTransaction(txhash) for txhash in latest['transactions']]
-                for tx in txs:
-                    if self.verbosity > 1:
-                        click.echo('Transaction: {}'.format(pp.pformat(dict(tx))))
-
-                    if tx.input and tx.to in contract_map:
-                        decoded = contract_map[tx.to].decode_function_input(tx.input)
-                        if self.verbosity > 0:
-                            click.echo('Decoded Input: {}'.format(decoded))
-
-                        fn = decoded[0].fn_name
-                        address = tx['from']
-
-                        name = address_to_label.get(address, address)
-                        user = cur_user_data.get(name, User(address, name))
-                        user.record_function_call(fn)
-                        cur_user_data[name] = user
-                    else:
-                        click.echo('Transaction {} outside PolySwarm network, ignoring...'.format(tx.hash))
-                        continue
-
-                # Get account balances for all participants
-                for address, name in address_to_label.items():
-                    user = cur_user_data.get(name, User(address, name))
-                    user.update_balances(network, deployer, block_identifier=block_number)
-                    cur_user_data[name] = user
-
-                click.echo(self.tabulate_balances(prev_user_data, cur_user_data))
-
-                if not self.cumulative or not prev_user_data:
-                    prev_user_data.update(cur_user_data)
-
-            time.sleep(self.poll_interval)
+            self.run_pipeline(network, deployer, self.__poll_batches(network))
+        finally:
+            if self.checkpoint_file is not None:
+                self.save_checkpoint(self.checkpoint_file)
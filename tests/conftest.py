@@ -14,6 +14,7 @@ from contractor.compiler import DEFAULT_SOLC_VERSION
 from contractor.compiler import compile_directory
 from contractor.deployer import Deployer
 from contractor.network import Chain, Network
+from fakeconsul import FakeConsul
 
 GAS_LIMIT = 7500000
 GAS_MULTIPLIER = 3
@@ -126,12 +127,10 @@ class TestBountyRegistry(steps.Step):
             deployer.contracts['ArbiterStaking'].functions.setBountyRegistry(contract.address))
         network.wait_and_check_transaction(txhash)
 
-        txhashes = []
-        for arbiter in arbiters:
-            txhashes.append(deployer.transact(
-                deployer.contracts['TestBountyRegistry'].functions.addArbiter(arbiter, network.block_number())))
-
-        network.wait_and_check_transactions(txhashes)
+        if arbiters:
+            txhash = deployer.transact(
+                deployer.contracts['TestBountyRegistry'].functions.addArbiters(arbiters, network.block_number()))
+            network.wait_and_check_transaction(txhash)
 
 
 class ArbiterStaking(TestContract):
@@ -178,6 +177,13 @@ def artifacts():
     shutil.rmtree(outdir)
 
 
+@pytest.fixture
+def consul():
+    server = FakeConsul().start()
+    yield server
+    server.stop()
+
+
 @pytest.fixture
 def eth_tester():
     # Calls private method on PyEVMBackend but apparently this is the proper way to do this
@@ -208,7 +214,8 @@ def web3(eth_tester):
 def deploy(config, chain, artifacts, eth_tester, web3):
     owner = TestAccount(eth_tester)
     name = 'homechain' if chain == Chain.HOMECHAIN else 'sidechain'
-    network = Network.from_web3(name, web3, owner.priv_key, GAS_LIMIT, 0, GAS_MULTIPLIER, 10, config, chain)
+    network = Network.from_web3(name, web3, owner.priv_key, GAS_LIMIT, 0, GAS_MULTIPLIER, 10, config, chain,
+                                dev_mode=True)
     deployer = Deployer('test', network, artifacts)
     steps.run(network, deployer, to_deploy=config.keys())
 
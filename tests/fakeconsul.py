@@ -0,0 +1,239 @@
+import base64
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlparse
+
+# Limits enforced by a real Consul agent
+MAX_VALUE_SIZE = 512 * 1024
+MAX_TXN_OPERATIONS = 64
+MAX_TXN_SIZE = 512 * 1024
+
+DEFAULT_WAIT = 300
+WAIT_PATTERN = re.compile(r'^(\d+)(ms|s|m)$')
+WAIT_UNITS = {'ms': 0.001, 's': 1, 'm': 60}
+
+
+class KVStore(object):
+    """Consul-like KV store, with modify indexes and blocking queries.
+    """
+
+    def __init__(self):
+        self.index = 1
+        self.entries = {}
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def get(self, key, recurse=False, index=None, wait=None):
+        """Get entries, blocking until the store's index passes a given index.
+
+        :param key: Key or key prefix to get
+        :param recurse: Get all keys with the given prefix
+        :param index: Block until the store's index is greater than this index
+        :param wait: Maximum time in seconds to block
+        :return: Tuple of the store's index and list of matching entries
+        """
+        with self.condition:
+            if index is not None:
+                deadline = time.time() + (wait if wait is not None else DEFAULT_WAIT)
+                while self.index <= index and time.time() < deadline and not self.closed:
+                    self.condition.wait(deadline - time.time())
+
+            if recurse:
+                entries = [dict(v) for k, v in sorted(self.entries.items()) if k.startswith(key)]
+            else:
+                entries = [dict(self.entries[key])] if key in self.entries else []
+
+            return self.index, entries
+
+    def check(self, key, cas):
+        """Check if a check-and-set against a key would succeed, must hold the condition.
+
+        :param key: Key to check
+        :param cas: Modify index the key must have, 0 if it must not exist
+        :return: True if the check passes
+        """
+        if cas is None:
+            return True
+
+        entry = self.entries.get(key)
+        return entry is None if cas == 0 else entry is not None and entry['ModifyIndex'] == cas
+
+    def set(self, key, value, flags=0):
+        """Set a key, must hold the condition.
+
+        :param key: Key to set
+        :param value: Value as bytes
+        :param flags: Flags to store with the value
+        :return: The new entry
+        """
+        self.index += 1
+        entry = self.entries.get(key, {'Key': key, 'CreateIndex': self.index, 'LockIndex': 0})
+        entry.update({
+            'Value': base64.b64encode(value).decode('ascii') if value else None,
+            'Flags': flags,
+            'ModifyIndex': self.index,
+        })
+        self.entries[key] = entry
+        self.condition.notify_all()
+        return dict(entry)
+
+    def delete(self, key, recurse=False):
+        """Delete a key, must hold the condition.
+
+        :param key: Key or key prefix to delete
+        :param recurse: Delete all keys with the given prefix
+        :return: None
+        """
+        self.index += 1
+        for k in [k for k in self.entries if (k.startswith(key) if recurse else k == key)]:
+            del self.entries[k]
+        self.condition.notify_all()
+
+
+class ConsulRequestHandler(BaseHTTPRequestHandler):
+    """Handle requests to the KV and transaction endpoints of the Consul HTTP API.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def __reply(self, code, body, index=None):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Consul-Index', str(index if index is not None else self.server.store.index))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def __parse(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.requests.append((self.command, url.path, params))
+        return url.path, params, body
+
+    def do_GET(self):
+        path, params, _ = self.__parse()
+        if not path.startswith('/v1/kv/'):
+            return self.__reply(404, b'')
+
+        wait = None
+        match = WAIT_PATTERN.match(params.get('wait', ''))
+        if match:
+            wait = int(match.group(1)) * WAIT_UNITS[match.group(2)]
+
+        index = int(params['index']) if params.get('index') else None
+        index, entries = self.server.store.get(unquote(path[len('/v1/kv/'):]), 'recurse' in params, index, wait)
+        if not entries:
+            return self.__reply(404, b'', index)
+
+        return self.__reply(200, entries, index)
+
+    def do_PUT(self):
+        path, params, body = self.__parse()
+        store = self.server.store
+
+        if path == '/v1/txn':
+            return self.__txn(body)
+        if not path.startswith('/v1/kv/'):
+            return self.__reply(404, b'')
+        if len(body) > MAX_VALUE_SIZE:
+            return self.__reply(413, 'Value exceeds {0} byte limit'.format(MAX_VALUE_SIZE).encode('utf-8'))
+
+        key = unquote(path[len('/v1/kv/'):])
+        with store.condition:
+            if not store.check(key, int(params['cas']) if 'cas' in params else None):
+                return self.__reply(200, False)
+
+            store.set(key, body, int(params.get('flags', 0)))
+            return self.__reply(200, True)
+
+    def do_DELETE(self):
+        path, params, _ = self.__parse()
+        if not path.startswith('/v1/kv/'):
+            return self.__reply(404, b'')
+
+        with self.server.store.condition:
+            self.server.store.delete(unquote(path[len('/v1/kv/'):]), 'recurse' in params)
+            return self.__reply(200, True)
+
+    def __txn(self, body):
+        store = self.server.store
+        if len(body) > MAX_TXN_SIZE:
+            return self.__reply(413, b'Request body too large')
+
+        operations = json.loads(body.decode('utf-8'))
+        if len(operations) > MAX_TXN_OPERATIONS:
+            return self.__reply(413, b'Transaction contains too many operations')
+
+        with store.condition:
+            errors = []
+            for i, op in enumerate(operations):
+                kv = op['KV']
+                if kv['Verb'] == 'cas' and not store.check(kv['Key'], kv.get('Index', 0)):
+                    errors.append({'OpIndex': i, 'What': 'failed to set key "{0}", index is stale'.format(kv['Key'])})
+                elif kv['Verb'] not in ('set', 'cas', 'get', 'delete'):
+                    errors.append({'OpIndex': i, 'What': 'unknown KV verb "{0}"'.format(kv['Verb'])})
+
+            if errors:
+                return self.__reply(409, {'Results': None, 'Errors': errors})
+
+            results = []
+            for op in operations:
+                kv = op['KV']
+                if kv['Verb'] in ('set', 'cas'):
+                    value = base64.b64decode(kv['Value']) if kv.get('Value') else b''
+                    results.append({'KV': store.set(kv['Key'], value, kv.get('Flags', 0))})
+                elif kv['Verb'] == 'get' and kv['Key'] in store.entries:
+                    results.append({'KV': dict(store.entries[kv['Key']])})
+                elif kv['Verb'] == 'delete':
+                    store.delete(kv['Key'])
+
+            return self.__reply(200, {'Results': results, 'Errors': None})
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeConsul(object):
+    """In-process stand-in for a Consul agent's KV and transaction HTTP API, for tests and benchmarks.
+
+    Supports recursive gets, blocking queries, check-and-set and transactions, and enforces Consul's size limits.
+    """
+
+    def __init__(self):
+        self.store = KVStore()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ConsulRequestHandler)
+        self.server.store = self.store
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def uri(self):
+        return 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    @property
+    def requests(self):
+        """List of tuples of method, path and query parameters of requests received.
+        """
+        return self.server.requests
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.store.condition:
+            self.store.closed = True
+            self.store.condition.notify_all()
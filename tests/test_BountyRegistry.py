@@ -7,6 +7,8 @@ import pytest
 from eth_tester.exceptions import TransactionFailed
 from ethereum.utils import sha3
 
+from contractor import steps
+
 USER_STARTING_BALANCE = 3000000 * 10 ** 18
 ARBITER_STARTING_BALANCE = 50000000 * 10 ** 18
 ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
@@ -298,6 +300,20 @@ def test_undeprecate_resets_values(bounty_registry):
     assert deprecatedBlock == 0 and not rollover
 
 
+def test_deactivate_waits_for_bounties_to_resolve(bounty_registry):
+    BountyRegistry = bounty_registry.BountyRegistry
+    network = bounty_registry.network
+
+    steps.run(network, bounty_registry.deployer, to_deploy={'BountyRegistry'}, deactivate=True)
+
+    deprecated_block = BountyRegistry.functions.deprecatedBlock().call()
+    assertion_reveal_window = BountyRegistry.functions.assertionRevealWindow().call()
+    max_duration = BountyRegistry.functions.MAX_DURATION().call()
+
+    assert deprecated_block > 0
+    assert network.block_number() >= deprecated_block + (assertion_reveal_window + max_duration) * 2
+
+
 def test_post_bounty(bounty_registry):
     NectarToken = bounty_registry.NectarToken
     BountyRegistry = bounty_registry.BountyRegistry
@@ -1039,6 +1055,54 @@ def test_only_owner_can_modify_arbiters(bounty_registry):
             {'from': non_owner.address})
 
 
+def test_only_owner_can_add_arbiters_in_batch(bounty_registry):
+    BountyRegistry = bounty_registry.BountyRegistry
+    network = bounty_registry.network
+
+    non_owner = BountyRegistry.ambassadors[0]
+
+    with pytest.raises(TransactionFailed):
+        BountyRegistry.functions.addArbiters([non_owner.address], network.block_number()).transact(
+            {'from': non_owner.address})
+
+
+def test_should_allow_adding_arbiters_in_batch(bounty_registry):
+    BountyRegistry = bounty_registry.BountyRegistry
+    network = bounty_registry.network
+
+    owner = BountyRegistry.owner
+    experts = [e.address for e in BountyRegistry.experts]
+    arbiter_count = BountyRegistry.functions.arbiterCount().call()
+
+    BountyRegistry.functions.addArbiters(experts, network.block_number()).transact({'from': owner})
+
+    assert all(BountyRegistry.functions.isArbiter(e).call() for e in experts)
+    assert BountyRegistry.functions.arbiterCount().call() == arbiter_count + len(experts)
+
+
+def test_add_arbiters_batch_gas(bounty_registry):
+    BountyRegistry = bounty_registry.BountyRegistry
+    network = bounty_registry.network
+
+    def gas_used(txhash):
+        return network.w3.eth.getTransactionReceipt(txhash).gasUsed
+
+    owner = BountyRegistry.owner
+    ambassadors = [a.address for a in BountyRegistry.ambassadors]
+    experts = [e.address for e in BountyRegistry.experts]
+
+    individual = 0
+    for ambassador in ambassadors:
+        individual += gas_used(
+            BountyRegistry.functions.addArbiter(ambassador, network.block_number()).transact({'from': owner}))
+
+    batched = gas_used(BountyRegistry.functions.addArbiters(experts, network.block_number()).transact({'from': owner}))
+
+    logging.info('Gas to add arbiters, individual: %s for %s, batched: %s for %s', individual, len(ambassadors),
+                 batched, len(experts))
+    assert batched / len(experts) < individual / len(ambassadors)
+
+
 def test_should_allow_removing_arbiters(bounty_registry, eth_tester):
     BountyRegistry = bounty_registry.BountyRegistry
     network = bounty_registry.network
@@ -1,6 +1,11 @@
+import logging
+
 import pytest
+from eth_account import Account
 from eth_tester.exceptions import TransactionFailed
 
+logger = logging.getLogger(__name__)
+
 USER_STARTING_BALANCE = 3000000 * 10 ** 18
 ARBITER_STARTING_BALANCE = 50000000 * 10 ** 18
 
@@ -24,3 +29,53 @@ def test_transfer(nectar_token):
     NectarToken.functions.transfer(receiver.address, USER_STARTING_BALANCE).transact({'from': sender.address})
     assert NectarToken.functions.balanceOf(receiver.address).call() == 2 * USER_STARTING_BALANCE
     assert NectarToken.functions.balanceOf(sender.address).call() == 0
+
+
+def test_mint_batch(nectar_token):
+    NectarToken = nectar_token.NectarToken
+
+    users = [u.address for u in NectarToken.users]
+    amounts = [i * 10 ** 18 for i in range(len(users))]
+    NectarToken.functions.mintBatch(users, amounts).transact({'from': NectarToken.owner})
+
+    for user, amount in zip(users, amounts):
+        assert NectarToken.functions.balanceOf(user).call() == USER_STARTING_BALANCE + amount
+
+
+def test_mint_batch_mismatched_lengths(nectar_token):
+    NectarToken = nectar_token.NectarToken
+
+    users = [u.address for u in NectarToken.users]
+    with pytest.raises(TransactionFailed):
+        NectarToken.functions.mintBatch(users, [1]).transact({'from': NectarToken.owner})
+
+
+def test_only_minter_can_mint_batch(nectar_token):
+    NectarToken = nectar_token.NectarToken
+
+    user = NectarToken.users[0]
+    with pytest.raises(TransactionFailed):
+        NectarToken.functions.mintBatch([user.address], [1]).transact({'from': user.address})
+
+
+def test_mint_batch_gas(nectar_token, eth_tester):
+    NectarToken = nectar_token.NectarToken
+    network = nectar_token.network
+
+    def new_address():
+        return eth_tester.add_account(Account.create().privateKey.hex())
+
+    def gas_used(txhash):
+        return network.w3.eth.getTransactionReceipt(txhash).gasUsed
+
+    count = 20
+
+    individual = 0
+    for user in [new_address() for _ in range(count)]:
+        individual += gas_used(NectarToken.functions.mint(user, 1).transact({'from': NectarToken.owner}))
+
+    users = [new_address() for _ in range(count)]
+    batched = gas_used(NectarToken.functions.mintBatch(users, [1] * count).transact({'from': NectarToken.owner}))
+
+    logger.info('Gas to mint for %s users, individual: %s, batched: %s', count, individual, batched)
+    assert batched < individual
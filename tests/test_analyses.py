@@ -0,0 +1,140 @@
+import io
+import json
+import os
+import stat
+
+from contractor.analyses import analyze_directory, pipeline
+from contractor.analyses.findings import Finding, iter_json_array, load_baseline, parse_slither_json, \
+    parse_solium_gcc
+
+BASEDIR = os.path.join(os.path.dirname(__file__), '..')
+SRCDIR = os.path.join(BASEDIR, 'contracts')
+EXTDIR = os.path.join(BASEDIR, 'external')
+
+FAKE_SLITHER = '''#!/bin/sh
+if [ "$1" = "--version" ]; then echo 1.0.0; exit 0; fi
+echo "$@" >> {log}
+while [ $# -gt 1 ]; do
+    if [ "$1" = "--json" ]; then out=$2; fi
+    shift
+done
+printf '{{"success": true, "error": null, "results": {{"detectors": [{{"check": "naming-convention", \
+"impact": "Informational", "description": "Issue in %s#3", "elements": [{{"source_mapping": \
+{{"filename_relative": "%s", "lines": [3, 4]}}}}]}}]}}}}' "$1" "$1" > "$out"
+'''
+
+FAKE_SOLIUM = '''#!/bin/sh
+if [ "$1" = "--version" ]; then echo 1.2.5; exit 0; fi
+echo "$@" >> {log}
+echo "$4:1:1: warning: Use double quotes for string literals. [quotes]"
+exit 0
+'''
+
+FAKE_SOLIUM_REPEATED = '''#!/bin/sh
+if [ "$1" = "--version" ]; then echo 1.2.5; exit 0; fi
+echo "$4:2:20: warning: Use double quotes for string literals. [quotes]"
+echo "$4:3:20: warning: Use double quotes for string literals. [quotes]"
+exit 0
+'''
+
+
+def fake_tools(tmpdir, monkeypatch, solium=FAKE_SOLIUM):
+    bindir = tmpdir.mkdir('bin')
+    log = tmpdir.join('calls.log')
+    for tool, script in (('slither', FAKE_SLITHER), ('solium', solium)):
+        path = bindir.join(tool)
+        path.write(script.format(log=log))
+        path.chmod(path.stat().mode | stat.S_IEXEC)
+
+    monkeypatch.setenv('PATH', str(bindir) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setattr(pipeline, 'configure_compiler', lambda solc_version: 'solc')
+    return log
+
+
+def test_analyze_directory_caches_results(tmpdir, monkeypatch):
+    log = fake_tools(tmpdir, monkeypatch)
+    cache_dir = str(tmpdir.join('cache'))
+    sources = [f for f in os.listdir(SRCDIR) if f.endswith('.sol')]
+
+    output = io.StringIO()
+    assert analyze_directory('v0.5.3', SRCDIR, EXTDIR, cache_dir=cache_dir, output_format='json', output=output) != 0
+    assert len(log.readlines()) == 2 * len(sources)
+
+    log.remove()
+    cached = io.StringIO()
+    assert analyze_directory('v0.5.3', SRCDIR, EXTDIR, cache_dir=cache_dir, output_format='json', output=cached) != 0
+    assert not log.exists()
+    assert cached.getvalue() == output.getvalue()
+
+
+def test_analyze_directory_baseline(tmpdir, monkeypatch):
+    fake_tools(tmpdir, monkeypatch)
+    sources = [f for f in os.listdir(SRCDIR) if f.endswith('.sol')]
+
+    output = io.StringIO()
+    assert analyze_directory('v0.5.3', SRCDIR, EXTDIR, output_format='json', output=output) != 0
+
+    report = json.loads(output.getvalue())
+    assert len(report['findings']) == 2 * len(sources)
+    assert all(finding['new'] for finding in report['findings'])
+
+    # Only findings which are not in the baseline fail the analysis
+    baseline = load_baseline(io.StringIO(output.getvalue()))
+    assert analyze_directory('v0.5.3', SRCDIR, EXTDIR, output=io.StringIO(), baseline=baseline) == 0
+
+    sarif = io.StringIO()
+    assert analyze_directory('v0.5.3', SRCDIR, EXTDIR, output_format='sarif', output=sarif,
+                             baseline=set(list(baseline)[1:])) != 0
+
+    runs = json.loads(sarif.getvalue())['runs']
+    assert sorted(run['tool']['driver']['name'] for run in runs) == ['slither', 'solium']
+    assert sum(result['baselineState'] == 'new' for run in runs for result in run['results']) == 1
+
+
+def test_analyze_directory_repeated_findings(tmpdir, monkeypatch):
+    fake_tools(tmpdir, monkeypatch, solium=FAKE_SOLIUM_REPEATED)
+    srcdir = tmpdir.mkdir('contracts')
+    srcdir.join('A.sol').write("contract A {\n    string a = 'a';\n    string b = 'a';\n}\n")
+
+    output = io.StringIO()
+    assert analyze_directory('v0.5.3', str(srcdir), output_format='json', output=output) != 0
+
+    # Identical findings on different lines are both reported, and each is covered by its own baseline entry
+    findings = [f for f in json.loads(output.getvalue())['findings'] if f['tool'] == 'solium']
+    assert [f['line'] for f in findings] == [2, 3]
+    assert findings[0]['fingerprint'] != findings[1]['fingerprint']
+
+    baseline = load_baseline(io.StringIO(output.getvalue()))
+    baseline.remove(findings[1]['fingerprint'])
+    assert analyze_directory('v0.5.3', str(srcdir), output=io.StringIO(), baseline=baseline) != 0
+
+
+def test_iter_json_array():
+    elements = [{'check': 'a' * 10, 'n': i} for i in range(20)]
+    f = io.StringIO(json.dumps({'success': True, 'results': {'detectors': elements}}))
+    assert list(iter_json_array(f, chunk_size=7)) == elements
+
+    assert list(iter_json_array(io.StringIO('{"success": true, "results": {}}'))) == []
+
+
+def test_parse_findings():
+    old = io.StringIO(json.dumps([{'check': 'reentrancy-eth', 'impact': 'High', 'description': 'Reentrancy in A#10'}]))
+    new = io.StringIO(json.dumps({'success': True, 'error': None, 'results': {'detectors': [
+        {'check': 'reentrancy-eth', 'impact': 'High', 'description': 'Reentrancy in A#12',
+         'elements': [{'source_mapping': {'filename_relative': 'contracts/A.sol', 'lines': [12]}}]}]}}))
+
+    finding, = parse_slither_json(old)
+    assert finding.severity == 'high'
+    moved, = parse_slither_json(new)
+    assert (moved.path, moved.line) == ('contracts/A.sol', 12)
+
+    finding = parse_solium_gcc('contracts/A.sol:3:5: error: Avoid low-level calls. [security/no-low-level-calls]\n')
+    assert (finding.rule, finding.severity) == ('security/no-low-level-calls', 'medium')
+    assert (finding.line, finding.column) == (3, 5)
+    assert parse_solium_gcc('Linting file contracts/A.sol') is None
+
+    # Fingerprints do not change when a finding moves to another line
+    a = Finding('slither', 'naming-convention', 'informational', 'Issue in A#3', 'A.sol', 3)
+    b = Finding('slither', 'naming-convention', 'informational', 'Issue in A#5', 'A.sol', 5)
+    assert a.fingerprint == b.fingerprint
+    assert Finding.from_dict(a.to_dict()).fingerprint == a.fingerprint
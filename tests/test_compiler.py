@@ -0,0 +1,248 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from contractor import compiler
+from contractor.compiler import DEFAULT_SOLC_VERSION, MANIFEST_FILENAME, ImportGraph, compile_directory, \
+    normalize_bytecode, parse_imports, resolve_import, split_metadata, watch_directory
+from contractor.config import CompileProfile
+from contractor.constants import DEFAULT_OPTIMIZER_RUNS, VERIFY_OUTPUTS
+
+BASEDIR = os.path.join(os.path.dirname(__file__), '..')
+SRCDIR = os.path.join(BASEDIR, 'contracts')
+EXTDIR = os.path.join(BASEDIR, 'external')
+
+SWARM_METADATA = 'a165627a7a72305820{0}0029'
+
+
+def test_parse_imports():
+    source = '''
+    pragma solidity ^0.5.0;
+
+    import "./A.sol";
+    import './B.sol' as B;
+    import * as C from "lib/C.sol";
+    import {D, E as F} from "../D.sol";
+    // import "./Commented.sol";
+    /* import "./AlsoCommented.sol"; */
+
+    contract Foo {}
+    '''
+    assert parse_imports(source) == ['./A.sol', './B.sol', 'lib/C.sol', '../D.sol']
+
+
+def test_resolve_import():
+    remappings = ['openzeppelin-solidity=external/openzeppelin-solidity', 'polyswarm=external/polyswarm']
+
+    assert resolve_import('BountyRegistry.sol', './NectarToken.sol', remappings) == 'NectarToken.sol'
+    assert resolve_import('BountyRegistry.sol', 'polyswarm/lifecycle/Deprecatable.sol', remappings) == \
+        'external/polyswarm/lifecycle/Deprecatable.sol'
+    assert resolve_import('external/polyswarm/lifecycle/Deprecatable.sol', '../access/roles/DeprecatorRole.sol',
+                          remappings) == 'external/polyswarm/access/roles/DeprecatorRole.sol'
+    assert resolve_import('ERC20Relay.sol', 'external/polyswarm/access/roles/VerifierRole.sol', remappings) == \
+        'external/polyswarm/access/roles/VerifierRole.sol'
+
+
+def test_import_graph():
+    sources = {
+        'A.sol': 'import "./B.sol";',
+        'B.sol': 'import "./C.sol";',
+        'C.sol': 'contract C {}',
+        'D.sol': 'contract D {}',
+    }
+    graph = ImportGraph(sources, [])
+
+    assert graph.closure('A.sol') == {'A.sol', 'B.sol', 'C.sol'}
+    assert graph.dependents({'C.sol'}) == {'A.sol', 'B.sol', 'C.sol'}
+    assert graph.dependents({'D.sol'}) == {'D.sol'}
+
+    sources['C.sol'] = 'import "./D.sol";'
+    assert graph.update(sources) == {'C.sol'}
+    assert graph.closure('A.sol') == {'A.sol', 'B.sol', 'C.sol', 'D.sol'}
+    assert graph.dependents({'D.sol'}) == {'A.sol', 'B.sol', 'C.sol', 'D.sol'}
+
+
+def test_compile_directory_uses_cache(tmpdir, monkeypatch):
+    outdir = str(tmpdir.join('build'))
+    cache_dir = str(tmpdir.join('cache'))
+
+    assert compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, outdir, [EXTDIR], cache_dir=cache_dir)
+    artifacts = {f: tmpdir.join('build', f).read() for f in os.listdir(outdir)}
+
+    def fail(*args, **kwargs):
+        pytest.fail('solc invoked for unchanged sources')
+
+    monkeypatch.setattr(compiler, 'compile_standard', fail)
+
+    mtimes = {f: os.path.getmtime(os.path.join(outdir, f)) for f in os.listdir(outdir)}
+
+    assert not compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, outdir, [EXTDIR], cache_dir=cache_dir)
+    assert {f: tmpdir.join('build', f).read() for f in os.listdir(outdir)} == artifacts
+    assert {f: os.path.getmtime(os.path.join(outdir, f)) for f in os.listdir(outdir)} == mtimes
+
+
+def test_compile_directory_only_recompiles_changed_sources(tmpdir, monkeypatch):
+    srcdir = str(tmpdir.join('contracts'))
+    outdir = str(tmpdir.join('build'))
+    cache_dir = str(tmpdir.join('cache'))
+    shutil.copytree(SRCDIR, srcdir)
+
+    assert compile_directory(DEFAULT_SOLC_VERSION, srcdir, outdir, [EXTDIR], cache_dir=cache_dir)
+
+    compiled = []
+    compile_standard = compiler.compile_standard
+
+    def record(input, **kwargs):
+        compiled.extend(input['settings']['outputSelection'].keys())
+        return compile_standard(input, **kwargs)
+
+    monkeypatch.setattr(compiler, 'compile_standard', record)
+
+    with open(os.path.join(srcdir, 'OfferMultiSig.sol'), 'a') as f:
+        f.write('\n// Changed\n')
+
+    compile_directory(DEFAULT_SOLC_VERSION, srcdir, outdir, [EXTDIR], cache_dir=cache_dir)
+    assert sorted(compiled) == ['OfferMultiSig.sol', 'OfferRegistry.sol']
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.1)
+
+
+def test_watch_directory_only_recompiles_dependents(tmpdir, monkeypatch):
+    srcdir = str(tmpdir.join('contracts'))
+    outdir = str(tmpdir.join('build'))
+    shutil.copytree(SRCDIR, srcdir)
+
+    compiled = []
+    compile_standard = compiler.compile_standard
+
+    def record(input, **kwargs):
+        output = compile_standard(input, **kwargs)
+        compiled.append(sorted(input['settings']['outputSelection'].keys()))
+        return output
+
+    monkeypatch.setattr(compiler, 'compile_standard', record)
+
+    stop_event = threading.Event()
+    thread = threading.Thread(target=watch_directory, args=(DEFAULT_SOLC_VERSION, srcdir, outdir, [EXTDIR]),
+                              kwargs={'debounce': 0.1, 'stop_event': stop_event})
+    thread.start()
+    try:
+        wait_for(lambda: os.path.exists(os.path.join(outdir, MANIFEST_FILENAME)))
+        del compiled[:]
+
+        with open(os.path.join(srcdir, 'OfferMultiSig.sol'), 'a') as f:
+            f.write('\n// Changed\n')
+
+        wait_for(lambda: compiled)
+    finally:
+        stop_event.set()
+        thread.join()
+
+    assert compiled == [['OfferMultiSig.sol', 'OfferRegistry.sol']]
+
+
+def test_compile_directory_parallel_matches_serial(tmpdir):
+    serial = str(tmpdir.join('serial'))
+    parallel = str(tmpdir.join('parallel'))
+
+    compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, serial, [EXTDIR])
+    compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, parallel, [EXTDIR], jobs=2)
+
+    assert sorted(os.listdir(serial)) == sorted(os.listdir(parallel))
+    for f in os.listdir(serial):
+        assert tmpdir.join('serial', f).read() == tmpdir.join('parallel', f).read()
+
+
+def test_write_compiler_output_detects_modified_artifacts(tmpdir):
+    outdir = str(tmpdir.join('build'))
+
+    assert compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, outdir, [EXTDIR])
+    assert os.path.isfile(os.path.join(outdir, compiler.MANIFEST_FILENAME))
+
+    # Rewrite an artifact in a different but equivalent form, as pulling from consul does
+    artifact = tmpdir.join('build', 'NectarToken.json')
+    artifact.write(json.dumps(json.loads(artifact.read())))
+    assert not compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, outdir, [EXTDIR])
+
+    # Modify an artifact behind the manifest's back
+    contract = json.loads(artifact.read())
+    contract['abi'] = []
+    artifact.write(json.dumps(contract))
+    assert compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, outdir, [EXTDIR])
+
+
+def test_split_metadata():
+    metadata = SWARM_METADATA.format('11' * 32)
+    assert split_metadata('0x6080' + metadata) == ('0x6080', {'bzzr0': b'\x11' * 32})
+
+    metadata = 'a2646970667358221220{0}64736f6c634300060c0033'.format('22' * 32)
+    assert split_metadata('6080' + metadata) == ('6080', {'ipfs': b'\x12\x20' + b'\x22' * 32, 'solc': b'\x00\x06\x0c'})
+
+    assert split_metadata('6080') == ('6080', None)
+    assert split_metadata('6080__$0123$__') == ('6080__$0123$__', None)
+
+
+def test_normalize_bytecode():
+    # Contracts created with new are embedded along with their own metadata
+    bytecode = '6080' + SWARM_METADATA.format('11' * 32) + '6060' + SWARM_METADATA.format('22' * 32)
+    assert normalize_bytecode(bytecode) == '60806060'
+
+    # Malformed metadata is left alone
+    bytecode = '6080' + SWARM_METADATA.format('11' * 32)[:-4] + '0030'
+    assert normalize_bytecode(bytecode) == bytecode
+
+
+def test_compile_directory_ignores_metadata_only_changes(tmpdir):
+    srcdir = str(tmpdir.join('contracts'))
+    outdir = str(tmpdir.join('build'))
+    shutil.copytree(SRCDIR, srcdir)
+
+    assert compile_directory(DEFAULT_SOLC_VERSION, srcdir, outdir, [EXTDIR])
+    artifact = json.loads(tmpdir.join('build', 'NectarToken.json').read())
+
+    with open(os.path.join(srcdir, 'NectarToken.sol'), 'a') as f:
+        f.write('\n// Changed\n')
+
+    assert not compile_directory(DEFAULT_SOLC_VERSION, srcdir, outdir, [EXTDIR])
+
+    # The artifact is still updated with the new metadata
+    bytecode = json.loads(tmpdir.join('build', 'NectarToken.json').read())['evm']['bytecode']['object']
+    assert bytecode != artifact['evm']['bytecode']['object']
+    assert normalize_bytecode(bytecode) == normalize_bytecode(artifact['evm']['bytecode']['object'])
+
+    source = tmpdir.join('contracts', 'NectarToken.sol')
+    source.write(source.read().replace('"NCT"', '"NCT2"'))
+
+    assert compile_directory(DEFAULT_SOLC_VERSION, srcdir, outdir, [EXTDIR])
+
+
+def test_compile_directory_profiles(tmpdir, monkeypatch):
+    outdir = str(tmpdir.join('build'))
+    profile = CompileProfile('verify', {'outputs': VERIFY_OUTPUTS}, {'NectarToken': {'optimizer_runs': 1000000}})
+
+    runs = {}
+    compile_standard = compiler.compile_standard
+
+    def record(input, **kwargs):
+        for unit in input['settings']['outputSelection']:
+            runs[unit] = input['settings']['optimizer']['runs']
+        return compile_standard(input, **kwargs)
+
+    monkeypatch.setattr(compiler, 'compile_standard', record)
+
+    assert compile_directory(DEFAULT_SOLC_VERSION, SRCDIR, outdir, [EXTDIR], profile=profile)
+    assert runs['NectarToken.sol'] == 1000000
+    assert runs['BountyRegistry.sol'] == DEFAULT_OPTIMIZER_RUNS
+
+    artifact = json.loads(tmpdir.join('build', 'NectarToken.json').read())
+    assert 'metadata' in artifact
+    assert artifact['evm']['deployedBytecode']['object']
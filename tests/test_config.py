@@ -0,0 +1,60 @@
+import io
+
+import pytest
+
+from contractor.constants import DEPLOY_OUTPUTS, GAS_OUTPUTS
+from contractor.config import CompilerConfig
+
+
+def test_compiler_config_profiles():
+    config = CompilerConfig.from_yaml(io.StringIO('''
+compiler:
+  profiles:
+    deploy:
+      optimizer_runs: 500
+      contracts:
+        NectarToken:
+          optimizer_runs: 1000000
+    lean:
+      outputs: [abi, evm.bytecode.object]
+'''))
+
+    assert set(config.profiles) == {'deploy', 'verify', 'gas', 'lean'}
+
+    deploy = config.profile('deploy')
+    assert deploy.options() == {'optimize': True, 'optimizer_runs': 500, 'outputs': DEPLOY_OUTPUTS}
+    assert deploy.options('NectarToken')['optimizer_runs'] == 1000000
+    assert deploy.options('BountyRegistry')['optimizer_runs'] == 500
+
+    assert config.profile('gas').options()['outputs'] == GAS_OUTPUTS
+    assert config.profile('lean').options()['outputs'] == ['abi', 'evm.bytecode.object']
+
+    with pytest.raises(ValueError):
+        config.profile('missing')
+
+
+def test_compiler_config_without_file():
+    config = CompilerConfig.from_yaml(None)
+    assert config.profile('deploy').options()['outputs'] == DEPLOY_OUTPUTS
+
+
+def test_compiler_config_contract_without_options():
+    config = CompilerConfig.from_yaml(io.StringIO('''
+profiles:
+  deploy:
+    contracts:
+      NectarToken:
+'''))
+
+    deploy = config.profile('deploy')
+    assert deploy.options('NectarToken') == deploy.options()
+
+
+@pytest.mark.parametrize('profile', [
+    {'outputs': ['abi']},
+    {'optimizer_runs': 0},
+    {'contracts': {'NectarToken': {'optimiser_runs': 1000}}},
+])
+def test_compiler_config_invalid_profiles(profile):
+    with pytest.raises(ValueError):
+        CompilerConfig.from_dict({'profiles': {'invalid': profile}})
@@ -0,0 +1,195 @@
+import base64
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from contractor.consulclient import ConsulClient
+from fakeconsul import MAX_VALUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Roughly the sizes of our compiled artifacts, from small libraries up to BountyRegistry
+ARTIFACT_SIZES = [8 * 1024, 32 * 1024, 96 * 1024, 256 * 1024, 480 * 1024]
+
+
+def artifact(name, size, seed=0):
+    rng = random.Random(name + str(seed))
+    abi = [{'type': 'function', 'name': 'f{0}'.format(i), 'inputs': [], 'outputs': []} for i in range(20)]
+    return {'contractName': name, 'abi': abi,
+            'evm': {'bytecode': {'object': ''.join(rng.choice('0123456789abcdef') for _ in range(size))}}}
+
+
+def write_artifacts(directory, artifacts):
+    for name, value in artifacts.items():
+        with open(os.path.join(str(directory), name + '.json'), 'w') as f:
+            json.dump(value, f)
+
+
+def txn_operations(consul):
+    return [r for r in consul.requests if r[1] == '/v1/txn']
+
+
+def test_push_only_writes_changed_keys(consul, tmpdir):
+    client = ConsulClient(consul.uri, '')
+    indir = tmpdir.mkdir('in')
+    artifacts = {'A': artifact('A', 1024), 'B': artifact('B', 1024)}
+    write_artifacts(indir, artifacts)
+
+    assert client.push_config('test', str(indir))
+    assert len(txn_operations(consul)) == 1
+
+    # Nothing changed, nothing is written
+    del consul.requests[:]
+    assert client.push_config('test', str(indir))
+    assert not txn_operations(consul)
+
+    artifacts['B']['abi'] = []
+    write_artifacts(indir, artifacts)
+    index = consul.store.entries['chain/test/A']['ModifyIndex']
+
+    assert client.push_config('test', str(indir))
+    assert consul.store.entries['chain/test/A']['ModifyIndex'] == index
+    assert json.loads(client.client.kv.get('chain/test/B')[1]['Value'].decode('utf-8')) == artifacts['B']
+
+
+def test_push_does_not_overwrite_concurrent_changes(consul, tmpdir, monkeypatch):
+    client = ConsulClient(consul.uri, '')
+    indir = tmpdir.mkdir('in')
+    write_artifacts(indir, {'A': artifact('A', 1024)})
+    assert client.push_config('test', str(indir))
+
+    write_artifacts(indir, {'A': artifact('A', 1024, seed=1)})
+
+    # Another client modifies the key after we read it
+    remote_values = client._ConsulClient__remote_values
+
+    def modify_after_read(base_key):
+        ret = remote_values(base_key)
+        client.client.kv.put('chain/test/A', 'modified')
+        return ret
+
+    monkeypatch.setattr(client, '_ConsulClient__remote_values', modify_after_read)
+
+    assert not client.push_config('test', str(indir))
+    assert client.client.kv.get('chain/test/A')[1]['Value'] == b'modified'
+
+
+def test_push_pull_chunked_values(consul, tmpdir):
+    client = ConsulClient(consul.uri, '')
+    indir = tmpdir.mkdir('in')
+    outdir = tmpdir.join('out')
+
+    artifacts = {'BountyRegistry': artifact('BountyRegistry', 1024 * 1024), 'Small': artifact('Small', 1024)}
+    write_artifacts(indir, artifacts)
+
+    assert client.push_config('test', str(indir))
+    assert any('.chunks/' in key for key in consul.store.entries)
+    assert all(len(base64.b64decode(entry['Value'] or '')) <= MAX_VALUE_SIZE for entry in consul.store.entries.values())
+
+    client.pull_config('test', str(outdir))
+    assert sorted(os.listdir(str(outdir))) == ['BountyRegistry.json', 'Small.json']
+    for name, value in artifacts.items():
+        assert json.loads(outdir.join(name + '.json').read()) == value
+
+    # Chunks of replaced values are cleaned up
+    chunks = {key for key in consul.store.entries if '.chunks/' in key}
+    artifacts['BountyRegistry']['abi'] = []
+    write_artifacts(indir, artifacts)
+    assert client.push_config('test', str(indir))
+    assert not chunks & set(consul.store.entries)
+
+
+def test_push_values_under_value_limit_as_json(consul, tmpdir):
+    client = ConsulClient(consul.uri, '')
+    indir = tmpdir.mkdir('in')
+
+    # Larger than a transaction can hold, but within Consul's value size limit
+    artifacts = {'Medium': artifact('Medium', 192 * 1024), 'Large': artifact('Large', 480 * 1024)}
+    write_artifacts(indir, artifacts)
+
+    assert client.push_config('test', str(indir))
+    assert not any('.chunks/' in key for key in consul.store.entries)
+    for name, value in artifacts.items():
+        entry = consul.store.entries['chain/test/' + name]
+        assert entry['Flags'] == 0
+        assert json.loads(base64.b64decode(entry['Value']).decode('utf-8')) == value
+
+    # Check-and-set still applies to values written outside a transaction
+    artifacts['Large']['abi'] = []
+    write_artifacts(indir, artifacts)
+    index = consul.store.entries['chain/test/Medium']['ModifyIndex']
+    assert client.push_config('test', str(indir))
+    assert consul.store.entries['chain/test/Medium']['ModifyIndex'] == index
+    assert json.loads(client.client.kv.get('chain/test/Large')[1]['Value'].decode('utf-8')) == artifacts['Large']
+
+
+def test_sync_follow(consul, tmpdir):
+    client = ConsulClient(consul.uri, '')
+    outdir = tmpdir.join('out')
+    hook_log = tmpdir.join('hook.log')
+
+    stop_event = threading.Event()
+    errors = []
+
+    def follow():
+        try:
+            client.sync_config('test', str(outdir), follow=True,
+                               hook='echo "$CONTRACTOR_CHANGED_FILES" >> {0}'.format(hook_log), stop_event=stop_event)
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=follow, daemon=True)
+    thread.start()
+
+    def wait_for(condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    client.client.kv.put('chain/test/A', json.dumps({'a': 1}))
+    assert wait_for(lambda: outdir.join('A.json').exists())
+    assert wait_for(lambda: hook_log.exists() and 'A.json' in hook_log.read())
+
+    client.client.kv.put('chain/test/A', json.dumps({'a': 2}))
+    assert wait_for(lambda: json.loads(outdir.join('A.json').read()) == {'a': 2})
+
+    client.client.kv.delete('chain/test/A')
+    assert wait_for(lambda: not outdir.join('A.json').exists())
+
+    # Wake the blocking query so the follower sees it has been stopped
+    stop_event.set()
+    client.client.kv.put('other/B', '')
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not errors
+
+
+def test_push_pull_benchmark(consul, tmpdir):
+    client = ConsulClient(consul.uri, '')
+    indir = tmpdir.mkdir('in')
+    outdir = tmpdir.join('out')
+
+    count = 25
+    artifacts = {'Contract{0}'.format(i): artifact('Contract{0}'.format(i), ARTIFACT_SIZES[i % len(ARTIFACT_SIZES)])
+                 for i in range(count)}
+    write_artifacts(indir, artifacts)
+
+    start = time.time()
+    assert client.push_config('test', str(indir))
+    push = time.time() - start
+
+    start = time.time()
+    assert client.push_config('test', str(indir))
+    unchanged_push = time.time() - start
+
+    start = time.time()
+    client.pull_config('test', str(outdir))
+    pull = time.time() - start
+
+    assert len(os.listdir(str(outdir))) == count
+    logger.info('Consul with %s artifacts, push: %.3fs, unchanged push: %.3fs, pull: %.3fs', count, push,
+                unchanged_push, pull)
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Query
+
+from contractor import db
+from contractor.network import Chain
+
+EPOCH = datetime(2019, 1, 1)
+
+
+def record(session, community, network, chain, days, succeeded=True, contracts=None):
+    deployment = db.Deployment(community, network, 1337, chain, succeeded=succeeded,
+                               timestamp=EPOCH + timedelta(days=days))
+    session.add(deployment)
+    session.commit()
+
+    for name, address in (contracts or {}).items():
+        session.add(db.Contract(deployment, name, True, address, db.store_json_blob(session, []),
+                                db.store_blob(session, b'\x00'), {}))
+    session.commit()
+
+    return deployment
+
+
+def test_migrate_adds_indexes(tmpdir):
+    engine = create_engine('sqlite:///{0}'.format(tmpdir.join('legacy.db')))
+    db.Base.metadata.create_all(bind=engine, tables=[db.Deployment.__table__, db.Contract.__table__])
+    engine.execute('DROP INDEX ix_deployments_lookup')
+    engine.execute('DROP INDEX ix_contracts_deployment_name')
+
+    assert db.migrate(engine) == len(db.MIGRATIONS)
+    assert {index['name'] for index in inspect(engine).get_indexes('deployments')} == {'ix_deployments_lookup'}
+    assert {index['name'] for index in inspect(engine).get_indexes('contracts')} == {'ix_contracts_deployment_name'}
+
+    with engine.connect() as connection:
+        assert db.schema_version(connection) == len(db.MIGRATIONS)
+    assert db.migrate(engine) == 0
+
+
+def test_migrate_moves_contents_to_blobs(tmpdir):
+    engine = create_engine('sqlite:///{0}'.format(tmpdir.join('legacy.db')))
+    engine.execute('CREATE TABLE deployments (id INTEGER PRIMARY KEY, community VARCHAR, network VARCHAR, '
+                   'network_id INTEGER, chain VARCHAR(9), commit_hash VARCHAR, tree_dirty BOOLEAN, '
+                   'succeeded BOOLEAN, timestamp DATETIME)')
+    engine.execute('CREATE TABLE contracts (id INTEGER PRIMARY KEY, name VARCHAR, deployed BOOLEAN, address VARCHAR, '
+                   'abi JSON, bytecode BLOB, config JSON, deployment_id INTEGER REFERENCES deployments (id))')
+    engine.execute("INSERT INTO deployments VALUES (1, 'epsilon', 'gamma', 1337, 'HOMECHAIN', NULL, NULL, 1, "
+                   "'2019-01-01 00:00:00.000000')")
+    for i in range(3):
+        engine.execute('INSERT INTO contracts VALUES (?, ?, 1, NULL, ?, ?, NULL, 1)', i + 1, 'Contract{0}'.format(i),
+                       '[{"type": "constructor"}]', b'\x60\x80' * (i % 2 + 1))
+
+    assert db.migrate(engine) == len(db.MIGRATIONS)
+    assert engine.execute('SELECT COUNT(*) FROM blobs').scalar() == 3
+    assert engine.execute('SELECT COUNT(*) FROM contracts WHERE abi IS NOT NULL OR bytecode IS NOT NULL').scalar() == 0
+
+    session = db.connect('sqlite:///{0}'.format(tmpdir.join('legacy.db')))
+    contracts = session.query(db.Contract).order_by(db.Contract.id).all()
+    assert [c.abi for c in contracts] == [[{'type': 'constructor'}]] * 3
+    assert [c.bytecode for c in contracts] == [b'\x60\x80', b'\x60\x80\x60\x80', b'\x60\x80']
+    assert contracts[0].bytecode_hash == contracts[2].bytecode_hash != contracts[1].bytecode_hash
+
+
+def test_queries(tmpdir):
+    session = db.connect('sqlite:///{0}'.format(tmpdir.join('deployments.db')))
+
+    record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 0, contracts={'NectarToken': '0x1'})
+    second = record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 1, contracts={'NectarToken': '0x2'})
+    record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 2, succeeded=False, contracts={'NectarToken': '0x3'})
+    record(session, 'epsilon', 'gamma', Chain.SIDECHAIN, 3, contracts={'NectarToken': '0x4'})
+    record(session, 'omicron', 'gamma', Chain.HOMECHAIN, 4, contracts={'NectarToken': '0x5'})
+
+    assert db.latest_deployment(session, 'epsilon', 'gamma', Chain.HOMECHAIN).id == second.id
+    assert db.latest_deployment(session, 'epsilon', 'delta', Chain.HOMECHAIN) is None
+
+    history = db.contract_history(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 'NectarToken')
+    assert [c.address for c in history] == ['0x2', '0x1']
+    assert [c.address for c in db.contract_history(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 'NectarToken',
+                                                   limit=1, offset=1)] == ['0x1']
+
+    deployments = db.deployments_between(session, 'epsilon', start=EPOCH + timedelta(days=1),
+                                         end=EPOCH + timedelta(days=3))
+    assert [d.timestamp.day for d in deployments] == [3, 2]
+    assert len(db.deployments_between(session, 'epsilon', chain=Chain.HOMECHAIN, succeeded=True)) == 2
+    assert len(db.deployments_between(session, 'epsilon', limit=2, offset=3)) == 1
+
+    # Identical contents are only stored once
+    assert session.query(db.Blob).count() == 2
+
+
+def test_latest_contracts(tmpdir):
+    session = db.connect('sqlite:///{0}'.format(tmpdir.join('deployments.db')))
+    assert db.latest_contracts(session, 'epsilon', 'gamma', Chain.HOMECHAIN) is None
+
+    record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 0, contracts={'NectarToken': '0x1'})
+    record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 1, contracts={'NectarToken': '0x2', 'ERC20Relay': '0x3'})
+    record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 2, succeeded=False, contracts={'NectarToken': '0x4'})
+
+    expected = {'NectarToken': ('0x2', []), 'ERC20Relay': ('0x3', [])}
+    assert db.latest_contracts(session, 'epsilon', 'gamma', Chain.HOMECHAIN) == expected
+
+    # Cached results are replaced by later deployments
+    assert db.latest_contracts(session, 'epsilon', 'gamma', Chain.HOMECHAIN) is \
+        db.latest_contracts(session, 'epsilon', 'gamma', Chain.HOMECHAIN)
+    record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 3, contracts={'NectarToken': '0x5'})
+    assert db.latest_contracts(session, 'epsilon', 'gamma', Chain.HOMECHAIN) == {'NectarToken': ('0x5', [])}
+
+
+def test_store_blob_concurrently(tmpdir, monkeypatch):
+    uri = 'sqlite:///{0}'.format(tmpdir.join('deployments.db'))
+    other = db.connect(uri)
+    stored = db.store_blob(other, b'\x00')
+    other.commit()
+
+    # Simulate another deployer storing the blob after this session found it missing
+    get = Query.get
+    calls = []
+
+    def stale_get(self, ident):
+        calls.append(ident)
+        return None if len(calls) == 1 else get(self, ident)
+
+    monkeypatch.setattr(Query, 'get', stale_get)
+
+    session = db.connect(uri)
+    blob = db.store_blob(session, b'\x00')
+    assert blob.hash == stored.hash
+    assert len(calls) == 2
+
+    # The transaction is still usable after the conflicting insert is rolled back
+    record(session, 'epsilon', 'gamma', Chain.HOMECHAIN, 0, contracts={'NectarToken': '0x1'})
+    assert session.query(db.Blob).count() == 2
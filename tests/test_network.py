@@ -0,0 +1,13 @@
+from eth_account import Account
+
+from contractor.network import Chain, Network
+
+
+def test_wait_for_blocks_dev_mode(web3):
+    priv_key = Account.create().privateKey
+    network = Network.from_web3('homechain', web3, priv_key, 7500000, 0, 3, 10, {}, Chain.HOMECHAIN, dev_mode=True)
+
+    start = network.block_number()
+    network.wait_for_blocks(500)
+
+    assert network.block_number() >= start + 500
@@ -0,0 +1,84 @@
+import itertools
+import threading
+
+import pytest
+
+from contractor.pipeline import Pipeline, Stage, StageMetrics
+
+
+def test_pipeline_preserves_order():
+    results = []
+    pipeline = Pipeline([
+        Stage('double', lambda x: x * 2),
+        Stage('increment', lambda x: x + 1),
+        Stage('sink', results.append),
+    ])
+
+    pipeline.run(range(100))
+    assert results == [x * 2 + 1 for x in range(100)]
+    assert all(stage.metrics.count == 100 for stage in pipeline.stages)
+    assert pipeline.ingest.count == 100
+
+
+def test_pipeline_backpressure():
+    release = threading.Event()
+    produced = []
+
+    def source():
+        for x in range(10):
+            produced.append(x)
+            yield x
+
+    def slow(x):
+        release.wait()
+        return x
+
+    pipeline = Pipeline([Stage('slow', slow, queue_size=2), Stage('sink', lambda x: None, queue_size=2)])
+    thread = threading.Thread(target=pipeline.run, args=(source(),))
+    thread.start()
+
+    # One item being handled, two waiting in the queue and one blocked being put
+    thread.join(0.5)
+    assert len(produced) == 4
+    assert pipeline.stages[0].depth == 2
+
+    release.set()
+    thread.join()
+    assert len(produced) == 10
+    assert pipeline.ingest.blocked > 0
+
+
+def test_pipeline_stage_failure():
+    def fail(x):
+        if x == 3:
+            raise ValueError('bad item')
+        return x
+
+    results = []
+    pipeline = Pipeline([Stage('fail', fail), Stage('sink', results.append)])
+
+    with pytest.raises(ValueError):
+        pipeline.run(itertools.count())
+
+    # Items still queued when a stage fails are dropped
+    assert results == [0, 1, 2][:len(results)]
+
+
+def test_stage_metrics_threaded():
+    metrics = StageMetrics(window=5000)
+    stop = threading.Event()
+
+    def record():
+        while not stop.is_set():
+            metrics.record(0.001)
+
+    thread = threading.Thread(target=record)
+    thread.start()
+    try:
+        for _ in range(200):
+            assert metrics.latency >= 0
+    finally:
+        stop.set()
+        thread.join()
+
+    assert metrics.count > 0
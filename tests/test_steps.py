@@ -0,0 +1,94 @@
+import json
+
+from contractor import steps
+
+
+class FakeNetwork(object):
+    def __init__(self):
+        self.waited_for = []
+
+    def wait_for_block(self, block_number):
+        self.waited_for.append(block_number)
+
+
+class FakeContract(object):
+    def __init__(self, address):
+        self.address = address
+
+
+class FakeDeployer(object):
+    def __init__(self):
+        self.contracts = {'DeadlineFirst': FakeContract('0x01'), 'DeadlineSecond': FakeContract('0x02')}
+
+
+CALLS = []
+
+
+class DeadlineFirst(steps.Step):
+    def deactivate(self, network, deployer):
+        CALLS.append('DeadlineFirst.deactivate')
+        return 150
+
+    def finalize_deactivate(self, network, deployer):
+        CALLS.append('DeadlineFirst.finalize_deactivate')
+
+
+class DeadlineSecond(steps.Step):
+    DEACTIVATE_DEPENDENCIES = {'DeadlineFirst'}
+
+    def deactivate(self, network, deployer):
+        CALLS.append('DeadlineSecond.deactivate')
+        return 120
+
+    def finalize_deactivate(self, network, deployer):
+        CALLS.append('DeadlineSecond.finalize_deactivate')
+
+
+def test_deactivate_waits_once_for_latest_deadline(tmpdir):
+    del CALLS[:]
+    network = FakeNetwork()
+    state_file = str(tmpdir.join('deactivation.json'))
+
+    steps.run(network, FakeDeployer(), to_deploy={'DeadlineFirst', 'DeadlineSecond'}, deactivate=True,
+              state_file=state_file)
+
+    assert network.waited_for == [150]
+    assert CALLS == ['DeadlineFirst.deactivate', 'DeadlineSecond.deactivate', 'DeadlineFirst.finalize_deactivate',
+                     'DeadlineSecond.finalize_deactivate']
+    assert not tmpdir.join('deactivation.json').exists()
+
+
+def test_deactivate_resumes_from_persisted_deadlines(tmpdir):
+    del CALLS[:]
+    network = FakeNetwork()
+    deployer = FakeDeployer()
+    state_file = tmpdir.join('deactivation.json')
+    state_file.write(json.dumps({
+        'contracts': {name: contract.address for name, contract in deployer.contracts.items()},
+        'deadlines': {'DeadlineFirst': 200},
+        'finalized': [],
+    }))
+
+    steps.run(network, deployer, to_deploy={'DeadlineFirst', 'DeadlineSecond'}, deactivate=True,
+              state_file=str(state_file))
+
+    assert network.waited_for == [200]
+    assert CALLS == ['DeadlineSecond.deactivate', 'DeadlineFirst.finalize_deactivate',
+                     'DeadlineSecond.finalize_deactivate']
+
+
+def test_deactivate_ignores_state_for_other_contracts(tmpdir):
+    del CALLS[:]
+    network = FakeNetwork()
+    state_file = tmpdir.join('deactivation.json')
+    state_file.write(json.dumps({
+        'contracts': {'DeadlineFirst': '0xff'},
+        'deadlines': {'DeadlineFirst': 200, 'DeadlineSecond': 300},
+        'finalized': ['DeadlineFirst', 'DeadlineSecond'],
+    }))
+
+    steps.run(network, FakeDeployer(), to_deploy={'DeadlineFirst', 'DeadlineSecond'}, deactivate=True,
+              state_file=str(state_file))
+
+    assert network.waited_for == [150]
+    assert len(CALLS) == 4
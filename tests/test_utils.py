@@ -1,10 +1,34 @@
 import io
 import os
+import stat
 
-from contractor.util import call_with_output
+from contractor.util import atomic_write, call_with_output, chunks
 
 
 def test_call_with_output():
     out = io.BytesIO()
     assert call_with_output(['echo', 'foo'], file=out) == 0
     assert out.getvalue() == b'foo' + os.linesep.encode('utf-8')
+
+
+def test_chunks():
+    assert list(chunks([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(chunks([1, 2], 5)) == [[1, 2]]
+    assert list(chunks([], 3)) == []
+
+
+def test_atomic_write_permissions(tmpdir):
+    umask = os.umask(0o022)
+    try:
+        path = str(tmpdir.join('new.json'))
+        atomic_write(path, 'foo')
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+
+        # Replaced files keep their permissions
+        os.chmod(path, 0o600)
+        atomic_write(path, 'bar')
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert open(path).read() == 'bar'
+        assert tmpdir.listdir() == [tmpdir.join('new.json')]
+    finally:
+        os.umask(umask)
@@ -0,0 +1,164 @@
+import threading
+
+from contractor.watch import BalanceTracker, RateMeter, Token, Watch, get_address_labels, get_bloom_masks
+
+
+def transfer(NectarToken, sender, receiver, amount=1):
+    NectarToken.functions.transfer(receiver.address, amount).transact({'from': sender.address})
+
+
+def test_fetch_headers_includes_missed_blocks(nectar_token):
+    network = nectar_token.network
+    NectarToken = nectar_token.NectarToken
+
+    watch = Watch(None, Token.NECTAR, verbosity=0)
+    watch.last_block = network.block_number()
+
+    for _ in range(3):
+        transfer(NectarToken, NectarToken.users[0], NectarToken.users[1])
+
+    latest = network.w3.eth.getBlock('latest')
+    headers = watch.fetch_headers(network, [latest.hash])
+    assert [header.number for header in headers] == list(range(watch.last_block + 1, latest.number + 1))
+
+    blocks = watch.fetch_blocks(network, [header.hash for header in headers])
+    assert all(block.transactions[0].to == NectarToken.address for block in blocks)
+
+
+def test_process_block(nectar_token):
+    network = nectar_token.network
+    deployer = nectar_token.deployer
+    NectarToken = nectar_token.NectarToken
+
+    transfer(NectarToken, NectarToken.users[0], NectarToken.users[1])
+
+    watch = Watch(None, Token.NECTAR, verbosity=0)
+    address_to_label = get_address_labels(network, deployer)
+    contract_map = {contract.address: contract for contract in deployer.contracts.values()}
+
+    latest = network.w3.eth.getBlock('latest')
+    for block in watch.fetch_blocks(network, [latest.hash]):
+        watch.process_block(network, deployer, block, address_to_label, contract_map)
+
+    sender = watch.prev_user_data[address_to_label[NectarToken.users[0].address]]
+    assert sender.function_calls == {'transfer': 1}
+    assert watch.last_block == latest.number
+
+
+def test_balance_tracker(nectar_token):
+    network = nectar_token.network
+    NectarToken = nectar_token.NectarToken
+    sender, receiver = NectarToken.users[:2]
+
+    tracker = BalanceTracker(network, NectarToken.contract, [sender.address, receiver.address])
+    start = network.block_number()
+    tracker.apply_block(network.w3.eth.getBlock(start, True))
+
+    transfer(NectarToken, sender, receiver, 10)
+    transfer(NectarToken, receiver, sender, 3)
+    network.w3.eth.sendTransaction({'from': sender.address, 'to': receiver.address, 'value': 10 ** 18})
+
+    latest = network.block_number()
+    for block_number in range(start + 1, latest + 1):
+        tracker.apply_block(network.w3.eth.getBlock(block_number, True))
+
+    assert tracker.nct_balances[receiver.address] == NectarToken.functions.balanceOf(receiver.address).call()
+    assert tracker.reconcile(latest) == 0
+
+
+def test_bloom_filter(nectar_token):
+    network = nectar_token.network
+    NectarToken = nectar_token.NectarToken
+    sender, receiver = NectarToken.users[:2]
+
+    watch = Watch(None, Token.NECTAR, verbosity=0)
+    watch.bloom_masks = get_bloom_masks(nectar_token.deployer)
+
+    transfer(NectarToken, sender, receiver)
+    assert watch.is_relevant(network.w3.eth.getBlock('latest'))
+
+    network.w3.eth.sendTransaction({'from': sender.address, 'to': receiver.address, 'value': 1})
+    assert not watch.is_relevant(network.w3.eth.getBlock('latest'))
+
+    # Plain transfers change Ether balances, so blocks are not skipped by default when watching Ether
+    watch = Watch(None, Token.ETHER, verbosity=0)
+    watch.bloom_masks = get_bloom_masks(nectar_token.deployer)
+    assert watch.is_relevant(network.w3.eth.getBlock('latest'))
+
+
+def test_bloom_filter_off_keeps_empty_blocks():
+    header = {'number': 1, 'transactions': [], 'logsBloom': b'\x00' * 256}
+
+    watch = Watch(None, Token.NECTAR, verbosity=0)
+    assert not watch.is_relevant(header)
+
+    # Without the bloom filter every block is inspected and rendered, including empty ones
+    watch = Watch(None, Token.NECTAR, verbosity=0, bloom_filter=False)
+    assert watch.is_relevant(header)
+
+
+def test_catch_up(nectar_token):
+    network = nectar_token.network
+    NectarToken = nectar_token.NectarToken
+    sender, receiver = NectarToken.users[:2]
+
+    start = network.block_number()
+    for _ in range(5):
+        transfer(NectarToken, sender, receiver, 2)
+    end = network.block_number()
+
+    watch = Watch(None, Token.NECTAR, verbosity=0)
+    assert watch.catch_up(network, nectar_token.deployer, start, end, jobs=2) == end
+
+    assert watch.last_block == end
+    assert watch.balances.nct_balances[receiver.address] == NectarToken.functions.balanceOf(receiver.address).call()
+
+
+def test_checkpoint(nectar_token, tmpdir):
+    network = nectar_token.network
+    deployer = nectar_token.deployer
+    NectarToken = nectar_token.NectarToken
+    sender, receiver = NectarToken.users[:2]
+    checkpoint_file = str(tmpdir.join('watch.json'))
+
+    start = network.block_number()
+    transfer(NectarToken, sender, receiver, 2)
+    middle = network.block_number()
+
+    watch = Watch(None, Token.NECTAR, verbosity=0, checkpoint_file=checkpoint_file)
+    watch.catch_up(network, deployer, start, middle)
+    watch.save_checkpoint(checkpoint_file)
+
+    transfer(NectarToken, sender, receiver, 3)
+    end = network.block_number()
+
+    resumed = Watch(None, Token.NECTAR, verbosity=0, checkpoint_file=checkpoint_file)
+    resumed.prepare(network, deployer)
+    assert resumed.load_checkpoint(checkpoint_file, network)
+    assert resumed.last_block == middle
+    assert resumed.balances.last_block == middle
+
+    resumed.catch_up(network, deployer, resumed.last_block + 1, end)
+    assert resumed.balances.nct_balances[receiver.address] == NectarToken.functions.balanceOf(receiver.address).call()
+    assert resumed.balances.reconcile(end) == 0
+
+
+def test_rate_meter_threaded():
+    meter = RateMeter()
+    stop = threading.Event()
+
+    def record():
+        while not stop.is_set():
+            meter.record()
+
+    # Blocks are recorded by the aggregate stage while the sink stage reports the rate
+    thread = threading.Thread(target=record)
+    thread.start()
+    try:
+        for _ in range(200):
+            assert meter.rate >= 0
+    finally:
+        stop.set()
+        thread.join()
+
+    assert meter.total > 0